@@ -1,15 +1,26 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, date
-import re
-import io
-import tempfile
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.drawing.image import Image as OpenPyXLImage
-from openpyxl.workbook.protection import WorkbookProtection
-import os
-import base64
+from packaging.version import Version
+from datetime import datetime
+import math
+import secrets
+import sqlite3
+
+from catalogo import obter_catalogo
+from validacao import (
+    formatar_cnpj, total_centavos, atualizar_texto_breve,
+    validar_dados_iniciais, validar_cobrancas_lote, mensagens_erro
+)
+from modelo import Medicao, formatar_centavos, valor_em_centavos
+from importacao import ler_planilha_cobrancas, importar_cobrancas, modelo_importacao_csv
+from grade import tabela_grade, aplicar_alteracoes_grade, configuracao_colunas_grade
+from tarefas import obter_fila_exportacao, FilaExportacaoCheia, NA_FILA, ERRO
+from colunar import gerar_colunar_bytes, FORMATO_COLUNAR_PADRAO, MIME_COLUNAR
+from fornecedores import obter_cadastro_fornecedores
+from historico import obter_historico_medicoes
+from rascunhos import (
+    obter_gravador_rascunhos, capturar_partes, codigo_valido, PARTES_RASCUNHO, ERROS_BACKEND
+)
 
 # ============================================================
 # CONFIGURAÇÃO INICIAL E ESTADOS
@@ -17,6 +28,13 @@ import base64
 
 def initialize_session_state():
     """Inicializa todos os estados da sessão"""
+    if 'rascunho_id' not in st.session_state:
+        # Sessão nova: retoma o rascunho do endereço (?rascunho=...) ou abre um novo
+        codigo = st.query_params.get("rascunho")
+        if not (codigo and retomar_rascunho(codigo)):
+            st.session_state.rascunho_id = secrets.token_urlsafe(9)
+            st.query_params["rascunho"] = st.session_state.rascunho_id
+    
     if 'is_dados_validado' not in st.session_state:
         st.session_state.is_dados_validado = False
     if 'is_revisao_concluida' not in st.session_state:
@@ -32,16 +50,92 @@ def initialize_session_state():
         st.session_state.dados_iniciais = {}
     if 'dados_coletados' not in st.session_state:
         st.session_state.dados_coletados = []
-    if 'dados_cobrancas_nao_validados' not in st.session_state:
-        st.session_state.dados_cobrancas_nao_validados = []
-    if 'frames_cobrancas_data' not in st.session_state:
-        st.session_state.frames_cobrancas_data = []
+    if 'fornecedor_sugerido' not in st.session_state:
+        st.session_state.fornecedor_sugerido = None
     
     if 'current_page' not in st.session_state:
         st.session_state.current_page = "inicio"
     
     if 'cobrancas' not in st.session_state:
         st.session_state.cobrancas = [{}]  # Lista de dicionários para cada cobrança
+    
+    if 'rascunho_estado' not in st.session_state:
+        st.session_state.rascunho_estado = {}  # Última versão entregue de cada parte do rascunho
+    if 'rascunho_pendentes' not in st.session_state:
+        st.session_state.rascunho_pendentes = set()  # Partes do rascunho ainda não lidas do backend
+
+def retomar_rascunho(codigo: str) -> bool:
+    """Retoma o rascunho gravado com o código (False se não existir)
+
+    Só o progresso é lido agora; as demais partes são lidas quando uma
+    página precisar delas (carregar_partes_rascunho).
+    """
+    if not codigo_valido(codigo):
+        return False
+    try:
+        progresso = obter_gravador_rascunhos().carregar(codigo, ['progresso']).get('progresso')
+    except ERROS_BACKEND:
+        progresso = None
+    if progresso is None:
+        return False
+    
+    limpar_widgets_cobrancas()
+    for chave in CHAVES_SESSAO_MEDICAO:
+        st.session_state.pop(chave, None)
+    invalidar_grade()
+    for chave, valor in progresso.items():
+        st.session_state[chave] = valor
+    st.session_state.rascunho_id = codigo
+    st.session_state.rascunho_estado = {'progresso': progresso}
+    st.session_state.rascunho_pendentes = set(PARTES_RASCUNHO) - {'progresso'}
+    st.query_params["rascunho"] = codigo
+    return True
+
+def carregar_partes_rascunho(pagina: str):
+    """Lê do rascunho as partes que a página usa e que ainda não estão na sessão"""
+    pendentes = st.session_state.rascunho_pendentes
+    partes = [parte for parte in PARTES_POR_PAGINA.get(pagina, ()) if parte in pendentes]
+    if not partes:
+        return
+    try:
+        valores = obter_gravador_rascunhos().carregar(st.session_state.rascunho_id, partes)
+    except ERROS_BACKEND:
+        # Sem as partes gravadas, a página mostraria (e depois gravaria) valores vazios
+        st.error("Não foi possível ler o rascunho desta medição. Recarregue a página para tentar novamente.")
+        st.stop()
+    
+    for parte in partes:
+        st.session_state.pop(parte, None)
+        if parte in valores:
+            st.session_state[parte] = valores[parte]
+        pendentes.discard(parte)
+    st.session_state.rascunho_estado.update(valores)
+    initialize_session_state()  # Partes nunca gravadas voltam ao valor inicial
+
+def avisar_falha_rascunho():
+    """Avisa que a última gravação de rascunhos falhou (as alterações seguem pendentes)"""
+    try:
+        erro = obter_gravador_rascunhos().ultimo_erro
+    except ERROS_BACKEND as e:
+        erro = e
+    if erro is not None:
+        st.warning(f"Há alterações aguardando gravação no rascunho: {erro}")
+
+def agendar_rascunho():
+    """Entrega as partes do estado que mudaram para gravação do rascunho em segundo plano"""
+    salvas = st.session_state.rascunho_estado
+    partes = [parte for parte in PARTES_RASCUNHO if parte not in st.session_state.rascunho_pendentes]
+    alteradas = {
+        parte: valor for parte, valor in capturar_partes(st.session_state, partes).items()
+        if salvas.get(parte) != valor
+    }
+    if not alteradas:
+        return
+    try:
+        obter_gravador_rascunhos().agendar(st.session_state.rascunho_id, alteradas)
+    except ERROS_BACKEND:
+        return
+    salvas.update(alteradas)
 
 # ============================================================
 # CONSTANTES E DICIONÁRIOS
@@ -60,233 +154,39 @@ SUCCESS_GREEN = "#28a745"
 WARNING_RED = "#dc3545"
 WARNING_RED_HOVER = "#c82333"
 
-# Dicionários de Mapeamento (De-Para)
-MAPA_TIPO_COBRANCA = {
-    "Consultorias": "CONS",
-    "Despesas": "DESP",
-    "Êxito": "EXITO",
-    "Honorários Advocatícios (Prolabore)": "HON",
-    "Parecer": "PARC",
-    "Perícia": "PERI",
-    "Publicações Legais": "PUB"
-}
-
-MAPA_MATERIA = {
-    "4819": "4819",
-    "Ambiental": "AMB",
-    "Cálculos Trabalhistas": "CALCTR",
-    "Cível": "CIV",
-    "Contratos": "CONT",
-    "Debêntures": "DEBS",
-    "Fundiário": "FND",
-    "Novos Negócios": "NNG",
-    "Regulatório": "REG",
-    "Publicações Legais": "PUBLEG",
-    "BPO": "BPO",
-    "Acompanhamento de Processos Judiciais": "ACPROC",
-    "Recorte Eletrônico dos diários oficiais": "REDO",
-    "Trabalhista": "TRB",
-    "Tributário": "TRI",
-    "Aduaneiro": "ADU",
-    "Levantamento de Processos": "LEVPROC",
-    "Societário": "SOC"
-}
-
-# Listas de valores
-MATERIAS_JURIDICAS = [
-    "4819", "Ambiental", "Cálculos Trabalhistas", "Cível", "Contratos",
-    "Debêntures", "Fundiário", "Novos Negócios", "Regulatório", 
-    "Publicações Legais", "BPO", "Acompanhamento de Processos Judiciais",
-    "Recorte Eletrônico dos diários oficiais", "Trabalhista", "Tributário",
-    "Aduaneiro", "Levantamento de Processos", "Societário"
-]
-
-TIPOS_COBRANCA = [
-    "Consultorias", "Despesas", "Êxito", "Honorários Advocatícios (Prolabore)",
-    "Parecer", "Perícia", "Publicações Legais"
-]
-
-# Dados dos projetos por empresa (ATUALIZADO - CAMPOS VAZIOS)
-PROJETOS_POR_EMPRESA = {
-    "Interligação Elétrica Aguapeí": {
-        "Projeto vinculado": ["IE Interligação Elétrica Aguapeí"],
-        "Trecho": {"IE Interligação Elétrica Aguapeí": [""]}
-    },
-    "Interligação Elétrica Biguaçu": {
-        "Projeto vinculado": ["IE Interligação Elétrica Biguaçu"],
-        "Trecho": {"IE Interligação Elétrica Biguaçu": [""]}
-    },
-    "Interligação Elétrica Evrecy": {
-        "Projeto vinculado": ["Minuano"],
-        "Trecho": {"Minuano": [""]}
-    },
-    "ISA ENERGIA BRASIL": {
-        "Projeto vinculado": ["Replan", "Fernão Dias", "Piraque", "Itatiaia", "Serra Dourada"],
-        "Trecho": {
-            "Replan": [""],
-            "Fernão Dias": [""],
-            "Piraque": [
-                "LT 500 kv JAIBA-JANAUBA6", "LT 500 Kv JANAUBA6-JANAUBA3",
-                "LT 500 kV JANAUBA6 -CAPELINHA 3", "LT 500 kV CAPELINHA 3 -GOVERNADOR VALADARES",
-                "LT 500 kV João Neiv 2 - Viana 2 C1", "LT 345 kV Viana 2 - Viana, C3",
-                "SE Janaúba 6", "SE Capelinha 3", "SE Jaíba", "SE Janaúba 3",
-                "SE Governador Valadares 6", "SE João Neiva 2", "SE Viana 2", "SE Viana"
-            ],
-            "Itatiaia": ["Governador Valadares 6 - Leopoldina 2", "Leopoldina 2 - Terminal Rio"],
-            "Serra Dourada": [
-                "SE BURITIRAMA", "SE BARRA II", "SE CORRENTINA", "SE ARINOS", "SE CAMPO FORMOSO",
-                "SE JUAZEIRO", "SE BOM JESUS DA LAPA", "SE RIO DAS ÉGUAS",
-                "LT 500 kV Buritirama -Barra II C1, CS", "LT 500 kV Barra II -Correntina C1, CS",
-                "LT 500 kV Correntina -Arinos 2 C1, CS", "LT 500 kV Juazeiro III -Campo Formoso II",
-                "LT 500kV Campo Formoso II Barra II C1 C2", "LT 500kV Bom Jesus da Lapa- Rio das Égua"
-            ]
-        }
-    },
-    "Interligação Elétrica Itaúnas": {
-        "Projeto vinculado": ["IE Interligação Elétrica Itaúnas"],
-        "Trecho": {"IE Interligação Elétrica Itaúnas": [""]}
-    },
-    "Interligação Elétrica Ivaí": {
-        "Projeto vinculado": ["IE Interligação Elétrica Ivaí"],
-        "Trecho": {
-            "IE Interligação Elétrica Ivaí": [
-                "ERB - LOTE 1", "ODI - SE Guaíra", "ODI - SE Sarandi", "ODI - SE Paranavaí Norte",
-                "ODI - SE Foz do Iguaçu", "ODI - SE Londrina", "ODI - LT Guaíra - Sarandi",
-                "ODI - LT Foz do Iguaçu - Guaíra", "ODI - LT Londrina - Sarandi",
-                "ODI - LT Sarandi - Paranavaí Norte", "ODI - Administração - Técnica",
-                "ODI - Adiantamento a Fornecedor"
-            ]
-        }
-    },
-    "Interligação Elétrica Jaguar 8": {
-        "Projeto vinculado": ["Água Azul"],
-        "Trecho": {"Água Azul": [""]}
-    },
-    "Interligação Elétrica Minas Gerais": {
-        "Projeto vinculado": ["IEMG", "Triângulo Mineiro"],
-        "Trecho": {"IEMG": [""], "Triângulo Mineiro": [""]}
-    },
-    "Interligação Elétrica Norte Nordeste": {
-        "Projeto vinculado": ["IENNE"],
-        "Trecho": {"IENNE": [""]}
-    },
-    "Interligação Elétrica Riacho Grande": {
-        "Projeto vinculado": ["IE Interligação Elétrica Riacho Grande"],
-        "Trecho": {"IE Interligação Elétrica Riacho Grande": [""]}
-    },
-    "Interligação Elétrica Sul": {
-        "Projeto vinculado": ["IESUL"],
-        "Trecho": {"IESUL": [""]}
-    },
-    "Interligação Elétrica Tibagi": {
-        "Projeto vinculado": ["IE Interligação Elétrica Tibagi"],
-        "Trecho": {"IE Interligação Elétrica Tibagi": [""]}
-    }
-}
-
-# Listas para comboboxes
-EMPRESAS = [
-    "ISA ENERGIA BRASIL", "Interligação Elétrica Evrecy", "Interligação Elétrica Minas Gerais",
-    "Interligação Elétrica Norte Nordeste", "Interligação Elétrica Pinheiros",
-    "Interligação Elétrica Sul", "Interligação Elétrica Serra Japi", "Interligação Elétrica Itaúnas",
-    "Interligação Elétrica Itapura", "Interligação Elétrica Aguapeí", "Interligação Elétrica Itaquerê",
-    "Interligação Elétrica Tibagi", "Interligação Elétrica Ivaí", "Interligação Elétrica Biguaçu",
-    "Interligação Elétrica Jaguar 6", "Interligação Elétrica Jaguar 8", "Interligação Elétrica Jaguar 9",
-    "Interligação Elétrica Riacho Grande",
-]
-
-ADVOGADOS = [
-    "Andrea Mazzaro Carlos de Vincenti", "Carlos Lopes", "Emerson Rodrigues do Nascimento",
-    "Eric Tadao Pagani Fukai", "Erica Barbeiro Travassos", "Francisco Ricardo Tavian",
-    "Gilvan Aparecido dos Santos", "Leonam Ricardo Alcantara Francisconi",
-    "Leonardo Lupercio Garcia Martins", "Leonardo Silva Merces", "Letticia Pinheiro de Oliveira Barros",
-    "Luciana Semenzato Garcia", "Marjorie Merida Chiesa", "Natalia Mendonca Goncalves",
-    "Pedro Henrique Ribeiro e Silva", "Ricardo de Oliveira Beninca", "Rita Halabian",
-]
-
-TIPOS_DOCUMENTO = ["Nota Fiscal", "Nota de Débito", "RPA (Recibo de Pagamento Autônomo)"]
-
-# ============================================================
-# FUNÇÕES DE APOIO
-# ============================================================
+# Acima deste número de erros, a validação mostra uma tabela em vez de um aviso por erro
+LIMITE_ERROS_LISTADOS = 20
 
-def filtrar_numeros(texto: str) -> str:
-    """Remove todos os caracteres não numéricos de uma string."""
-    return "".join(ch for ch in texto if ch.isdigit())
-
-def cnpj_valido(cnpj: str) -> bool:
-    """Verifica se o CNPJ é válido (simplificado)."""
-    if len(cnpj) != 14 or cnpj == cnpj[0] * 14:
-        return False
+# Paginação do detalhamento: só as cobranças da página atual têm widgets montados
+OPCOES_COBRANCAS_POR_PAGINA = [10, 25, 50, 100]
 
-    pesos1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
-    pesos2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+# Listas de projetos/trechos maiores que isto ganham um campo de busca e só
+# os melhores resultados vão para a caixa de seleção
+LIMITE_OPCOES_SEM_BUSCA = 10
 
-    # Cálculo do primeiro dígito verificador
-    soma = sum(int(cnpj[i]) * pesos1[i] for i in range(12))
-    resto = soma % 11
-    digito1 = 0 if resto < 2 else 11 - resto
-
-    # Cálculo do segundo dígito verificador
-    soma = sum(int(cnpj[i]) * pesos2[i] for i in range(13))
-    resto = soma % 11
-    digito2 = 0 if resto < 2 else 11 - resto
-
-    return cnpj[12] == str(digito1) and cnpj[13] == str(digito2)
-
-def formatar_cnpj(cnpj: str) -> str:
-    """Formata CNPJ para o padrão XX.XXX.XXX/XXXX-XX"""
-    cnpj_numeros = filtrar_numeros(cnpj)
-    if len(cnpj_numeros) != 14:
-        return cnpj_numeros
-    
-    return f"{cnpj_numeros[:2]}.{cnpj_numeros[2:5]}.{cnpj_numeros[5:8]}/{cnpj_numeros[8:12]}-{cnpj_numeros[12:14]}"
-
-def formatar_moeda(valor: str) -> str:
-    """Formata string de moeda para o padrão brasileiro"""
-    texto_puro = re.sub(r'[^0-9]', '', valor)
-    
-    if not texto_puro:
-        return ""
-    
-    if len(texto_puro) < 3:
-        texto_puro = '0' * (3 - len(texto_puro)) + texto_puro
+# Intervalo (segundos) entre as atualizações do andamento de uma exportação
+INTERVALO_ANDAMENTO_EXPORTACAO = 1.0
 
-    inteiro = texto_puro[:-2]
-    decimal = texto_puro[-2:]
+# A partir do Streamlit 1.52, data= do st.download_button aceita uma função,
+# chamada só no clique; nas versões anteriores o conteúdo é lido ao montar a página
+DOWNLOAD_SOB_DEMANDA = Version(st.__version__) >= Version("1.52.0")
 
-    if not inteiro: 
-        inteiro = "0"
+# Estado da sessão derivado da medição aberta (exportação, registros, paginação,
+# grade), descartado ao retomar outro rascunho na mesma sessão
+CHAVES_SESSAO_MEDICAO = (
+    'dados_cnpj', 'fornecedor_sugerido', 'exportacao_tarefa', 'fornecedor_registrado',
+    'historico_registrado', 'detalhamento_inicio', 'grade_tabela', 'grade_tabela_versao', 'grade_avisos'
+)
 
-    try:
-        inteiro_num = int(inteiro)
-        inteiro = str(inteiro_num)
-    except ValueError:
-        inteiro = "0"
-
-    inteiro_formatado = f"{int(inteiro):,}".replace(",", ".")
-    return f"{inteiro_formatado},{decimal}"
-
-def validar_contrato(contrato: str) -> bool:
-    """Valida o formato do contrato"""
-    if len(contrato) != 10:
-        return False
-    return True
-
-def validar_pedido(pedido: str) -> bool:
-    """Valida o formato do pedido"""
-    if len(pedido) != 10:
-        return False
-    return pedido.isdigit()
-
-def atualizar_texto_breve(tipo_cobranca: str, materia: str) -> str:
-    """Gera o texto breve baseado no tipo de cobrança e matéria"""
-    if not tipo_cobranca or not materia:
-        return "Aguardando seleção..."
-    
-    sigla_tipo = MAPA_TIPO_COBRANCA.get(tipo_cobranca, "TIPO?")
-    sigla_materia = MAPA_MATERIA.get(materia, "MAT?")
-    return f"{sigla_tipo}_{sigla_materia}"
+# Partes do rascunho que cada página usa; ao retomar um rascunho (inclusive
+# em outra réplica do app), cada parte só é lida quando uma página precisa dela
+PARTES_POR_PAGINA = {
+    "inicio": (),
+    "dados": ('dados_iniciais',),
+    "revisao": ('dados_iniciais',),
+    "detalhamento": ('dados_iniciais', 'cobrancas'),
+    "revisao_detalhada": ('dados_iniciais', 'dados_coletados'),
+}
 
 # ============================================================
 # FUNÇÕES DE NAVEGAÇÃO
@@ -332,37 +232,70 @@ def pagina_inicio():
     with col2:
         if st.button("Iniciar Lançamento", type="primary", use_container_width=True):
             navegar_para("dados")
+        
+        with st.expander("Retomar uma medição em andamento"):
+            st.caption(
+                f"Código deste rascunho: **{st.session_state.rascunho_id}**. O preenchimento é salvo "
+                "automaticamente; para continuar depois, guarde o código ou o endereço desta página."
+            )
+            st.text_input("Código do rascunho", key="codigo_rascunho")
+            st.button("Retomar", on_click=retomar_rascunho_digitado, use_container_width=True)
+            if st.session_state.pop('rascunho_nao_encontrado', False):
+                st.error("Rascunho não encontrado.")
+
+def retomar_rascunho_digitado():
+    """Retoma o rascunho cujo código foi digitado na página inicial"""
+    codigo = st.session_state.codigo_rascunho.strip()
+    if not (codigo and retomar_rascunho(codigo)):
+        st.session_state.rascunho_nao_encontrado = True
+
+def sugerir_fornecedor():
+    """Busca no cadastro de fornecedores o CNPJ digitado"""
+    try:
+        st.session_state.fornecedor_sugerido = obter_cadastro_fornecedores().buscar(st.session_state.dados_cnpj)
+    except sqlite3.Error:
+        st.session_state.fornecedor_sugerido = None
 
 def pagina_dados():
     """Página de dados iniciais"""
     st.header("Dados Iniciais - Faturamento")
+    catalogo = obter_catalogo()
+    
+    # CNPJ fora do formulário: ao sair do campo, os dados habituais do fornecedor são sugeridos
+    if 'dados_cnpj' not in st.session_state:
+        st.session_state.dados_cnpj = st.session_state.dados_iniciais.get('cnpj', '')
+    st.text_input("CNPJ do fornecedor*",
+                  key="dados_cnpj",
+                  on_change=sugerir_fornecedor,
+                  help="Digite o CNPJ no formato XX.XXX.XXX/XXXX-XX")
+    
+    padrao = dict(st.session_state.dados_iniciais)
+    fornecedor = st.session_state.fornecedor_sugerido
+    if fornecedor is not None:
+        padrao.update(empresa=fornecedor.empresa, advogado=fornecedor.advogado, tipo_doc=fornecedor.tipo_doc)
+        st.caption(
+            f"Fornecedor conhecido ({fornecedor.medicoes} medição(ões) registrada(s)): "
+            "empresa, advogado e tipo de documento preenchidos com os dados habituais."
+        )
     
-    with st.form("dados_iniciais"):
+    with st.form("form_dados_iniciais"):
         col1, col2 = st.columns(2)
         
         with col1:
-            # CNPJ
-            cnpj = st.text_input("CNPJ do fornecedor*", 
-                               value=st.session_state.dados_iniciais.get('cnpj', ''),
-                               help="Digite o CNPJ no formato XX.XXX.XXX/XXXX-XX")
-            
             # Empresa
             empresa = st.selectbox("Empresa contratante*", 
-                                 options=[""] + sorted(EMPRESAS),
-                                 index=0 if not st.session_state.dados_iniciais.get('empresa') 
-                                 else sorted(EMPRESAS).index(st.session_state.dados_iniciais.get('empresa')) + 1)
+                                 options=catalogo.empresas.valores,
+                                 index=catalogo.empresas.indice(padrao.get('empresa')))
             
             # Advogado
             advogado = st.selectbox("Advogado (a) responsável*", 
-                                  options=[""] + sorted(ADVOGADOS),
-                                  index=0 if not st.session_state.dados_iniciais.get('advogado')
-                                  else sorted(ADVOGADOS).index(st.session_state.dados_iniciais.get('advogado')) + 1)
+                                  options=catalogo.advogados.valores,
+                                  index=catalogo.advogados.indice(padrao.get('advogado')))
             
             # Tipo de documento
             tipo_doc = st.selectbox("Tipo de documento de cobrança*", 
-                                  options=[""] + TIPOS_DOCUMENTO,
-                                  index=0 if not st.session_state.dados_iniciais.get('tipo_doc')
-                                  else TIPOS_DOCUMENTO.index(st.session_state.dados_iniciais.get('tipo_doc')) + 1)
+                                  options=catalogo.tipos_documento.valores,
+                                  index=catalogo.tipos_documento.indice(padrao.get('tipo_doc')))
         
         with col2:
             # Data prevista
@@ -409,49 +342,21 @@ def pagina_dados():
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.form_submit_button("Validar Dados e Prosseguir para Revisão", type="primary", use_container_width=True):
-                # Validações
-                erros = []
-                
-                # CNPJ
-                cnpj_numeros = filtrar_numeros(cnpj)
-                if len(cnpj_numeros) == 0:
-                    erros.append("CNPJ é obrigatório")
-                elif len(cnpj_numeros) != 14:
-                    erros.append("CNPJ incompleto. Verifique o número digitado.")
-                elif not cnpj_valido(cnpj_numeros):
-                    erros.append("CNPJ inválido. Verifique o número digitado.")
-                
-                # Empresa
-                if not empresa:
-                    erros.append("Empresa contratante é obrigatória")
-                
-                # Advogado
-                if not advogado:
-                    erros.append("Advogado responsável é obrigatório")
-                
-                # Tipo documento
-                if not tipo_doc:
-                    erros.append("Tipo de documento é obrigatório")
-                
-                # Contrato
-                if existe_contrato == "Sim" and not n_contrato:
-                    erros.append("Nº do contrato é obrigatório quando 'Sim' é selecionado")
-                elif existe_contrato == "Sim" and not validar_contrato(n_contrato):
-                    erros.append("Nº do contrato deve ter 10 caracteres no formato correto")
+                cnpj = st.session_state.dados_cnpj
                 
-                # Pedido
-                if existe_pedido == "Sim" and not n_pedido:
-                    erros.append("Nº do pedido é obrigatório quando 'Sim' é selecionado")
-                elif existe_pedido == "Sim" and not validar_pedido(n_pedido):
-                    erros.append("Nº do pedido deve ter 10 caracteres numéricos")
-                
-                # Nº medição
-                if not n_medicao:
-                    erros.append("Nº medição é obrigatório")
-                
-                # Breve descrição
-                if not breve_desc:
-                    erros.append("Breve descrição é obrigatória")
+                # Validações
+                erros = validar_dados_iniciais({
+                    "cnpj": cnpj,
+                    "empresa": empresa,
+                    "advogado": advogado,
+                    "tipo_doc": tipo_doc,
+                    "existe_contrato": existe_contrato,
+                    "n_contrato": n_contrato,
+                    "existe_pedido": existe_pedido,
+                    "n_pedido": n_pedido,
+                    "n_medicao": n_medicao,
+                    "breve_desc": breve_desc
+                })
                 
                 if erros:
                     for erro in erros:
@@ -472,6 +377,7 @@ def pagina_dados():
                         "breve_desc": breve_desc
                     }
                     st.session_state.is_dados_validado = True
+                    st.session_state.fornecedor_sugerido = None
                     st.success("Dados validados com sucesso! Avançando para revisão...")
                     st.rerun()
 
@@ -526,6 +432,7 @@ def pagina_revisao():
         if st.button("Iniciar Detalhamento →", type="primary", use_container_width=True):
             st.session_state.is_revisao_concluida = True
             st.session_state.cobrancas = [{}]  # Inicializar lista de cobranças
+            st.session_state.rascunho_pendentes.discard('cobrancas')
             st.success("Revisão confirmada! Avançando para detalhamento...")
             st.rerun()
 
@@ -541,25 +448,37 @@ def pagina_detalhamento():
     if 'cobrancas' not in st.session_state:
         st.session_state.cobrancas = [{}]
     
-    # Formulário de cobranças
-    for i, cobranca in enumerate(st.session_state.cobrancas):
-        with st.expander(f"Cobrança {i+1}", expanded=True):
-            render_cobranca_form(i, cobranca)
+    render_importacao_cobrancas()
     
-    # Botões para gerenciar cobranças
-    col1, col2, col3 = st.columns([1, 1, 1])
-    with col1:
-        if st.button("+ Adicionar Nova Cobrança"):
-            st.session_state.cobrancas.append({})
-            st.rerun()
+    modo = st.radio(
+        "Modo de edição",
+        options=["Formulários", "Tabela"],
+        key="detalhamento_modo",
+        horizontal=True,
+        on_change=invalidar_grade
+    )
+    
+    if modo == "Tabela":
+        render_grade_fragment()
+    else:
+        # Formulário de cobranças (apenas a página atual; as demais ficam só como dados)
+        for i in render_paginacao_cobrancas(len(st.session_state.cobrancas)):
+            render_cobranca_fragment(i)
+        
+        # Botões para gerenciar cobranças
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            if st.button("+ Adicionar Nova Cobrança"):
+                st.session_state.cobrancas.append({})
+                st.session_state.detalhamento_inicio = len(st.session_state.cobrancas) - 1
+                st.rerun()
     
     # Botões de navegação
     st.markdown("---")
     col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
     
     with col1:
-        if st.button("Visualizar Resumo"):
-            mostrar_resumo_popup()
+        render_resumo_fragment()
     
     with col3:
         if st.button("← Voltar"):
@@ -572,10 +491,220 @@ def pagina_detalhamento():
                 st.success("Detalhamento validado com sucesso! Avançando para revisão detalhada...")
                 st.rerun()
 
+# Cada formulário e o resumo são fragments: editar uma cobrança reexecuta só o
+# seu formulário. Mudanças de estrutura (adicionar, remover, importar, paginar,
+# navegar) continuam usando st.rerun(), que reexecuta a página inteira.
+
+@st.fragment
+def render_cobranca_fragment(index):
+    """Formulário de uma cobrança, reexecutado isoladamente a cada interação"""
+    with st.expander(f"Cobrança {index+1}", expanded=True):
+        render_cobranca_form(index, st.session_state.cobrancas[index])
+    agendar_rascunho()
+
+@st.fragment
+def render_resumo_fragment():
+    """Botão de resumo com os dados fixos e o total atual das cobranças"""
+    if st.button("Visualizar Resumo"):
+        mostrar_resumo_popup()
+        
+        cobrancas = st.session_state.cobrancas
+        total = formatar_centavos(total_centavos(cobrancas))
+        st.info(f"**Cobranças:** {len(cobrancas)}  \n**Valor total:** R$ {total}")
+
+def invalidar_grade():
+    """Faz a grade ser remontada a partir de st.session_state.cobrancas na próxima execução"""
+    st.session_state.grade_versao = st.session_state.get('grade_versao', 0) + 1
+
+def aplicar_edicao_grade(chave: str):
+    """Callback da grade: aplica o diff da edição às cobranças e remonta a grade"""
+    cobrancas, avisos = aplicar_alteracoes_grade(st.session_state.cobrancas, st.session_state[chave])
+    st.session_state.cobrancas = cobrancas or [{}]
+    st.session_state.grade_avisos = avisos
+    # Chave nova: a grade é remontada com os textos breves recalculados e sem diff pendente
+    invalidar_grade()
+
+@st.fragment
+def render_grade_fragment():
+    """Modo tabela: todas as cobranças em uma grade editável (aceita colar várias linhas)"""
+    st.caption(
+        "Uma linha por cobrança. É possível colar linhas copiadas de uma planilha; "
+        "os Textos Breves são calculados automaticamente."
+    )
+    for aviso in st.session_state.pop('grade_avisos', []):
+        st.warning(aviso)
+    
+    versao = st.session_state.get('grade_versao', 0)
+    if st.session_state.get('grade_tabela_versao') != versao:
+        st.session_state.grade_tabela = tabela_grade(st.session_state.cobrancas)
+        st.session_state.grade_tabela_versao = versao
+    
+    chave = f"grade_cobrancas_{versao}"
+    st.data_editor(
+        st.session_state.grade_tabela,
+        key=chave,
+        num_rows="dynamic",
+        column_config=configuracao_colunas_grade(st.session_state.dados_iniciais.get('empresa', '')),
+        on_change=aplicar_edicao_grade,
+        args=(chave,)
+    )
+    agendar_rascunho()
+
+def render_paginacao_cobrancas(total: int) -> range:
+    """Controles de paginação do detalhamento; devolve os índices das cobranças da página atual"""
+    if total <= OPCOES_COBRANCAS_POR_PAGINA[0]:
+        st.session_state.detalhamento_inicio = 0
+        return range(total)
+    
+    col1, col2, col3 = st.columns([1, 1, 1], vertical_alignment="bottom")
+    
+    with col1:
+        tamanho = st.selectbox(
+            "Cobranças por página",
+            options=OPCOES_COBRANCAS_POR_PAGINA,
+            key="detalhamento_tamanho_pagina"
+        )
+    
+    # A página é derivada da primeira cobrança visível, que se mantém ao trocar o tamanho
+    n_paginas = math.ceil(total / tamanho)
+    pagina = min(st.session_state.get('detalhamento_inicio', 0) // tamanho, n_paginas - 1)
+    inicio = pagina * tamanho
+    fim = min(inicio + tamanho, total)
+    
+    with col2:
+        destino = st.number_input(
+            "Ir para a cobrança nº",
+            min_value=1,
+            max_value=total,
+            value=inicio + 1,
+            step=1
+        )
+    
+    with col3:
+        if st.button("Ir", key="detalhamento_ir"):
+            st.session_state.detalhamento_inicio = int(destino) - 1
+            st.rerun()
+    
+    col1, col2, col3 = st.columns([1, 2, 1], vertical_alignment="center")
+    
+    with col1:
+        if st.button("← Anterior", key="detalhamento_anterior", disabled=pagina == 0):
+            st.session_state.detalhamento_inicio = inicio - tamanho
+            st.rerun()
+    
+    with col2:
+        st.markdown(
+            f"Página **{pagina + 1}** de **{n_paginas}** — cobranças {inicio + 1} a {fim} de {total}"
+        )
+    
+    with col3:
+        if st.button("Próxima →", key="detalhamento_proxima", disabled=pagina == n_paginas - 1):
+            st.session_state.detalhamento_inicio = fim
+            st.rerun()
+    
+    return range(inicio, fim)
+
+def limpar_widgets_cobrancas():
+    """Descarta o estado dos widgets das cobranças para que os formulários releiam os dados"""
+    for chave in [k for k in st.session_state.keys() if k.startswith("cobranca_")]:
+        del st.session_state[chave]
+
+def render_importacao_cobrancas():
+    """Importa as cobranças de uma planilha CSV/XLSX de uma só vez"""
+    if st.session_state.get('importacao_concluida'):
+        st.success(f"{st.session_state.pop('importacao_concluida')} cobrança(s) importada(s) com sucesso.")
+    
+    with st.expander("Importar cobranças de planilha (CSV/XLSX)", expanded=False):
+        st.write(
+            "Uma linha por cobrança. Colunas aceitas: n_espaider, materia, projeto, trecho, "
+            "tipo_1, valor_1, tipo_2, valor_2 (ou os rótulos do formulário). "
+            "O Texto Breve é gerado automaticamente."
+        )
+        st.download_button(
+            label="Baixar modelo (CSV)",
+            data=modelo_importacao_csv(),
+            file_name="modelo_importacao_cobrancas.csv",
+            mime="text/csv"
+        )
+        
+        arquivo = st.file_uploader("Planilha de cobranças", type=["csv", "xlsx"], key="importacao_arquivo")
+        modo = st.radio(
+            "Cobranças já preenchidas",
+            options=["Substituir", "Acrescentar"],
+            key="importacao_modo",
+            horizontal=True
+        )
+        
+        if arquivo is not None and st.button("Importar cobranças"):
+            try:
+                registros = ler_planilha_cobrancas(arquivo.getvalue(), arquivo.name)
+            except Exception as e:
+                st.error(f"Não foi possível ler a planilha: {e}")
+                return
+            
+            if not registros:
+                st.error("A planilha não contém cobranças.")
+                return
+            
+            empresa = st.session_state.dados_iniciais.get('empresa', '')
+            cobrancas, erros = importar_cobrancas(registros, empresa)
+            
+            if erros:
+                # Linha 1 da planilha é o cabeçalho
+                st.error(f"Nenhuma cobrança importada: {len(erros)} erro(s) na planilha.")
+                st.dataframe(
+                    pd.DataFrame([{"Linha": numero + 1, "Erro": erro} for numero, erro in erros]),
+                    hide_index=True
+                )
+                return
+            
+            # Mantém as cobranças atuais só se houver alguma preenchida
+            atuais = [c for c in st.session_state.cobrancas if c.get('tipo_1') or c.get('materia')]
+            if modo == "Acrescentar":
+                cobrancas = atuais + cobrancas
+            
+            limpar_widgets_cobrancas()
+            invalidar_grade()
+            st.session_state.cobrancas = cobrancas
+            st.session_state.detalhamento_inicio = 0
+            st.session_state.importacao_concluida = len(registros)
+            st.rerun()
+
+def selectbox_com_busca(rotulo: str, opcoes, indice, valor_atual, key: str):
+    """Caixa de seleção que, em listas longas, mostra só os resultados de uma busca
+
+    O valor já escolhido continua entre as opções mesmo fora dos resultados.
+    """
+    if len(opcoes.valores) <= LIMITE_OPCOES_SEM_BUSCA:
+        return st.selectbox(rotulo, options=opcoes.valores, key=key, index=opcoes.indice(valor_atual))
+
+    consulta = st.text_input(
+        f"Buscar {rotulo.rstrip('*').lower()}",
+        key=f"{key}_busca",
+        placeholder="Digite parte do nome e tecle Enter"
+    )
+    resultados = indice.buscar(consulta)
+    if not resultados:
+        st.caption(f"Nenhum resultado para \"{consulta}\"")
+
+    valor_atual = st.session_state.get(key, valor_atual)
+    if valor_atual in opcoes and valor_atual not in resultados:
+        resultados.insert(0, valor_atual)
+    if not resultados:
+        resultados = [opcoes.valores[0]]
+
+    return st.selectbox(
+        rotulo,
+        options=resultados,
+        key=key,
+        index=resultados.index(valor_atual) if valor_atual in resultados else 0
+    )
+
 def render_cobranca_form(index, cobranca_data):
     """Renderiza o formulário para uma cobrança específica"""
     # Chaves para session_state
     prefix = f"cobranca_{index}"
+    catalogo = obter_catalogo()
     
     col1, col2 = st.columns(2)
     
@@ -602,9 +731,9 @@ def render_cobranca_form(index, cobranca_data):
         # Matéria
         materia = st.selectbox(
             "Matéria*",
-            options=[""] + MATERIAS_JURIDICAS,
+            options=catalogo.materias.valores,
             key=f"{prefix}_materia",
-            index=0 if not cobranca_data.get('materia') else MATERIAS_JURIDICAS.index(cobranca_data.get('materia')) + 1
+            index=catalogo.materias.indice(cobranca_data.get('materia'))
         )
     
     with col2:
@@ -620,19 +749,20 @@ def render_cobranca_form(index, cobranca_data):
         # Projeto e Trecho (condicionais)
         if possui_projeto == "Sim":
             empresa = st.session_state.dados_iniciais.get('empresa', '')
-            projetos = PROJETOS_POR_EMPRESA.get(empresa, {}).get("Projeto vinculado", [""])
-            
-            projeto = st.selectbox(
+            projeto = selectbox_com_busca(
                 "Projeto vinculado*",
-                options=projetos,
+                catalogo.projetos(empresa),
+                catalogo.busca_projeto(empresa),
+                cobranca_data.get('projeto'),
                 key=f"{prefix}_projeto"
             )
             
             if projeto:
-                trechos = PROJETOS_POR_EMPRESA[empresa]["Trecho"].get(projeto, [""])
-                trecho = st.selectbox(
+                trecho = selectbox_com_busca(
                     "Trecho",
-                    options=trechos,
+                    catalogo.trechos(empresa, projeto),
+                    catalogo.busca_trecho(empresa, projeto),
+                    cobranca_data.get('trecho'),
                     key=f"{prefix}_trecho"
                 )
             else:
@@ -660,9 +790,9 @@ def render_cobranca_form(index, cobranca_data):
     with col1:
         tipo_1 = st.selectbox(
             "Tipo de cobrança*",
-            options=[""] + TIPOS_COBRANCA,
+            options=catalogo.tipos_cobranca.valores,
             key=f"{prefix}_tipo_1",
-            index=0 if not cobranca_data.get('tipo_1') else TIPOS_COBRANCA.index(cobranca_data.get('tipo_1')) + 1
+            index=catalogo.tipos_cobranca.indice(cobranca_data.get('tipo_1'))
         )
     
     with col2:
@@ -700,9 +830,9 @@ def render_cobranca_form(index, cobranca_data):
         with col1:
             tipo_2 = st.selectbox(
                 "Tipo de cobrança*",
-                options=[""] + TIPOS_COBRANCA,
+                options=catalogo.tipos_cobranca.valores,
                 key=f"{prefix}_tipo_2",
-                index=0 if not cobranca_data.get('tipo_2') else TIPOS_COBRANCA.index(cobranca_data.get('tipo_2')) + 1
+                index=catalogo.tipos_cobranca.indice(cobranca_data.get('tipo_2'))
             )
         
         with col2:
@@ -733,6 +863,8 @@ def render_cobranca_form(index, cobranca_data):
     if index > 0:
         if st.button(f"Remover Cobrança {index+1}", type="secondary"):
             st.session_state.cobrancas.pop(index)
+            # As chaves dos widgets são por posição: sem isso, as cobranças seguintes herdariam valores
+            limpar_widgets_cobrancas()
             st.rerun()
     
     # Atualizar dados da cobrança com os valores CORRETOS do texto breve
@@ -754,93 +886,38 @@ def render_cobranca_form(index, cobranca_data):
         'mais_cobrancas': mais_cobrancas,
         'tipo_1': current_tipo_1,
         'valor_1': valor_1,
+        'centavos_1': valor_em_centavos(valor_1),
         'texto_1': texto_breve_1_save,
         'tipo_2': current_tipo_2 if mais_cobrancas == "Sim" else "",
         'valor_2': valor_2 if mais_cobrancas == "Sim" else "",
+        'centavos_2': valor_em_centavos(valor_2) if mais_cobrancas == "Sim" else 0,
         'texto_2': texto_breve_2_save if mais_cobrancas == "Sim" else ""
     }
     
     st.session_state.cobrancas[index] = cobranca_atualizada
 def validar_detalhamento() -> bool:
     """Valida todo o detalhamento das cobranças"""
-    erros = []
-    
-    for i, cobranca in enumerate(st.session_state.cobrancas):
-        num = i + 1
-        
-        # Validar Nº Espaider se necessário
-        if cobranca.get('possui_espaider') == "Sim" and not cobranca.get('n_espaider'):
-            erros.append(f"Cobrança {num}: Nº Espaider é obrigatório quando 'Sim' é selecionado")
-        
-        # Validar projeto se necessário
-        if cobranca.get('possui_projeto') == "Sim" and not cobranca.get('projeto'):
-            erros.append(f"Cobrança {num}: Projeto vinculado é obrigatório quando 'Sim' é selecionado")
-        
-        # Validar matéria
-        if not cobranca.get('materia'):
-            erros.append(f"Cobrança {num}: Matéria é obrigatória")
-        
-        # Validar cobrança principal
-        if not cobranca.get('tipo_1'):
-            erros.append(f"Cobrança {num}: Tipo de cobrança (principal) é obrigatório")
-        
-        # Validar valor principal
-        valor_1_limpo = re.sub(r'[^0-9]', '', cobranca.get('valor_1', ''))
-        if not valor_1_limpo or int(valor_1_limpo) == 0:
-            erros.append(f"Cobrança {num}: Valor (principal) deve ser maior que zero")
-        
-        # Validar texto breve principal
-        if cobranca.get('texto_1') == "Aguardando seleção..." or not cobranca.get('texto_1'):
-            erros.append(f"Cobrança {num}: Texto Breve não foi gerado automaticamente")
-        
-        # Validar cobrança secundária se necessário
-        if cobranca.get('mais_cobrancas') == "Sim":
-            if not cobranca.get('tipo_2'):
-                erros.append(f"Cobrança {num}: Tipo de cobrança (secundário) é obrigatório")
-            
-            valor_2_limpo = re.sub(r'[^0-9]', '', cobranca.get('valor_2', ''))
-            if not valor_2_limpo or int(valor_2_limpo) == 0:
-                erros.append(f"Cobrança {num}: Valor (secundário) deve ser maior que zero")
-            
-            if cobranca.get('texto_2') == "Aguardando seleção..." or not cobranca.get('texto_2'):
-                erros.append(f"Cobrança {num}: Texto Breve (secundário) não foi gerado automaticamente")
+    # Com a empresa, confere também os cadastros (na grade, o par projeto/trecho não é restrito)
+    erros, dados_coletados = validar_cobrancas_lote(
+        st.session_state.cobrancas, st.session_state.dados_iniciais.get('empresa', '')
+    )
     
-    if erros:
-        for erro in erros:
-            st.error(erro)
+    if not erros.empty:
+        if len(erros) > LIMITE_ERROS_LISTADOS:
+            st.error(f"{len(erros)} erros encontrados no detalhamento:")
+            st.dataframe(
+                erros.rename(columns={'cobranca': "Cobrança", 'campo': "Campo", 'erro': "Erro"}),
+                hide_index=True
+            )
+        else:
+            for erro in mensagens_erro(erros):
+                st.error(erro)
         return False
     
     # Coletar dados validados
-    st.session_state.dados_coletados = []
-    for i, cobranca in enumerate(st.session_state.cobrancas):
-        dados_cobranca = {
-            'num_cobranca': i + 1,
-            'Possui Nº Espaider?': cobranca.get('possui_espaider'),
-            'Nº Espaider': cobranca.get('n_espaider', ''),
-            'Possui projeto vinculado?': cobranca.get('possui_projeto'),
-            'Projeto vinculado': cobranca.get('projeto', ''),
-            'Trecho': cobranca.get('trecho', ''),
-            'Matéria': cobranca.get('materia'),
-            'sim_nao': cobranca.get('mais_cobrancas'),
-            'bloco_1': {
-                "tipo": cobranca.get('tipo_1'),
-                "materia": cobranca.get('materia'),
-                "valor": cobranca.get('valor_1'),
-                "texto_breve": cobranca.get('texto_1')
-            }
-        }
-        
-        if cobranca.get('mais_cobrancas') == "Sim":
-            dados_cobranca['bloco_2'] = {
-                "tipo": cobranca.get('tipo_2'),
-                "materia": cobranca.get('materia'),
-                "valor": cobranca.get('valor_2'),
-                "texto_breve": cobranca.get('texto_2')
-            }
-        
-        st.session_state.dados_coletados.append(dados_cobranca)
-    
-    st.session_state.dados_cobrancas_nao_validados = st.session_state.dados_coletados.copy()
+    st.session_state.dados_coletados = dados_coletados
+    st.session_state.rascunho_pendentes.discard('dados_coletados')
+    st.session_state.pop('exportacao_tarefa', None)
     return True
 
 def mostrar_resumo_popup():
@@ -929,33 +1006,33 @@ def pagina_revisao_detalhada():
             col1, col2 = st.columns(2)
             
             with col1:
-                st.write(f"**Nº Espaider:** {cobranca.get('Nº Espaider', 'Não informado')}")
-                st.write(f"**Projeto vinculado:** {cobranca.get('Projeto vinculado', 'Não informado')}")
-                st.write(f"**Trecho:** {cobranca.get('Trecho', 'Não informado')}")
+                st.write(f"**Nº Espaider:** {cobranca.n_espaider}")
+                st.write(f"**Projeto vinculado:** {cobranca.projeto}")
+                st.write(f"**Trecho:** {cobranca.trecho}")
             
             with col2:
-                st.write(f"**Matéria:** {cobranca.get('Matéria', 'N/A')}")
+                st.write(f"**Matéria:** {cobranca.materia}")
             
             st.markdown("---")
             
             # Cobrança Principal
-            bloco_1 = cobranca.get('bloco_1', {})
+            bloco_1 = cobranca.bloco_1
             col1, col2 = st.columns(2)
             
             with col1:
                 st.subheader("Cobrança Principal")
-                st.write(f"**Tipo:** {bloco_1.get('tipo', 'N/A')}")
-                st.write(f"**Valor:** R$ {bloco_1.get('valor', '0,00')}")
-                st.write(f"**Texto Breve:** {bloco_1.get('texto_breve', 'N/A')}")
+                st.write(f"**Tipo:** {bloco_1.tipo}")
+                st.write(f"**Valor:** R$ {bloco_1.valor}")
+                st.write(f"**Texto Breve:** {bloco_1.texto_breve}")
             
             # Cobrança Secundária se existir
-            if 'bloco_2' in cobranca:
-                bloco_2 = cobranca.get('bloco_2', {})
+            bloco_2 = cobranca.bloco_2
+            if bloco_2 is not None:
                 with col2:
                     st.subheader("Cobrança Secundária")
-                    st.write(f"**Tipo:** {bloco_2.get('tipo', 'N/A')}")
-                    st.write(f"**Valor:** R$ {bloco_2.get('valor', '0,00')}")
-                    st.write(f"**Texto Breve:** {bloco_2.get('texto_breve', 'N/A')}")
+                    st.write(f"**Tipo:** {bloco_2.tipo}")
+                    st.write(f"**Valor:** R$ {bloco_2.valor}")
+                    st.write(f"**Texto Breve:** {bloco_2.texto_breve}")
     
     # Botões de ação
     col1, col2, col3 = st.columns([1, 1, 1])
@@ -967,388 +1044,146 @@ def pagina_revisao_detalhada():
     with col3:
         if st.button("FINALIZAR E GERAR EXCEL", type="primary", use_container_width=True):
             finalizar_processo()
+    
+    render_exportacao()
 
 # ============================================================
 # FUNÇÕES DE EXPORTAÇÃO EXCEL
 # ============================================================
 
-def formatar_valor_excel(valor_str):
-    """Formata valor para Excel"""
-    if not valor_str: 
-        valor_str = "0,00"
-    valor_limpo = re.sub(r'[^0-9,]', '', valor_str).replace(',', '.')
-    try:
-        return float(valor_limpo)
-    except ValueError:
-        return 0.0
-
-def gerar_excel():
-    """Gera arquivo Excel com todos os dados"""
+def gerar_excel() -> bool:
+    """Envia a medição para a fila de exportação e guarda a tarefa na sessão (False se o envio falhou)"""
     if not st.session_state.dados_iniciais or not st.session_state.dados_coletados:
         st.error("Não há dados de cobranças para gerar o arquivo Excel.")
-        return None
+        return False
     
     try:
-        workbook = Workbook()
-        
-        # Planilha principal
-        sheet_principal = workbook.active
-        sheet_principal.title = "Medições"
-        formatar_planilha_principal(sheet_principal)
-        
-        # Planilha BD
-        sheet_bd = workbook.create_sheet(title="BD")
-        formatar_planilha_bd(sheet_bd)
-        
-        workbook.active = sheet_principal
-        
-        # Proteção das planilhas
-        sheet_principal.protection.password = 'SINAPSE4'
-        sheet_principal.protection.sheet = True
-        
-        sheet_bd.protection.password = 'SINAPSE4'
-        sheet_bd.protection.sheet = True
-        sheet_bd.protection.autoFilter = False
-        sheet_bd.sheet_state = 'hidden'
-        
-        workbook.security = WorkbookProtection(
-            workbookPassword='SINAPSE4',
-            lockStructure=True
-        )
-        
-        # Salvar para buffer
-        buffer = io.BytesIO()
-        workbook.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
-    
+        medicao = Medicao.de_sessao(st.session_state.dados_iniciais, st.session_state.dados_coletados)
+        tarefa = obter_fila_exportacao().enviar(medicao)
+    except FilaExportacaoCheia:
+        st.warning("Há muitas exportações em andamento. Tente novamente em alguns instantes.")
+        return False
     except Exception as e:
         st.error(f"Erro ao gerar Excel: {e}")
-        return None
-
-def formatar_planilha_principal(sheet):
-    """Formata a planilha principal"""
-    font_header_azul = Font(name='Segoe UI', size=11, bold=True, color="FFFFFF")
-    fill_header_azul = PatternFill(start_color="002060", end_color="002060", fill_type="solid")
-    font_bold = Font(name='Segoe UI', size=10, bold=True)
-    font_normal = Font(name='Segoe UI', size=10)
-    
-    alignment_left = Alignment(horizontal='left', vertical='center', wrap_text=True)
-    alignment_right = Alignment(horizontal='right', vertical='center', wrap_text=True)
-    alignment_center = Alignment(horizontal='center', vertical='center')
-    thin_border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
-    )
-    
-    sheet.sheet_view.showGridLines = False
-    
-    # Logo (placeholder)
-    sheet['B2'] = "ISA Energia"
-    sheet['B2'].font = Font(name='Segoe UI', size=14, bold=True)
-    
-    # Cabeçalho
-    sheet.merge_cells('D2:G2')
-    cell_med_juridica = sheet['D2']
-    n_medicao_header = st.session_state.dados_iniciais.get('n_medicao', 'N/A')
-    cell_med_juridica.value = f"Medição Jurídica Nº {n_medicao_header}"
-    cell_med_juridica.font = Font(name='Segoe UI', size=16, bold=True)
-    cell_med_juridica.alignment = alignment_center
-    
-    # Data
-    cell_data_header = sheet['G4']
-    cell_data_header.value = f"Data: {date.today().strftime('%d/%m/%Y')}"
-    cell_data_header.font = font_normal
-    cell_data_header.alignment = alignment_right
-    
-    # Dados Iniciais
-    sheet.merge_cells('B5:G5')
-    header_cell = sheet['B5']
-    header_cell.value = "Dados Iniciais - Faturamento"
-    header_cell.font = font_header_azul
-    header_cell.fill = fill_header_azul
-    header_cell.alignment = alignment_center
-    
-    for col_idx in range(2, 8):
-        sheet.cell(row=5, column=col_idx).border = thin_border
-    
-    # Preencher dados iniciais
-    dados = st.session_state.dados_iniciais
-    dados_esquerda = [
-        ("CNPJ do fornecedor:", dados['cnpj']),
-        ("Empresa contratante:", dados['empresa']),
-        ("Advogado responsável:", dados['advogado']),
-        ("Tipo de documento de cobrança:", dados['tipo_doc']),
-    ]
-    
-    current_row = 7
-    for label, value in dados_esquerda:
-        cell_label = sheet.cell(row=current_row, column=2)
-        cell_label.value = label
-        cell_label.font = font_bold
-        cell_label.alignment = alignment_right
-        
-        sheet.merge_cells(f'C{current_row}:D{current_row}')
-        cell_value = sheet.cell(row=current_row, column=3)
-        cell_value.value = str(value) if value else ""
-        cell_value.font = font_normal
-        cell_value.alignment = alignment_left
-        current_row += 1
-    
-    dados_direita = [
-        ("Data prevista de emissão:", dados['data_prevista'].strftime('%d/%m/%Y')),
-        ("Nº Contrato:", dados.get('n_contrato') if dados.get('existe_contrato') == "Sim" else "N/A"),
-        ("Nº Pedido:", dados.get('n_pedido') if dados.get('existe_pedido') == "Sim" else "N/A")
-    ]
-    
-    current_row = 7
-    for label, value in dados_direita:
-        cell_label = sheet.cell(row=current_row, column=5)
-        cell_label.value = label
-        cell_label.font = font_bold
-        cell_label.alignment = alignment_right
-        
-        sheet.merge_cells(f'F{current_row}:G{current_row}')
-        cell_value = sheet.cell(row=current_row, column=6)
-        cell_value.value = str(value) if value else ""
-        cell_value.font = font_normal
-        cell_value.alignment = alignment_left
-        current_row += 1
-    
-    # Detalhamento das cobranças
-    current_row = 13
-    
-    sheet.merge_cells(f'B{current_row}:G{current_row}')
-    header_cell_det = sheet.cell(row=current_row, column=2)
-    header_cell_det.value = "Detalhamento das cobranças"
-    header_cell_det.font = font_header_azul
-    header_cell_det.fill = fill_header_azul
-    header_cell_det.alignment = alignment_center
-    
-    current_row += 1
-    
-    # Cabeçalho da tabela de cobranças
-    col_titles = {
-        2: "Nº Espaider",
-        3: "Projeto vinculado",
-        4: "Trecho",
-        5: "Tipo de Cobrança",
-        6: "Matéria",
-        7: "Valor",
-        8: "Texto breve código serviço"
-    }
-    
-    for col_idx, title in col_titles.items():
-        cell = sheet.cell(row=current_row, column=col_idx)
-        cell.value = title
-        cell.font = font_header_azul
-        cell.fill = fill_header_azul
-        cell.border = thin_border
-    
-    # Dados das cobranças
-    valor_total = 0.0
-    
-    for dados_cobranca in st.session_state.dados_coletados:
-        bloco_1 = dados_cobranca.get('bloco_1', {})
-        valor_bloco_1 = formatar_valor_excel(bloco_1.get("valor"))
-        valor_total += valor_bloco_1
-        
-        current_row += 1
-        dados_linha = {
-            2: dados_cobranca.get("Nº Espaider", "N/A"),
-            3: dados_cobranca.get("Projeto vinculado", "N/A"),
-            4: dados_cobranca.get("Trecho", "N/A"),
-            5: bloco_1.get("tipo"),
-            6: bloco_1.get("materia"),
-            7: valor_bloco_1,
-            8: bloco_1.get("texto_breve")
-        }
-        
-        for col_idx in range(2, 9):
-            cell = sheet.cell(row=current_row, column=col_idx)
-            cell.value = dados_linha.get(col_idx)
-            cell.font = font_normal
-            cell.border = thin_border
-            cell.alignment = alignment_left
-            
-            if col_idx == 7:
-                cell.number_format = 'R$ #,##0.00'
-        
-        # Cobrança secundária
-        if 'bloco_2' in dados_cobranca:
-            bloco_2 = dados_cobranca['bloco_2']
-            valor_bloco_2 = formatar_valor_excel(bloco_2.get("valor"))
-            valor_total += valor_bloco_2
-            
-            current_row += 1
-            dados_linha = {
-                2: dados_cobranca.get("Nº Espaider", "N/A"),
-                3: dados_cobranca.get("Projeto vinculado", "N/A"),
-                4: dados_cobranca.get("Trecho", "N/A"),
-                5: bloco_2.get("tipo"),
-                6: bloco_2.get("materia"),
-                7: valor_bloco_2,
-                8: bloco_2.get("texto_breve")
-            }
-            
-            for col_idx in range(2, 9):
-                cell = sheet.cell(row=current_row, column=col_idx)
-                cell.value = dados_linha.get(col_idx)
-                cell.font = font_normal
-                cell.border = thin_border
-                cell.alignment = alignment_left
-                if col_idx == 7:
-                    cell.number_format = 'R$ #,##0.00'
-    
-    # Total
-    current_row += 1
-    
-    sheet.merge_cells(f'B{current_row}:E{current_row}')
-    cell_total_label = sheet.cell(row=current_row, column=2)
-    cell_total_label.value = "Valor total da cobrança"
-    cell_total_label.font = font_bold
-    cell_total_label.alignment = alignment_right
-    
-    cell_total_valor = sheet.cell(row=current_row, column=7)
-    cell_total_valor.value = valor_total
-    cell_total_valor.number_format = 'R$ #,##0.00'
-    cell_total_valor.font = font_bold
-    cell_total_valor.border = thin_border
-    
-    # Ajustar largura das colunas
-    sheet.column_dimensions['A'].width = 2
-    
-    for col_idx in range(2, 9):
-        column_letter = openpyxl.utils.get_column_letter(col_idx)
-        max_length = 0
-        
-        for cell in sheet[column_letter]:
-            if cell.value:
-                try:
-                    cell_length = len(str(cell.value)) + 2
-                    if cell_length > max_length:
-                        max_length = cell_length
-                except:
-                    pass
-        
-        adjusted_width = max(15, min(max_length, 50))
-        
-        if column_letter in ['C', 'D', 'E', 'F']:
-            adjusted_width = max(25, min(max_length, 40))
-        if column_letter == 'B':
-            adjusted_width = max(20, min(max_length, 30))
-        if column_letter == 'G':
-            adjusted_width = 15
-        if column_letter == 'H':
-            adjusted_width = 25
-        
-        sheet.column_dimensions[column_letter].width = adjusted_width
+        return False
+    st.session_state.exportacao_tarefa = tarefa.id
+    return True
 
-def formatar_planilha_bd(sheet):
-    """Formata a planilha BD"""
-    header_iniciais = [
-        "CNPJ Fornecedor", "Empresa Contratante", "Advogado(a) Responsável", "Tipo de Documento",
-        "Data Emissão", "Qtd. Total Cobranças (Lançadas)", "Nº Contrato", "Nº Pedido", 
-        "Nº medição (doc. fornecedor)"
-    ]
-    
-    header_detalhe = [
-        "Nº Cobrança", "Nº Espaider", "Projeto Vinculado", "Trecho", "Tipo de Cobrança",
-        "Matéria Jurídica", "Valor (R$)", "Texto Breve Código Serviço"
-    ]
-    
-    full_header = header_iniciais + header_detalhe
-    sheet.append(full_header)
-    
-    font_header_bd = Font(name='Segoe UI', size=10, bold=True, color="FFFFFF")
-    fill_header_bd = PatternFill(start_color="002060", end_color="002060", fill_type="solid")
-    
-    for cell in sheet[1]:
-        cell.font = font_header_bd
-        cell.fill = fill_header_bd
-    
-    sheet.auto_filter.ref = sheet.dimensions
-    
-    # Dados base
+def registrar_fornecedor():
+    """Registra a medição gerada no cadastro de fornecedores (uma vez por medição)"""
     dados = st.session_state.dados_iniciais
-    total_cobrancas_lancadas = len(st.session_state.dados_coletados)
-    
-    dados_base = [
-        dados['cnpj'], dados['empresa'], dados['advogado'], dados['tipo_doc'],
-        dados['data_prevista'].strftime('%d/%m/%Y'), total_cobrancas_lancadas,
-        dados.get('n_contrato') if dados.get('existe_contrato') == "Sim" else "",
-        dados.get('n_pedido') if dados.get('existe_pedido') == "Sim" else "",
-        dados.get('n_medicao', '')
-    ]
-    
-    # Dados das cobranças
-    for i, dados_cobranca in enumerate(st.session_state.dados_coletados):
-        num_cobranca = i + 1
-        n_espaider = dados_cobranca.get("Nº Espaider", "")
-        projeto_vinculado = dados_cobranca.get("Projeto vinculado", "")
-        trecho = dados_cobranca.get("Trecho", "")
-        
-        bloco_1 = dados_cobranca.get('bloco_1', {})
-        dados_linha_detalhe_1 = [
-            num_cobranca, n_espaider, projeto_vinculado, trecho,
-            bloco_1.get("tipo"), bloco_1.get("materia"),
-            formatar_valor_excel(bloco_1.get("valor")), bloco_1.get("texto_breve")
-        ]
-        sheet.append(dados_base + dados_linha_detalhe_1)
-        
-        if 'bloco_2' in dados_cobranca:
-            bloco_2 = dados_cobranca['bloco_2']
-            dados_linha_detalhe_2 = [
-                num_cobranca, n_espaider, projeto_vinculado, trecho,
-                bloco_2.get("tipo"), bloco_2.get("materia"),
-                formatar_valor_excel(bloco_2.get("valor")), bloco_2.get("texto_breve")
-            ]
-            sheet.append(dados_base + dados_linha_detalhe_2)
-    
-    # Ajustar largura das colunas
-    for col in sheet.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        sheet.column_dimensions[column].width = adjusted_width
+    chave = (dados.get('cnpj'), dados.get('n_medicao'))
+    if st.session_state.get('fornecedor_registrado') == chave:
+        return
+    try:
+        obter_cadastro_fornecedores().registrar(dados)
+    except sqlite3.Error as e:
+        st.warning(f"Não foi possível atualizar o cadastro de fornecedores: {e}")
+        return
+    st.session_state.fornecedor_registrado = chave
 
 def finalizar_processo():
-    """Finaliza o processo e gera o Excel"""
+    """Finaliza o processo e gera o Excel (em segundo plano)"""
     if not st.session_state.dados_coletados:
         st.error("O processo não pode ser finalizado: não há detalhamentos válidos.")
         return
     
-    st.session_state.is_finalizado = True
+    if gerar_excel():
+        st.session_state.is_finalizado = True
+
+def registrar_historico(id_tarefa: str):
+    """Acrescenta a medição exportada ao histórico (uma vez por exportação, gravado em segundo plano)
+
+    O histórico ignora medições já gravadas (mesmo id_medicao), p.ex. finalizadas de novo.
+    """
+    historico = obter_historico_medicoes()
+    if historico.ultimo_erro is not None:
+        st.warning(f"Há medições aguardando gravação no histórico: {historico.ultimo_erro}")
+    if st.session_state.get('historico_registrado') == id_tarefa:
+        return
+    historico.registrar(Medicao.de_sessao(st.session_state.dados_iniciais, st.session_state.dados_coletados))
+    st.session_state.historico_registrado = id_tarefa
+
+def dados_download(gerar):
+    """data= do st.download_button: a função `gerar` (lida no clique) ou, sem suporte, o conteúdo"""
+    return gerar if DOWNLOAD_SOB_DEMANDA else gerar()
+
+def render_exportacao():
+    """Andamento da exportação da medição e, quando pronta, o download do arquivo"""
+    id_tarefa = st.session_state.get('exportacao_tarefa')
+    if not id_tarefa:
+        return
+    
+    tarefa = obter_fila_exportacao().obter(id_tarefa)
+    if tarefa is None:
+        # Arquivo descartado pelo prazo (ou gerado em outra réplica): basta finalizar de novo
+        del st.session_state.exportacao_tarefa
+        return
+    if not tarefa.terminada:
+        render_andamento_exportacao_fragment()
+        return
+    if tarefa.estado == ERRO:
+        st.error(f"Erro ao gerar Excel: {tarefa.erro}")
+        return
+    if not tarefa.disponivel:
+        del st.session_state.exportacao_tarefa
+        st.info("O arquivo gerado expirou. Finalize novamente para gerar um novo arquivo.")
+        return
+    
+    registrar_fornecedor()
+    registrar_historico(id_tarefa)
     
-    # Gerar Excel
-    buffer = gerar_excel()
+    # Download do arquivo
+    nome_arquivo = f"Medicoes_Juridicas_{datetime.fromtimestamp(tarefa.terminada_em).strftime('%Y%m%d_%H%M%S')}.xlsx"
     
-    if buffer:
-        # Download do arquivo
-        nome_arquivo = f"Medicoes_Juridicas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
+    # O st.download_button só serve bytes (guardados na memória do servidor); com
+    # DOWNLOAD_SOB_DEMANDA o arquivo em disco só é lido quando o usuário clica
+    st.download_button(
+        label="📥 Baixar Arquivo Excel",
+        data=dados_download(tarefa.ler),
+        file_name=nome_arquivo,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        type="primary"
+    )
+    
+    # Dados da planilha BD em arquivo colunar para o ETL (MEDICOES_SAIDA_COLUNAR)
+    formato = FORMATO_COLUNAR_PADRAO
+    if formato:
+        dados_iniciais = st.session_state.dados_iniciais
+        dados_coletados = st.session_state.dados_coletados
         st.download_button(
-            label="📥 Baixar Arquivo Excel",
-            data=buffer,
-            file_name=nome_arquivo,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            type="primary"
+            label=f"📊 Baixar dados ({formato.upper()})",
+            data=dados_download(
+                lambda: gerar_colunar_bytes(Medicao.de_sessao(dados_iniciais, dados_coletados), formato)
+            ),
+            file_name=nome_arquivo.replace(".xlsx", f".{formato}"),
+            mime=MIME_COLUNAR[formato]
         )
-        
-        qtd = len(st.session_state.dados_coletados)
-        if qtd == 1:
-            mensagem = f"O detalhamento foi concluído e o arquivo de 1 cobrança foi gerado."
-        else:
-            mensagem = f"Os detalhamentos foram concluídos e o arquivo de {qtd} cobranças foi gerado."
-        
-        st.success(mensagem)
+    
+    qtd = len(st.session_state.dados_coletados)
+    if qtd == 1:
+        mensagem = f"O detalhamento foi concluído e o arquivo de 1 cobrança foi gerado."
+    else:
+        mensagem = f"Os detalhamentos foram concluídos e o arquivo de {qtd} cobranças foi gerado."
+    
+    st.success(mensagem)
+
+@st.fragment(run_every=INTERVALO_ANDAMENTO_EXPORTACAO)
+def render_andamento_exportacao_fragment():
+    """Andamento da exportação, atualizado sozinho até o arquivo ficar pronto"""
+    fila = obter_fila_exportacao()
+    tarefa = fila.obter(st.session_state.get('exportacao_tarefa', ''))
+    if tarefa is None or tarefa.terminada:
+        st.rerun()
+    
+    if tarefa.estado == NA_FILA:
+        posicao = fila.posicao(tarefa)
+        texto = "Aguardando na fila de exportação..."
+        if posicao:
+            texto = f"Aguardando na fila de exportação ({posicao} antes desta)..."
+    else:
+        texto = "Gerando o arquivo Excel..."
+    st.progress(fila.progresso(tarefa), text=texto)
 
 # ============================================================
 # BARRA LATERAL
@@ -1465,6 +1300,8 @@ def main():
     
     # Conteúdo principal baseado na página atual
     current_page = st.session_state.current_page
+    carregar_partes_rascunho(current_page)
+    avisar_falha_rascunho()
     
     if current_page == "inicio":
         pagina_inicio()
@@ -1476,6 +1313,8 @@ def main():
         pagina_detalhamento()
     elif current_page == "revisao_detalhada":
         pagina_revisao_detalhada()
+    
+    agendar_rascunho()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,374 @@
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# ============================================================
+# CADASTROS (EMPRESAS, ADVOGADOS, MATÉRIAS, PROJETOS)
+# ============================================================
+#
+# Os cadastros ficam fora do código: em cadastros.json, ao lado deste módulo,
+# ou no arquivo .json / banco SQLite indicado pela variável de ambiente
+# MEDICOES_CADASTROS. São carregados uma vez por processo, já com as listas
+# ordenadas e os índices valor -> posição das caixas de seleção, e
+# recarregados quando o arquivo de origem é alterado.
+#
+# Tabelas do banco SQLite (ver salvar_cadastros_sqlite):
+#   cadastro(lista, posicao, nome, sigla)
+#       lista: tipos_cobranca, materias, tipos_documento, empresas ou advogados;
+#       sigla só em tipos_cobranca e materias (texto breve)
+#   projeto(empresa, posicao, projeto, trecho)
+#       uma linha por trecho; trecho "" para projetos sem trechos
+
+VARIAVEL_CADASTROS = "MEDICOES_CADASTROS"
+CAMINHO_CADASTROS = str(Path(__file__).with_name("cadastros.json"))
+EXTENSOES_SQLITE = ('.db', '.sqlite', '.sqlite3')
+
+LISTAS_CADASTRO = ('tipos_cobranca', 'materias', 'tipos_documento', 'empresas', 'advogados')
+LISTAS_COM_SIGLA = ('tipos_cobranca', 'materias')
+
+@dataclass(frozen=True, slots=True)
+class Opcoes:
+    """Opções de uma caixa de seleção, com o índice valor -> posição"""
+    valores: Tuple[str, ...]
+    posicoes: Dict[str, int]
+
+    @classmethod
+    def de_valores(cls, valores) -> "Opcoes":
+        valores = tuple(valores)
+        posicoes = {}
+        for posicao, valor in enumerate(valores):
+            posicoes.setdefault(valor, posicao)
+        return cls(valores, posicoes)
+
+    def indice(self, valor) -> int:
+        """Posição do valor nas opções (0 se não estiver na lista)"""
+        return self.posicoes.get(valor, 0)
+
+    def __contains__(self, valor) -> bool:
+        return valor in self.posicoes
+
+SEM_OPCOES = Opcoes.de_valores([""])
+
+# ============================================================
+# BUSCA POR DIGITAÇÃO (PROJETOS E TRECHOS)
+# ============================================================
+
+LIMITE_RESULTADOS_BUSCA = 20
+
+def normalizar_busca(texto) -> str:
+    """Texto sem acentos, em minúsculas e só com letras e números ("SE Janaúba 6" -> "se janauba 6")"""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+    return " ".join(re.findall(r'[0-9a-z]+', texto))
+
+def _chaves_consulta(palavra: str) -> set:
+    """Chaves do índice para uma palavra da consulta: prefixo (até 2 letras) ou trigramas"""
+    if len(palavra) < 3:
+        return {"^" + palavra}
+    return {palavra[i:i + 3] for i in range(len(palavra) - 2)}
+
+def _chaves_palavra(palavra: str) -> set:
+    """Chaves do índice para uma palavra indexada: prefixos de 1 e 2 letras e trigramas"""
+    chaves = {"^" + palavra[:n] for n in (1, 2) if len(palavra) >= n}
+    chaves.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return chaves
+
+class IndiceBusca:
+    """Índice de n-gramas de uma lista de opções, para busca por digitação
+
+    A busca ignora acentos e maiúsculas. Cada palavra da consulta precisa
+    aparecer em alguma palavra da opção: com 3 letras ou mais, em qualquer
+    posição (trigramas); com menos, no início (prefixos). Só os candidatos do
+    índice são conferidos, e só os melhores resultados são devolvidos.
+    """
+
+    __slots__ = ('valores', 'normalizados', '_posicoes')
+
+    def __init__(self, valores):
+        self.valores = tuple(valores)
+        self.normalizados = tuple(normalizar_busca(valor) for valor in self.valores)
+
+        posicoes = defaultdict(set)
+        for posicao, texto in enumerate(self.normalizados):
+            for palavra in texto.split():
+                for chave in _chaves_palavra(palavra):
+                    posicoes[chave].add(posicao)
+        self._posicoes = {chave: frozenset(conjunto) for chave, conjunto in posicoes.items()}
+
+    def buscar(self, consulta: str, limite: int = LIMITE_RESULTADOS_BUSCA) -> List[str]:
+        """Até `limite` opções que combinam com a consulta, as mais relevantes primeiro
+
+        Ordem: opções que começam com a consulta, depois as em que todas as
+        palavras da consulta iniciam palavras da opção, depois as demais; em
+        cada grupo, a ordem do cadastro. Consulta vazia devolve as primeiras opções.
+        """
+        palavras = normalizar_busca(consulta).split()
+        if not palavras:
+            return list(self.valores[:limite])
+
+        candidatos = None
+        for palavra in palavras:
+            for chave in _chaves_consulta(palavra):
+                posicoes = self._posicoes.get(chave, frozenset())
+                candidatos = posicoes if candidatos is None else candidatos & posicoes
+                if not candidatos:
+                    return []
+
+        consulta_normalizada = " ".join(palavras)
+        encontrados = []
+        no_inicio = 0
+        for posicao in sorted(candidatos):
+            texto = self.normalizados[posicao]
+            if texto.startswith(consulta_normalizada):
+                encontrados.append((0, posicao))
+                no_inicio += 1
+                if no_inicio == limite:
+                    # Os próximos candidatos não superam os já encontrados
+                    break
+                continue
+
+            palavras_opcao = texto.split()
+            if not all(
+                any(p.startswith(palavra) if len(palavra) < 3 else palavra in p for p in palavras_opcao)
+                for palavra in palavras
+            ):
+                continue
+            prefixos = all(any(p.startswith(palavra) for p in palavras_opcao) for palavra in palavras)
+            encontrados.append((1 if prefixos else 2, posicao))
+
+        return [self.valores[posicao] for _, posicao in heapq.nsmallest(limite, encontrados)]
+
+SEM_BUSCA = IndiceBusca([""])
+
+@dataclass(frozen=True, slots=True)
+class Catalogo:
+    """Cadastros carregados, prontos para as páginas e para a validação
+
+    As listas das caixas de seleção (materias, tipos_cobranca, ...) já trazem
+    a opção vazia na primeira posição; empresas e advogados já vêm ordenados.
+    """
+    mapa_tipo_cobranca: Dict[str, str]
+    mapa_materia: Dict[str, str]
+    projetos_por_empresa: dict
+    materias: Opcoes
+    tipos_cobranca: Opcoes
+    tipos_documento: Opcoes
+    empresas: Opcoes
+    advogados: Opcoes
+    projetos_empresa: Dict[str, Opcoes]
+    trechos_projeto: Dict[Tuple[str, str], Opcoes]
+    trechos_empresa: Dict[str, Tuple[str, ...]]
+    pares_empresa: Dict[str, Tuple[Tuple[str, str], ...]]
+    busca_projetos: Dict[str, IndiceBusca]
+    busca_trechos: Dict[Tuple[str, str], IndiceBusca]
+
+    @classmethod
+    def de_dados(cls, dados: dict) -> "Catalogo":
+        """Monta o catálogo a partir do conteúdo de cadastros.json"""
+        projetos_por_empresa = dados['projetos_por_empresa']
+        projetos_empresa = {}
+        trechos_projeto = {}
+        trechos_empresa = {}
+        pares_empresa = {}
+
+        for empresa, cadastro in projetos_por_empresa.items():
+            projetos = cadastro["Projeto vinculado"]
+            projetos_empresa[empresa] = Opcoes.de_valores(projetos)
+            pares = []
+            for projeto in projetos:
+                trechos = cadastro["Trecho"].get(projeto, [""])
+                trechos_projeto[(empresa, projeto)] = Opcoes.de_valores(trechos)
+                pares += [(projeto, trecho) for trecho in trechos]
+            pares_empresa[empresa] = tuple(pares)
+            trechos_empresa[empresa] = tuple(sorted({
+                trecho for projeto, trecho in pares if projeto and trecho
+            }))
+
+        return cls(
+            mapa_tipo_cobranca=dict(dados['tipos_cobranca']),
+            mapa_materia=dict(dados['materias']),
+            projetos_por_empresa=projetos_por_empresa,
+            materias=Opcoes.de_valores([""] + list(dados['materias'])),
+            tipos_cobranca=Opcoes.de_valores([""] + list(dados['tipos_cobranca'])),
+            tipos_documento=Opcoes.de_valores([""] + list(dados['tipos_documento'])),
+            empresas=Opcoes.de_valores([""] + sorted(dados['empresas'])),
+            advogados=Opcoes.de_valores([""] + sorted(dados['advogados'])),
+            projetos_empresa=projetos_empresa,
+            trechos_projeto=trechos_projeto,
+            trechos_empresa=trechos_empresa,
+            pares_empresa=pares_empresa,
+            busca_projetos={
+                empresa: IndiceBusca(opcoes.valores) for empresa, opcoes in projetos_empresa.items()
+            },
+            busca_trechos={
+                chave: IndiceBusca(opcoes.valores) for chave, opcoes in trechos_projeto.items()
+            }
+        )
+
+    def projetos(self, empresa: str) -> Opcoes:
+        """Projetos vinculados da empresa"""
+        return self.projetos_empresa.get(empresa, SEM_OPCOES)
+
+    def trechos(self, empresa: str, projeto: str) -> Opcoes:
+        """Trechos do projeto da empresa"""
+        return self.trechos_projeto.get((empresa, projeto), SEM_OPCOES)
+
+    def busca_projeto(self, empresa: str) -> IndiceBusca:
+        """Índice de busca dos projetos da empresa"""
+        return self.busca_projetos.get(empresa, SEM_BUSCA)
+
+    def busca_trecho(self, empresa: str, projeto: str) -> IndiceBusca:
+        """Índice de busca dos trechos do projeto da empresa"""
+        return self.busca_trechos.get((empresa, projeto), SEM_BUSCA)
+
+    def pares_projeto_trecho(self, empresa: str) -> Tuple[Tuple[str, str], ...]:
+        """Pares (projeto, trecho) válidos para a empresa"""
+        return self.pares_empresa.get(empresa, ())
+
+# ============================================================
+# LEITURA E GRAVAÇÃO DOS CADASTROS
+# ============================================================
+
+def _e_sqlite(caminho) -> bool:
+    return os.path.splitext(caminho)[1].lower() in EXTENSOES_SQLITE
+
+def ler_cadastros_sqlite(caminho) -> dict:
+    """Lê os cadastros de um banco SQLite no formato de cadastros.json"""
+    dados = {lista: ({} if lista in LISTAS_COM_SIGLA else []) for lista in LISTAS_CADASTRO}
+    projetos_por_empresa = {}
+
+    conexao = sqlite3.connect(f"{Path(caminho).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        for lista, nome, sigla in conexao.execute(
+            "SELECT lista, nome, sigla FROM cadastro ORDER BY lista, posicao"
+        ):
+            if lista in LISTAS_COM_SIGLA:
+                dados[lista][nome] = sigla
+            elif lista in dados:
+                dados[lista].append(nome)
+
+        for empresa, projeto, trecho in conexao.execute(
+            "SELECT empresa, projeto, trecho FROM projeto ORDER BY empresa, posicao"
+        ):
+            cadastro = projetos_por_empresa.setdefault(empresa, {"Projeto vinculado": [], "Trecho": {}})
+            if projeto not in cadastro["Trecho"]:
+                cadastro["Projeto vinculado"].append(projeto)
+                cadastro["Trecho"][projeto] = []
+            cadastro["Trecho"][projeto].append(trecho or "")
+    finally:
+        conexao.close()
+
+    dados['projetos_por_empresa'] = projetos_por_empresa
+    return dados
+
+def salvar_cadastros_sqlite(dados: dict, caminho):
+    """Grava os cadastros (formato de cadastros.json) em um banco SQLite
+
+    O banco é montado em um arquivo temporário e só então substitui o
+    anterior, para que os processos em execução nunca leiam um banco pela metade.
+    """
+    caminho = Path(caminho)
+    temporario = caminho.with_name(caminho.name + ".tmp")
+    temporario.unlink(missing_ok=True)
+
+    conexao = sqlite3.connect(temporario)
+    try:
+        conexao.execute("CREATE TABLE cadastro (lista TEXT, posicao INTEGER, nome TEXT, sigla TEXT)")
+        conexao.execute("CREATE TABLE projeto (empresa TEXT, posicao INTEGER, projeto TEXT, trecho TEXT)")
+        for lista in LISTAS_CADASTRO:
+            valores = dados[lista]
+            siglas = valores if lista in LISTAS_COM_SIGLA else {}
+            conexao.executemany(
+                "INSERT INTO cadastro VALUES (?, ?, ?, ?)",
+                [(lista, posicao, nome, siglas.get(nome)) for posicao, nome in enumerate(valores)]
+            )
+        for empresa, cadastro in dados['projetos_por_empresa'].items():
+            linhas = [
+                (projeto, trecho)
+                for projeto in cadastro["Projeto vinculado"]
+                for trecho in cadastro["Trecho"].get(projeto, [""])
+            ]
+            conexao.executemany(
+                "INSERT INTO projeto VALUES (?, ?, ?, ?)",
+                [(empresa, posicao, projeto, trecho) for posicao, (projeto, trecho) in enumerate(linhas)]
+            )
+        conexao.commit()
+    finally:
+        conexao.close()
+
+    os.replace(temporario, caminho)
+
+def carregar_catalogo(caminho) -> Catalogo:
+    """Lê o arquivo de cadastros (.json ou SQLite) e monta o catálogo"""
+    if _e_sqlite(caminho):
+        dados = ler_cadastros_sqlite(caminho)
+    else:
+        with open(caminho, encoding='utf-8-sig') as arquivo:
+            dados = json.load(arquivo)
+    return Catalogo.de_dados(dados)
+
+# ============================================================
+# CACHE DO PROCESSO (COM RECARGA AUTOMÁTICA)
+# ============================================================
+
+_ERROS_LEITURA = (OSError, ValueError, KeyError, TypeError, sqlite3.Error)
+
+def caminho_cadastros() -> str:
+    """Arquivo de cadastros em uso (variável MEDICOES_CADASTROS ou cadastros.json)"""
+    return os.environ.get(VARIAVEL_CADASTROS) or CAMINHO_CADASTROS
+
+def _assinatura(caminho: str) -> tuple:
+    """Data de modificação e tamanho do arquivo (e do -wal, em bancos SQLite)"""
+    arquivos = [caminho]
+    if _e_sqlite(caminho):
+        arquivos.append(caminho + "-wal")
+    assinatura = []
+    for arquivo in arquivos:
+        try:
+            estado = os.stat(arquivo)
+        except OSError:
+            assinatura.append(None)
+        else:
+            assinatura.append((estado.st_mtime_ns, estado.st_size))
+    return tuple(assinatura)
+
+_lock = threading.Lock()
+_em_cache = None  # (caminho, assinatura, catálogo)
+
+def obter_catalogo() -> Catalogo:
+    """Catálogo do processo, recarregado quando o arquivo de cadastros muda
+
+    Cada chamada custa só um os.stat do arquivo. Se uma versão nova não puder
+    ser lida (arquivo sendo gravado, JSON inválido), a anterior continua em
+    uso até a próxima alteração.
+    """
+    global _em_cache
+    caminho = caminho_cadastros()
+    assinatura = _assinatura(caminho)
+
+    em_cache = _em_cache
+    if em_cache is not None and em_cache[:2] == (caminho, assinatura):
+        return em_cache[2]
+
+    with _lock:
+        em_cache = _em_cache
+        if em_cache is not None and em_cache[:2] == (caminho, assinatura):
+            return em_cache[2]
+
+        try:
+            catalogo = carregar_catalogo(caminho)
+        except _ERROS_LEITURA:
+            if em_cache is None or em_cache[0] != caminho:
+                raise
+            catalogo = em_cache[2]
+
+        _em_cache = (caminho, assinatura, catalogo)
+        return catalogo
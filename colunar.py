@@ -0,0 +1,128 @@
+import csv
+import io
+import os
+from typing import Optional
+
+from modelo import Medicao
+from exportacao import id_medicao
+
+# ============================================================
+# SAÍDA COLUNAR DOS DADOS DA PLANILHA BD (CSV / PARQUET)
+# ============================================================
+#
+# As mesmas linhas da planilha BD (layout completo), em um arquivo tipado
+# para as cargas de ETL, sem abrir o .xlsx: valores em centavos (inteiros),
+# datas ISO (AAAA-MM-DD) e a versão do esquema em todas as linhas (coluna
+# versao_esquema). Mudanças incompatíveis nas colunas incrementam
+# VERSAO_ESQUEMA_BD; colunas novas entram sempre no fim.
+#
+# CSV: UTF-8, separador vírgula, cabeçalho com os nomes de ESQUEMA_BD.
+# Parquet: requer o pacote pyarrow (opcional); a versão do esquema também
+# fica nos metadados do arquivo.
+#
+# A variável de ambiente MEDICOES_SAIDA_COLUNAR (csv ou parquet) ativa o
+# arquivo colunar ao lado do Excel na finalização da medição.
+
+VERSAO_ESQUEMA_BD = 1
+
+# (coluna, tipo): "texto", "inteiro" ou "data"
+ESQUEMA_BD = (
+    ("versao_esquema", "inteiro"),
+    ("id_medicao", "texto"),
+    ("cnpj_fornecedor", "texto"),
+    ("empresa_contratante", "texto"),
+    ("advogado_responsavel", "texto"),
+    ("tipo_documento", "texto"),
+    ("data_emissao", "data"),
+    ("qtd_cobrancas", "inteiro"),
+    ("n_contrato", "texto"),
+    ("n_pedido", "texto"),
+    ("n_medicao", "texto"),
+    ("n_cobranca", "inteiro"),
+    ("n_espaider", "texto"),
+    ("projeto_vinculado", "texto"),
+    ("trecho", "texto"),
+    ("tipo_cobranca", "texto"),
+    ("materia_juridica", "texto"),
+    ("valor_centavos", "inteiro"),
+    ("texto_breve_codigo_servico", "texto"),
+)
+
+VARIAVEL_SAIDA_COLUNAR = "MEDICOES_SAIDA_COLUNAR"
+
+MIME_COLUNAR = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+FORMATO_COLUNAR_PADRAO = os.environ.get(VARIAVEL_SAIDA_COLUNAR) or ""
+if FORMATO_COLUNAR_PADRAO and FORMATO_COLUNAR_PADRAO not in MIME_COLUNAR:
+    raise ValueError(
+        f"{VARIAVEL_SAIDA_COLUNAR}: formato colunar desconhecido: {FORMATO_COLUNAR_PADRAO} "
+        f"(use {' ou '.join(MIME_COLUNAR)})"
+    )
+
+def linhas_bd(medicao: Medicao):
+    """Gera as linhas tipadas da planilha BD, na ordem de ESQUEMA_BD"""
+    dados = medicao.dados_iniciais
+    base = (
+        VERSAO_ESQUEMA_BD, id_medicao(medicao),
+        dados.cnpj, dados.empresa, dados.advogado, dados.tipo_doc,
+        dados.data_prevista, len(medicao.cobrancas),
+        dados.contrato, dados.pedido, dados.n_medicao
+    )
+
+    for num_cobranca, cobranca in enumerate(medicao.cobrancas, start=1):
+        for bloco in cobranca.blocos:
+            yield base + (
+                num_cobranca, cobranca.n_espaider, cobranca.projeto, cobranca.trecho,
+                bloco.tipo, bloco.materia, bloco.centavos, bloco.texto_breve
+            )
+
+def _gravar_csv(medicao: Medicao, destino):
+    texto = io.TextIOWrapper(destino, encoding='utf-8', newline='')
+    try:
+        writer = csv.writer(texto)
+        writer.writerow([nome for nome, _ in ESQUEMA_BD])
+        # date é gravada por str(): AAAA-MM-DD
+        writer.writerows(linhas_bd(medicao))
+    finally:
+        texto.flush()
+        texto.detach()
+
+def _gravar_parquet(medicao: Medicao, destino):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("A saída em Parquet requer o pacote pyarrow (pip install pyarrow)") from e
+
+    tipos = {"texto": pyarrow.string(), "inteiro": pyarrow.int64(), "data": pyarrow.date32()}
+    esquema = pyarrow.schema(
+        [(nome, tipos[tipo]) for nome, tipo in ESQUEMA_BD],
+        metadata={"versao_esquema": str(VERSAO_ESQUEMA_BD)}
+    )
+    colunas = list(zip(*linhas_bd(medicao))) or [()] * len(ESQUEMA_BD)
+    tabela = pyarrow.table(
+        [pyarrow.array(valores, type=campo.type) for valores, campo in zip(colunas, esquema)],
+        schema=esquema
+    )
+    pyarrow.parquet.write_table(tabela, destino)
+
+FORMATOS_COLUNARES = {
+    "csv": _gravar_csv,
+    "parquet": _gravar_parquet,
+}
+
+def gravar_colunar(medicao: Medicao, destino, formato: Optional[str] = None):
+    """Grava as linhas da planilha BD em `destino` (arquivo binário aberto) no formato informado"""
+    formato = formato or FORMATO_COLUNAR_PADRAO or "csv"
+    if formato not in FORMATOS_COLUNARES:
+        raise ValueError(f"Formato colunar desconhecido: {formato}")
+    FORMATOS_COLUNARES[formato](medicao, destino)
+
+def gerar_colunar_bytes(medicao: Medicao, formato: Optional[str] = None) -> bytes:
+    """Como gravar_colunar, mas devolve o conteúdo do arquivo"""
+    buffer = io.BytesIO()
+    gravar_colunar(medicao, buffer, formato)
+    return buffer.getvalue()
@@ -0,0 +1,1038 @@
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from functools import lru_cache
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from typing import Callable, Iterable, Optional
+from xml.etree.ElementTree import tostring
+from xml.sax.saxutils import escape
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import openpyxl
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils.exceptions import IllegalCharacterError
+from openpyxl.utils.protection import hash_password
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+from openpyxl.styles.borders import DEFAULT_BORDER
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.workbook.protection import WorkbookProtection
+from openpyxl.writer.excel import ExcelWriter
+
+try:
+    # Módulos internos do openpyxl usados pelo motor xml (versões testadas em requirements.txt)
+    from openpyxl.styles.stylesheet import write_stylesheet
+    from openpyxl.writer.theme import theme_xml
+except ImportError:
+    write_stylesheet = theme_xml = None
+
+from modelo import Medicao
+
+# ============================================================
+# NÚCLEO DE EXPORTAÇÃO EXCEL (SEM STREAMLIT)
+# ============================================================
+
+SENHA_PROTECAO = 'SINAPSE4'
+
+# Acima deste número de linhas o arquivo é gerado em modo streaming (motor openpyxl)
+LIMITE_LINHAS_STREAMING = 500
+
+# Motor de geração usado por padrão (ver MOTORES_EXCEL); variável MEDICOES_MOTOR_EXCEL.
+# Sem os módulos internos do openpyxl que o motor xml usa, o padrão é o openpyxl.
+VARIAVEL_MOTOR = "MEDICOES_MOTOR_EXCEL"
+MOTOR_PADRAO = os.environ.get(VARIAVEL_MOTOR) or ("xml" if write_stylesheet is not None else "openpyxl")
+
+# Data/hora gravada nas entradas do zip e nas propriedades do documento, para
+# que a mesma medição gere sempre os mesmos bytes. A data do carimbo "Data:"
+# da planilha é a do dia da geração e faz parte da chave do cache.
+DATA_HORA_FIXA = datetime(2000, 1, 1)
+
+# Orçamento de memória do cache de arquivos gerados (compartilhado pelo processo)
+LIMITE_BYTES_CACHE = 64 * 1024 * 1024
+
+# Estilos compartilhados pelos modos em memória e streaming
+FONT_LOGO = Font(name='Segoe UI', size=14, bold=True)
+FONT_TITULO = Font(name='Segoe UI', size=16, bold=True)
+FONT_HEADER_AZUL = Font(name='Segoe UI', size=11, bold=True, color="FFFFFF")
+FONT_HEADER_BD = Font(name='Segoe UI', size=10, bold=True, color="FFFFFF")
+FILL_HEADER_AZUL = PatternFill(start_color="002060", end_color="002060", fill_type="solid")
+FONT_BOLD = Font(name='Segoe UI', size=10, bold=True)
+FONT_NORMAL = Font(name='Segoe UI', size=10)
+
+ALIGNMENT_LEFT = Alignment(horizontal='left', vertical='center', wrap_text=True)
+ALIGNMENT_RIGHT = Alignment(horizontal='right', vertical='center', wrap_text=True)
+ALIGNMENT_CENTER = Alignment(horizontal='center', vertical='center')
+THIN_BORDER = Border(
+    left=Side(style='thin'), right=Side(style='thin'),
+    top=Side(style='thin'), bottom=Side(style='thin')
+)
+
+FORMATO_MOEDA = 'R$ #,##0.00'
+
+# Estilos nomeados: cada célula recebe um único nome em vez de fonte, borda,
+# preenchimento e alinhamento separados
+ESTILOS = {
+    'med_logo': dict(font=FONT_LOGO),
+    'med_titulo': dict(font=FONT_TITULO, alignment=ALIGNMENT_CENTER),
+    'med_data': dict(font=FONT_NORMAL, alignment=ALIGNMENT_RIGHT),
+    'med_faixa': dict(font=FONT_HEADER_AZUL, fill=FILL_HEADER_AZUL, alignment=ALIGNMENT_CENTER, border=THIN_BORDER),
+    'med_borda': dict(border=THIN_BORDER),
+    'med_secao': dict(font=FONT_HEADER_AZUL, fill=FILL_HEADER_AZUL, alignment=ALIGNMENT_CENTER),
+    'med_rotulo': dict(font=FONT_BOLD, alignment=ALIGNMENT_RIGHT),
+    'med_valor': dict(font=FONT_NORMAL, alignment=ALIGNMENT_LEFT),
+    'med_header': dict(font=FONT_HEADER_AZUL, fill=FILL_HEADER_AZUL, border=THIN_BORDER),
+    'med_celula': dict(font=FONT_NORMAL, border=THIN_BORDER, alignment=ALIGNMENT_LEFT),
+    'med_celula_moeda': dict(font=FONT_NORMAL, border=THIN_BORDER, alignment=ALIGNMENT_LEFT,
+                             number_format=FORMATO_MOEDA),
+    'med_total': dict(font=FONT_BOLD, border=THIN_BORDER, number_format=FORMATO_MOEDA),
+    'bd_header': dict(font=FONT_HEADER_BD, fill=FILL_HEADER_AZUL),
+}
+
+ROTULOS_ESQUERDA = [
+    "CNPJ do fornecedor:", "Empresa contratante:", "Advogado responsável:",
+    "Tipo de documento de cobrança:"
+]
+
+ROTULOS_DIREITA = ["Data prevista de emissão:", "Nº Contrato:", "Nº Pedido:"]
+
+HEADER_DETALHAMENTO = [
+    "Nº Espaider", "Projeto vinculado", "Trecho", "Tipo de Cobrança",
+    "Matéria", "Valor", "Texto breve código serviço"
+]
+
+HEADER_BD = [
+    "CNPJ Fornecedor", "Empresa Contratante", "Advogado(a) Responsável", "Tipo de Documento",
+    "Data Emissão", "Qtd. Total Cobranças (Lançadas)", "Nº Contrato", "Nº Pedido",
+    "Nº medição (doc. fornecedor)",
+    "Nº Cobrança", "Nº Espaider", "Projeto Vinculado", "Trecho", "Tipo de Cobrança",
+    "Matéria Jurídica", "Valor (R$)", "Texto Breve Código Serviço"
+]
+
+# Colunas dos dados iniciais no início de HEADER_BD
+COLUNAS_BASE_BD = 9
+
+# Layout dos dados das planilhas ocultas (variável MEDICOES_LAYOUT_BD):
+#   completo     planilha BD com os dados iniciais repetidos em todas as linhas (padrão)
+#   normalizado  planilha BD com uma única linha de dados iniciais, identificada
+#                pelo ID Medição, e planilha BD_Cobranças com as linhas de detalhe
+#                e o ID Medição da linha correspondente em BD
+LAYOUT_BD_COMPLETO = "completo"
+LAYOUT_BD_NORMALIZADO = "normalizado"
+LAYOUTS_BD = (LAYOUT_BD_COMPLETO, LAYOUT_BD_NORMALIZADO)
+VARIAVEL_LAYOUT_BD = "MEDICOES_LAYOUT_BD"
+LAYOUT_BD_PADRAO = os.environ.get(VARIAVEL_LAYOUT_BD) or LAYOUT_BD_COMPLETO
+if LAYOUT_BD_PADRAO not in LAYOUTS_BD:
+    raise ValueError(
+        f"{VARIAVEL_LAYOUT_BD}: layout da planilha BD desconhecido: {LAYOUT_BD_PADRAO} "
+        f"(use {' ou '.join(LAYOUTS_BD)})"
+    )
+
+HEADER_BD_MEDICAO = ["ID Medição"] + HEADER_BD[:COLUNAS_BASE_BD]
+HEADER_BD_COBRANCAS = ["ID Medição"] + HEADER_BD[COLUNAS_BASE_BD:]
+
+# Linha do cabeçalho da tabela de cobranças; o detalhamento começa logo abaixo
+LINHA_HEADER_DETALHAMENTO = 14
+
+def _registrar_estilos(workbook):
+    """Registra os estilos nomeados no workbook
+
+    Os NamedStyle são criados por workbook porque ficam vinculados a ele;
+    as fontes, bordas e preenchimentos são compartilhados pelo processo.
+    """
+    for nome, atributos in ESTILOS.items():
+        atributos = dict(dict(font=DEFAULT_FONT, border=DEFAULT_BORDER), **atributos)
+        workbook.add_named_style(NamedStyle(name=nome, hidden=True, **atributos))
+
+def _proteger_workbook(workbook, sheet_principal, sheets_bd):
+    """Aplica a proteção das planilhas e do workbook"""
+    sheet_principal.protection.password = SENHA_PROTECAO
+    sheet_principal.protection.sheet = True
+
+    for sheet_bd in sheets_bd:
+        sheet_bd.protection.password = SENHA_PROTECAO
+        sheet_bd.protection.sheet = True
+        sheet_bd.protection.autoFilter = False
+        sheet_bd.sheet_state = 'hidden'
+
+    workbook.security = WorkbookProtection(
+        workbookPassword=SENHA_PROTECAO,
+        lockStructure=True
+    )
+
+def montar_workbook(medicao: Medicao, data_geracao: Optional[date] = None,
+                    layout_bd: Optional[str] = None) -> Workbook:
+    """Monta o Workbook com a planilha Medições e as planilhas de dados (BD) do layout"""
+    workbook = Workbook()
+    _registrar_estilos(workbook)
+
+    # Planilha principal
+    sheet_principal = workbook.active
+    sheet_principal.title = "Medições"
+    formatar_planilha_principal(sheet_principal, medicao, data_geracao)
+
+    # Planilhas BD
+    sheets_bd = []
+    for tabela in _tabelas_bd(medicao, layout_bd):
+        sheet_bd = workbook.create_sheet(title=tabela.titulo)
+        formatar_tabela_bd(sheet_bd, tabela)
+        sheets_bd.append(sheet_bd)
+
+    workbook.active = sheet_principal
+    _proteger_workbook(workbook, sheet_principal, sheets_bd)
+
+    return workbook
+
+def montar_workbook_streaming(medicao: Medicao, data_geracao: Optional[date] = None,
+                              layout_bd: Optional[str] = None) -> Workbook:
+    """Monta o Workbook em modo write-only: as linhas são gravadas uma a uma"""
+    workbook = Workbook(write_only=True)
+    _registrar_estilos(workbook)
+
+    tabelas = _tabelas_bd(medicao, layout_bd)
+    sheet_principal = workbook.create_sheet(title="Medições")
+    sheets_bd = [workbook.create_sheet(title=tabela.titulo) for tabela in tabelas]
+
+    # Proteção e visibilidade precisam estar definidas antes da gravação das linhas
+    workbook.active = sheet_principal
+    _proteger_workbook(workbook, sheet_principal, sheets_bd)
+
+    escrever_planilha_principal_streaming(sheet_principal, medicao, data_geracao)
+    for sheet_bd, tabela in zip(sheets_bd, tabelas):
+        escrever_tabela_bd_streaming(sheet_bd, tabela)
+
+    return workbook
+
+def contar_linhas(medicao: Medicao) -> int:
+    """Quantidade de linhas de detalhe (principal + secundária) da medição"""
+    return sum(len(cobranca.blocos) for cobranca in medicao.cobrancas)
+
+def gerar_excel_bytes(medicao: Medicao, data_geracao: Optional[date] = None,
+                      streaming: Optional[bool] = None, motor: Optional[str] = None,
+                      layout_bd: Optional[str] = None) -> bytes:
+    """Gera o arquivo .xlsx da medição e devolve seu conteúdo
+
+    O motor (MOTORES_EXCEL) é o MOTOR_PADRAO e o layout das planilhas BD
+    (LAYOUTS_BD) o LAYOUT_BD_PADRAO se não forem informados. No motor
+    openpyxl, com streaming=None o modo é escolhido pelo tamanho da medição
+    (LIMITE_LINHAS_STREAMING). Motores e modos geram o mesmo conteúdo.
+    """
+    buffer = io.BytesIO()
+    gerar_excel_arquivo(medicao, buffer, data_geracao, streaming, motor, layout_bd)
+    return buffer.getvalue()
+
+def gerar_excel_arquivo(medicao: Medicao, destino, data_geracao: Optional[date] = None,
+                        streaming: Optional[bool] = None, motor: Optional[str] = None,
+                        layout_bd: Optional[str] = None):
+    """Como gerar_excel_bytes, mas grava o .xlsx em `destino` (arquivo binário aberto, com seek)"""
+    MOTORES_EXCEL[motor or MOTOR_PADRAO](
+        medicao, destino, data_geracao or date.today(), streaming, layout_bd or LAYOUT_BD_PADRAO
+    )
+
+# ============================================================
+# MOTORES DE GERAÇÃO
+# ============================================================
+#
+# Cada motor grava o .xlsx completo de uma medição em um arquivo binário
+# aberto: motor(medicao, destino, data_geracao, streaming, layout_bd).
+#   openpyxl  modelo de objetos do openpyxl, em memória ou write-only (streaming)
+#   xml       XML das planilhas gravado diretamente no zip (ver MODO XML DIRETO);
+#             mesmo conteúdo, sem um objeto por célula, várias vezes mais rápido
+#             (tests/test_paridade_motores.py); só disponível se os módulos
+#             internos do openpyxl que ele usa puderem ser importados
+
+def _motor_openpyxl(medicao: Medicao, destino, data_geracao: date, streaming: Optional[bool],
+                    layout_bd: str):
+    if streaming is None:
+        streaming = contar_linhas(medicao) > LIMITE_LINHAS_STREAMING
+
+    if streaming:
+        workbook = montar_workbook_streaming(medicao, data_geracao, layout_bd)
+    else:
+        workbook = montar_workbook(medicao, data_geracao, layout_bd)
+
+    gravar_workbook(workbook, destino)
+
+def _motor_xml(medicao: Medicao, destino, data_geracao: date, streaming: Optional[bool],
+               layout_bd: str):
+    # Sempre linha a linha: o modo streaming não se aplica
+    gravar_xlsx_direto(medicao, destino, data_geracao, layout_bd)
+
+MOTORES_EXCEL = {
+    "openpyxl": _motor_openpyxl,
+}
+if write_stylesheet is not None:
+    MOTORES_EXCEL["xml"] = _motor_xml
+
+if MOTOR_PADRAO not in MOTORES_EXCEL:
+    raise ValueError(
+        f"{VARIAVEL_MOTOR}: motor de geração desconhecido ou indisponível: {MOTOR_PADRAO} "
+        f"(use {' ou '.join(MOTORES_EXCEL)})"
+    )
+
+# ============================================================
+# SAÍDA DETERMINÍSTICA E CACHE
+# ============================================================
+
+def zipinfo_deterministico(arcname: str, compress_type: int = ZIP_DEFLATED) -> ZipInfo:
+    """Entrada de zip com DATA_HORA_FIXA e permissões fixas (para archive.open(zinfo, 'w'))"""
+    zinfo = ZipInfo(arcname, date_time=DATA_HORA_FIXA.timetuple()[:6])
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    return zinfo
+
+class _ZipDeterministico(ZipFile):
+    """ZipFile que grava todas as entradas com DATA_HORA_FIXA"""
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        if not isinstance(zinfo_or_arcname, ZipInfo):
+            zinfo_or_arcname = zipinfo_deterministico(zinfo_or_arcname, self.compression)
+        super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
+        # Planilhas chegam como arquivos temporários: copiar sem carregar tudo na memória
+        zinfo = zipinfo_deterministico(arcname or os.path.basename(filename), self.compression)
+        zinfo.file_size = os.path.getsize(filename)
+        with open(filename, 'rb') as origem, self.open(zinfo, 'w') as destino:
+            shutil.copyfileobj(origem, destino, 1024 * 1024)
+
+def gravar_workbook(workbook: Workbook, destino):
+    """Grava o workbook de forma determinística em um arquivo binário aberto"""
+    workbook.properties.created = DATA_HORA_FIXA
+    workbook.properties.modified = DATA_HORA_FIXA
+
+    archive = _ZipDeterministico(destino, 'w', ZIP_DEFLATED, allowZip64=True)
+    ExcelWriter(workbook, archive).save()
+
+def chave_medicao(medicao: Medicao, data_geracao: date, streaming: bool,
+                  motor: Optional[str] = None, layout_bd: Optional[str] = None) -> str:
+    """Hash canônico (SHA-256) do conteúdo da medição e das opções de geração"""
+    conteudo = {
+        "medicao": asdict(medicao),
+        "data_geracao": data_geracao,
+        "streaming": streaming,
+        "motor": motor or MOTOR_PADRAO,
+        "layout_bd": layout_bd or LAYOUT_BD_PADRAO,
+    }
+    texto = json.dumps(conteudo, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+class CacheExportacao:
+    """Cache LRU de arquivos gerados, limitado pelo total de bytes armazenados"""
+
+    def __init__(self, limite_bytes: int = LIMITE_BYTES_CACHE):
+        self.limite_bytes = limite_bytes
+        self.total_bytes = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave: str) -> Optional[bytes]:
+        """Devolve o conteúdo guardado (marcando-o como recente) ou None"""
+        with self._lock:
+            conteudo = self._itens.get(chave)
+            if conteudo is not None:
+                self._itens.move_to_end(chave)
+            return conteudo
+
+    def guardar(self, chave: str, conteudo: bytes):
+        """Guarda o conteúdo, descartando os menos recentes acima do limite"""
+        if len(conteudo) > self.limite_bytes:
+            return
+
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self.total_bytes -= len(anterior)
+
+            self._itens[chave] = conteudo
+            self.total_bytes += len(conteudo)
+
+            while self.total_bytes > self.limite_bytes:
+                _, removido = self._itens.popitem(last=False)
+                self.total_bytes -= len(removido)
+
+    def limpar(self):
+        """Remove todos os itens"""
+        with self._lock:
+            self._itens.clear()
+            self.total_bytes = 0
+
+CACHE_EXPORTACAO = CacheExportacao()
+
+# ============================================================
+# CONTEÚDO DAS PLANILHAS
+# ============================================================
+
+@lru_cache(maxsize=None)
+def _layout_fixo():
+    """Células e mesclagens fixas do cabeçalho da planilha Medições
+
+    Montado uma única vez por processo; cada exportação só acrescenta as
+    células variáveis (ver _celulas_cabecalho).
+    """
+    celulas = {
+        (2, 2): ("ISA Energia", 'med_logo'),
+        (5, 2): ("Dados Iniciais - Faturamento", 'med_faixa'),
+        (13, 2): ("Detalhamento das cobranças", 'med_secao'),
+    }
+    for col_idx in range(3, 8):
+        celulas[(5, col_idx)] = (None, 'med_borda')
+    for i, rotulo in enumerate(ROTULOS_ESQUERDA):
+        celulas[(7 + i, 2)] = (rotulo, 'med_rotulo')
+    for i, rotulo in enumerate(ROTULOS_DIREITA):
+        celulas[(7 + i, 5)] = (rotulo, 'med_rotulo')
+    for col_idx, title in enumerate(HEADER_DETALHAMENTO, 2):
+        celulas[(LINHA_HEADER_DETALHAMENTO, col_idx)] = (title, 'med_header')
+
+    merges = (
+        ['D2:G2', 'B5:G5']
+        + [f'C{7 + i}:D{7 + i}' for i in range(len(ROTULOS_ESQUERDA))]
+        + [f'F{7 + i}:G{7 + i}' for i in range(len(ROTULOS_DIREITA))]
+        + ['B13:G13']
+    )
+    return tuple(celulas.items()), tuple(merges)
+
+def _celulas_cabecalho(medicao: Medicao, data_geracao: date) -> dict:
+    """Células do cabeçalho (linhas 1 a 14): layout fixo + valores da medição"""
+    dados = medicao.dados_iniciais
+    celulas_fixas, _ = _layout_fixo()
+    celulas = dict(celulas_fixas)
+
+    n_medicao_header = dados.n_medicao or 'N/A'
+    celulas[(2, 4)] = (f"Medição Jurídica Nº {n_medicao_header}", 'med_titulo')
+    celulas[(4, 7)] = (f"Data: {data_geracao.strftime('%d/%m/%Y')}", 'med_data')
+
+    valores_esquerda = [dados.cnpj, dados.empresa, dados.advogado, dados.tipo_doc]
+    valores_direita = [dados.data_prevista.strftime('%d/%m/%Y'), dados.contrato or "N/A", dados.pedido or "N/A"]
+
+    for i, value in enumerate(valores_esquerda):
+        celulas[(7 + i, 3)] = (str(value) if value else "", 'med_valor')
+    for i, value in enumerate(valores_direita):
+        celulas[(7 + i, 6)] = (str(value) if value else "", 'med_valor')
+
+    return celulas
+
+def _linhas_detalhamento(medicao: Medicao):
+    """Gera as linhas do detalhamento da planilha Medições (colunas B a H)"""
+    for cobranca in medicao.cobrancas:
+        for bloco in cobranca.blocos:
+            yield [
+                cobranca.n_espaider, cobranca.projeto, cobranca.trecho,
+                bloco.tipo, bloco.materia, bloco.valor_reais, bloco.texto_breve
+            ]
+
+def _dados_base_bd(medicao: Medicao) -> list:
+    """Colunas dos dados iniciais, repetidas em todas as linhas da planilha BD"""
+    dados = medicao.dados_iniciais
+    total_cobrancas_lancadas = len(medicao.cobrancas)
+
+    return [
+        dados.cnpj, dados.empresa, dados.advogado, dados.tipo_doc,
+        dados.data_prevista.strftime('%d/%m/%Y'), total_cobrancas_lancadas,
+        dados.contrato, dados.pedido, dados.n_medicao
+    ]
+
+def _linhas_detalhe_bd(medicao: Medicao):
+    """Gera as colunas de detalhe (após os dados base) de cada linha da planilha BD"""
+    for i, cobranca in enumerate(medicao.cobrancas):
+        num_cobranca = i + 1
+
+        for bloco in cobranca.blocos:
+            yield [
+                num_cobranca, cobranca.n_espaider, cobranca.projeto, cobranca.trecho,
+                bloco.tipo, bloco.materia,
+                bloco.valor_reais, bloco.texto_breve
+            ]
+
+def id_medicao(medicao: Medicao) -> str:
+    """Identificador da medição: 16 dígitos hexadecimais do SHA-256 dos dados da planilha BD
+
+    Medições com os mesmos dados iniciais e cobranças têm o mesmo ID.
+    """
+    conteudo = [_dados_base_bd(medicao), list(_linhas_detalhe_bd(medicao))]
+    texto = json.dumps(conteudo, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+@dataclass(frozen=True, slots=True)
+class TabelaBD:
+    """Planilha oculta de dados: colunas fixas (iguais em todas as linhas) seguidas das de detalhe"""
+    titulo: str
+    header: list
+    fixos: list
+    detalhes: Callable[[], Iterable[list]]
+
+def _tabelas_bd(medicao: Medicao, layout_bd: Optional[str] = None) -> list:
+    """Planilhas de dados da medição no layout informado (LAYOUTS_BD), na ordem do workbook"""
+    layout_bd = layout_bd or LAYOUT_BD_PADRAO
+    if layout_bd == LAYOUT_BD_COMPLETO:
+        return [TabelaBD("BD", HEADER_BD, _dados_base_bd(medicao), lambda: _linhas_detalhe_bd(medicao))]
+    if layout_bd == LAYOUT_BD_NORMALIZADO:
+        identificador = id_medicao(medicao)
+        linha_medicao = [identificador] + _dados_base_bd(medicao)
+        return [
+            TabelaBD("BD", HEADER_BD_MEDICAO, [], lambda: iter([linha_medicao])),
+            TabelaBD("BD_Cobranças", HEADER_BD_COBRANCAS, [identificador],
+                     lambda: _linhas_detalhe_bd(medicao)),
+        ]
+    raise ValueError(f"Layout da planilha BD desconhecido: {layout_bd}")
+
+def _prepassada_bd(tabela: TabelaBD) -> tuple:
+    """Larguras das colunas e quantidade de linhas de dados, antes da gravação das linhas"""
+    larguras = LargurasColunas()
+    larguras.registrar_linha(tabela.header)
+    primeira_coluna_detalhe = len(tabela.fixos) + 1
+    linhas = 0
+    for detalhe in tabela.detalhes():
+        larguras.registrar_linha(detalhe, primeira_coluna=primeira_coluna_detalhe)
+        linhas += 1
+
+    # Os dados fixos são iguais em todas as linhas: basta contá-los uma vez
+    if linhas:
+        larguras.registrar_linha(tabela.fixos)
+    return _larguras_bd(larguras, len(tabela.header)), linhas
+
+class LargurasColunas:
+    """Maior comprimento de texto por coluna, acumulado à medida que as linhas são gravadas
+
+    Substitui a varredura final de todas as células para o ajuste de largura.
+    Com ignorar_vazios=True valores falsos (None, "", 0) não são contados,
+    como no ajuste da planilha Medições.
+    """
+
+    def __init__(self, ignorar_vazios: bool = False):
+        self.ignorar_vazios = ignorar_vazios
+        self.maximos = {}
+
+    def registrar(self, col_idx: int, valor):
+        """Considera um valor gravado na coluna"""
+        if self.ignorar_vazios and not valor:
+            return
+        tamanho = len(str(valor))
+        if tamanho > self.maximos.get(col_idx, -1):
+            self.maximos[col_idx] = tamanho
+
+    def registrar_linha(self, valores, primeira_coluna: int = 1):
+        """Considera uma linha de valores a partir de primeira_coluna"""
+        for col_idx, valor in enumerate(valores, primeira_coluna):
+            self.registrar(col_idx, valor)
+
+    def maximo(self, col_idx: int) -> Optional[int]:
+        """Maior comprimento registrado na coluna (None se nenhum valor foi registrado)"""
+        return self.maximos.get(col_idx)
+
+def _larguras_principal(larguras: LargurasColunas) -> dict:
+    """Calcula a largura das colunas B a H da planilha Medições"""
+    resultado = {'A': 2}
+
+    for col_idx in range(2, 9):
+        column_letter = get_column_letter(col_idx)
+        maximo = larguras.maximo(col_idx)
+        max_length = maximo + 2 if maximo is not None else 0
+
+        adjusted_width = max(15, min(max_length, 50))
+
+        if column_letter in ['C', 'D', 'E', 'F']:
+            adjusted_width = max(25, min(max_length, 40))
+        if column_letter == 'B':
+            adjusted_width = max(20, min(max_length, 30))
+        if column_letter == 'G':
+            adjusted_width = 15
+        if column_letter == 'H':
+            adjusted_width = 25
+
+        resultado[column_letter] = adjusted_width
+
+    return resultado
+
+def _larguras_bd(larguras: LargurasColunas, colunas: int = len(HEADER_BD)) -> dict:
+    """Calcula a largura das colunas de uma planilha BD"""
+    return {
+        get_column_letter(col_idx): (larguras.maximo(col_idx) or 0) + 2
+        for col_idx in range(1, colunas + 1)
+    }
+
+# ============================================================
+# MODO EM MEMÓRIA
+# ============================================================
+
+def formatar_planilha_principal(sheet, medicao: Medicao, data_geracao: Optional[date] = None):
+    """Formata a planilha principal"""
+    data_geracao = data_geracao or date.today()
+    _, merges = _layout_fixo()
+    larguras = LargurasColunas(ignorar_vazios=True)
+
+    sheet.sheet_view.showGridLines = False
+
+    # Cabeçalho, dados iniciais e títulos da tabela
+    for merge in merges:
+        sheet.merge_cells(merge)
+
+    for (row, col_idx), (valor, estilo) in _celulas_cabecalho(medicao, data_geracao).items():
+        cell = sheet.cell(row=row, column=col_idx)
+        if valor is not None:
+            cell.value = valor
+            larguras.registrar(col_idx, valor)
+        cell.style = estilo
+
+    # Dados das cobranças (principal e, se houver, secundária)
+    current_row = LINHA_HEADER_DETALHAMENTO
+
+    for dados_linha in _linhas_detalhamento(medicao):
+        larguras.registrar_linha(dados_linha, primeira_coluna=2)
+
+        current_row += 1
+        for col_idx, valor in enumerate(dados_linha, 2):
+            cell = sheet.cell(row=current_row, column=col_idx)
+            cell.value = valor
+            cell.style = 'med_celula_moeda' if col_idx == 7 else 'med_celula'
+
+    # Total
+    current_row += 1
+
+    sheet.merge_cells(f'B{current_row}:E{current_row}')
+    cell_total_label = sheet.cell(row=current_row, column=2)
+    cell_total_label.value = "Valor total da cobrança"
+    cell_total_label.style = 'med_rotulo'
+    larguras.registrar(2, cell_total_label.value)
+
+    cell_total_valor = sheet.cell(row=current_row, column=7)
+    cell_total_valor.value = medicao.total_centavos / 100
+    cell_total_valor.style = 'med_total'
+
+    # Ajustar largura das colunas
+    for column_letter, width in _larguras_principal(larguras).items():
+        sheet.column_dimensions[column_letter].width = width
+
+def formatar_planilha_bd(sheet, medicao: Medicao):
+    """Formata a planilha BD (layout completo)"""
+    formatar_tabela_bd(sheet, _tabelas_bd(medicao, LAYOUT_BD_COMPLETO)[0])
+
+def formatar_tabela_bd(sheet, tabela: TabelaBD):
+    """Formata uma planilha de dados (BD)"""
+    larguras = LargurasColunas()
+
+    sheet.append(tabela.header)
+    larguras.registrar_linha(tabela.header)
+
+    for cell in sheet[1]:
+        cell.style = 'bd_header'
+
+    sheet.auto_filter.ref = sheet.dimensions
+
+    # Dados das cobranças
+    fixos = tabela.fixos
+    primeira_coluna_detalhe = len(fixos) + 1
+
+    for detalhe in tabela.detalhes():
+        sheet.append(fixos + detalhe)
+        larguras.registrar_linha(detalhe, primeira_coluna=primeira_coluna_detalhe)
+
+    # Os dados fixos são iguais em todas as linhas: basta contá-los uma vez
+    if sheet.max_row > 1:
+        larguras.registrar_linha(fixos)
+
+    # Ajustar largura das colunas
+    for column_letter, width in _larguras_bd(larguras, len(tabela.header)).items():
+        sheet.column_dimensions[column_letter].width = width
+
+# ============================================================
+# MODO STREAMING (WRITE-ONLY)
+# ============================================================
+
+def _celula(sheet, valor, estilo):
+    """Cria uma WriteOnlyCell com o estilo nomeado informado"""
+    cell = WriteOnlyCell(sheet, value=valor)
+    cell.style = estilo
+    return cell
+
+def escrever_planilha_principal_streaming(sheet, medicao: Medicao, data_geracao: Optional[date] = None):
+    """Escreve a planilha principal linha a linha (mesmo layout de formatar_planilha_principal)"""
+    data_geracao = data_geracao or date.today()
+    celulas = _celulas_cabecalho(medicao, data_geracao)
+    _, merges = _layout_fixo()
+    merges = list(merges)
+
+    # Larguras precisam ser definidas antes da primeira linha: pré-passada nos dados
+    larguras = LargurasColunas(ignorar_vazios=True)
+    larguras.registrar(2, "Valor total da cobrança")
+    for (row, col_idx), (valor, estilo) in celulas.items():
+        larguras.registrar(col_idx, valor)
+    for dados_linha in _linhas_detalhamento(medicao):
+        larguras.registrar_linha(dados_linha[:5], primeira_coluna=2)
+
+    for column_letter, width in _larguras_principal(larguras).items():
+        sheet.column_dimensions[column_letter].width = width
+
+    sheet.sheet_view.showGridLines = False
+
+    # Cabeçalho, dados iniciais e títulos da tabela (linhas 1 a 14)
+    linhas = {}
+    for (row, col_idx), (valor, estilo) in celulas.items():
+        linhas.setdefault(row, {})[col_idx] = _celula(sheet, valor, estilo)
+
+    for row in range(1, LINHA_HEADER_DETALHAMENTO + 1):
+        celulas_linha = linhas.get(row, {})
+        ultima_coluna = max(celulas_linha, default=0)
+        sheet.append([celulas_linha.get(col_idx) for col_idx in range(1, ultima_coluna + 1)])
+
+    # Dados das cobranças
+    current_row = LINHA_HEADER_DETALHAMENTO
+    for dados_linha in _linhas_detalhamento(medicao):
+        current_row += 1
+        sheet.append([None] + [
+            _celula(sheet, valor, 'med_celula_moeda' if col_idx == 7 else 'med_celula')
+            for col_idx, valor in enumerate(dados_linha, 2)
+        ])
+
+    # Total
+    current_row += 1
+    sheet.append([None, _celula(sheet, "Valor total da cobrança", 'med_rotulo'),
+                  None, None, None, None,
+                  _celula(sheet, medicao.total_centavos / 100, 'med_total')])
+    merges.append(f'B{current_row}:E{current_row}')
+
+    for merge in merges:
+        sheet.merged_cells.add(merge)
+
+def escrever_planilha_bd_streaming(sheet, medicao: Medicao):
+    """Escreve a planilha BD linha a linha (mesmo layout de formatar_planilha_bd)"""
+    escrever_tabela_bd_streaming(sheet, _tabelas_bd(medicao, LAYOUT_BD_COMPLETO)[0])
+
+def escrever_tabela_bd_streaming(sheet, tabela: TabelaBD):
+    """Escreve uma planilha de dados linha a linha (mesmo layout de formatar_tabela_bd)"""
+    # Larguras precisam ser definidas antes da primeira linha: pré-passada nos dados
+    larguras, _ = _prepassada_bd(tabela)
+    for column_letter, width in larguras.items():
+        sheet.column_dimensions[column_letter].width = width
+
+    sheet.auto_filter.ref = f"A1:{get_column_letter(len(tabela.header))}1"
+
+    sheet.append([_celula(sheet, titulo, 'bd_header') for titulo in tabela.header])
+
+    fixos = tabela.fixos
+    for detalhe in tabela.detalhes():
+        sheet.append(fixos + detalhe)
+
+# ============================================================
+# MODO XML DIRETO
+# ============================================================
+#
+# Grava o XML das planilhas direto no zip, linha a linha, no mesmo formato
+# do openpyxl (strings inline, estilos nomeados, mesclagens, larguras,
+# proteção e planilhas BD ocultas com filtro). As partes fixas do pacote
+# (estilos, tema, workbook, relações) são montadas uma única vez por processo
+# para cada layout das planilhas BD.
+
+_NS_PLANILHA = (
+    'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+)
+_NS_RELACOES = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+_TIPO_RELACAO = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_TIPO_CONTEUDO = "application/vnd.openxmlformats-officedocument"
+
+_INICIO_PLANILHA = (
+    f'<worksheet {_NS_PLANILHA}><sheetPr><outlinePr summaryBelow="1" summaryRight="1" /><pageSetUpPr /></sheetPr>'
+)
+_FIM_PLANILHA = '<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5" /></worksheet>'
+
+# Linhas acumuladas antes de cada gravação no zip
+LINHAS_POR_BLOCO_XML = 1000
+
+@lru_cache(maxsize=None)
+def _partes_fixas_xml(planilhas_bd: tuple) -> tuple:
+    """Partes fixas do pacote ({nome: bytes}) e o índice de formatação de cada estilo nomeado
+
+    planilhas_bd: (título, quantidade de colunas) de cada planilha BD, na ordem
+    do workbook. O styles.xml é serializado pelo próprio openpyxl a partir de ESTILOS, com
+    um formato de célula por estilo nomeado, na ordem de ESTILOS.
+    """
+    workbook = Workbook()
+    _registrar_estilos(workbook)
+    sheet = workbook.active
+    indices = {}
+    for row, nome in enumerate(ESTILOS, 1):
+        cell = sheet.cell(row=row, column=1)
+        cell.style = nome
+        indices[nome] = cell.style_id
+    styles = tostring(write_stylesheet(workbook))
+
+    senha = hash_password(SENHA_PROTECAO)
+    planilhas = [("Medições", "visible")] + [(titulo, "hidden") for titulo, _ in planilhas_bd]
+    workbook_xml = (
+        '<workbook xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+        'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><workbookPr />'
+        f'<workbookProtection workbookPassword="{senha}" lockStructure="1" />'
+        '<bookViews><workbookView visibility="visible" minimized="0" showHorizontalScroll="1" '
+        'showVerticalScroll="1" showSheetTabs="1" tabRatio="600" firstSheet="0" activeTab="0" '
+        'autoFilterDateGrouping="1" /></bookViews>'
+        '<sheets>' + ''.join(
+            f'<sheet name="{titulo}" sheetId="{numero}" state="{estado}" r:id="rId{numero}" />'
+            for numero, (titulo, estado) in enumerate(planilhas, 1)
+        ) + '</sheets><definedNames>' + ''.join(
+            f'<definedName name="_xlnm._FilterDatabase" localSheetId="{indice}" hidden="1">'
+            f"'{titulo}'!$A$1:${get_column_letter(colunas)}$1</definedName>"
+            for indice, (titulo, colunas) in enumerate(planilhas_bd, 1)
+        ) + '</definedNames><calcPr calcId="124519" fullCalcOnLoad="1" /></workbook>'
+    )
+    data_hora = DATA_HORA_FIXA.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    partes = {
+        "docProps/app.xml": (
+            '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+            f'<Application>Microsoft Excel Compatible / Openpyxl {openpyxl.__version__}</Application>'
+            '<AppVersion>3.1</AppVersion></Properties>'
+        ),
+        "docProps/core.xml": (
+            '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><dc:creator>openpyxl</dc:creator>'
+            f'<dcterms:created xsi:type="dcterms:W3CDTF">{data_hora}</dcterms:created>'
+            f'<dcterms:modified xsi:type="dcterms:W3CDTF">{data_hora}</dcterms:modified></cp:coreProperties>'
+        ),
+        "xl/theme/theme1.xml": theme_xml,
+        "xl/styles.xml": styles,
+        "_rels/.rels": (
+            f'<Relationships {_NS_RELACOES}>'
+            f'<Relationship Type="{_TIPO_RELACAO}/officeDocument" Target="xl/workbook.xml" Id="rId1" />'
+            '<Relationship Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" '
+            'Target="docProps/core.xml" Id="rId2" />'
+            f'<Relationship Type="{_TIPO_RELACAO}/extended-properties" Target="docProps/app.xml" Id="rId3" />'
+            '</Relationships>'
+        ),
+        "xl/workbook.xml": workbook_xml,
+        "xl/_rels/workbook.xml.rels": (
+            f'<Relationships {_NS_RELACOES}>'
+            + ''.join(
+                f'<Relationship Type="{_TIPO_RELACAO}/worksheet" '
+                f'Target="/xl/worksheets/sheet{numero}.xml" Id="rId{numero}" />'
+                for numero in range(1, len(planilhas) + 1)
+            )
+            + f'<Relationship Type="{_TIPO_RELACAO}/styles" Target="styles.xml" Id="rId{len(planilhas) + 1}" />'
+            + f'<Relationship Type="{_TIPO_RELACAO}/theme" Target="theme/theme1.xml" Id="rId{len(planilhas) + 2}" />'
+            + '</Relationships>'
+        ),
+        "[Content_Types].xml": (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml" />'
+            '<Default Extension="xml" ContentType="application/xml" />'
+            f'<Override PartName="/xl/styles.xml" ContentType="{_TIPO_CONTEUDO}.spreadsheetml.styles+xml" />'
+            f'<Override PartName="/xl/theme/theme1.xml" ContentType="{_TIPO_CONTEUDO}.theme+xml" />'
+            '<Override PartName="/docProps/core.xml" '
+            'ContentType="application/vnd.openxmlformats-package.core-properties+xml" />'
+            f'<Override PartName="/docProps/app.xml" ContentType="{_TIPO_CONTEUDO}.extended-properties+xml" />'
+            + ''.join(
+                f'<Override PartName="/xl/worksheets/sheet{numero}.xml" '
+                f'ContentType="{_TIPO_CONTEUDO}.spreadsheetml.worksheet+xml" />'
+                for numero in range(1, len(planilhas) + 1)
+            )
+            + f'<Override PartName="/xl/workbook.xml" ContentType="{_TIPO_CONTEUDO}.spreadsheetml.sheet.main+xml" />'
+            + '</Types>'
+        ),
+    }
+    partes = {nome: conteudo if isinstance(conteudo, bytes) else conteudo.encode('utf-8')
+              for nome, conteudo in partes.items()}
+
+    protecao = (
+        '<sheetProtection selectLockedCells="0" selectUnlockedCells="0" sheet="1" objects="0" '
+        'insertRows="1" insertHyperlinks="1" autoFilter="{}" scenarios="0" formatColumns="1" '
+        'deleteColumns="1" insertColumns="1" pivotTables="1" deleteRows="1" formatCells="1" '
+        f'formatRows="1" sort="1" password="{senha}" />'
+    )
+    return partes, indices, protecao.format(1), protecao.format(0)
+
+def _fragmento_celula(valor, estilo: int, textos: dict) -> str:
+    """XML de uma célula a partir do fim da referência (r="B15) ou "" se a célula não é gravada
+
+    `textos` guarda o XML já montado de cada texto repetido na exportação.
+    """
+    atributo_estilo = f' s="{estilo}"' if estilo else ""
+    if valor is None:
+        return f'"{atributo_estilo} t="n" />' if estilo else ""
+    if isinstance(valor, str):
+        chave = (valor, estilo)
+        fragmento = textos.get(chave)
+        if fragmento is None:
+            if not valor:
+                fragmento = f'"{atributo_estilo} t="inlineStr" />'
+            else:
+                if ILLEGAL_CHARACTERS_RE.search(valor):
+                    raise IllegalCharacterError(f"{valor} cannot be used in worksheets.")
+                texto = valor.strip()
+                espaco = ' xml:space="preserve"' if texto and texto != valor else ""
+                fragmento = f'"{atributo_estilo} t="inlineStr"><is><t{espaco}>{escape(valor)}</t></is></c>'
+            textos[chave] = fragmento
+        return fragmento
+    return f'"{atributo_estilo} t="n"><v>{"%.16g" % valor}</v></c>'
+
+def _linha_xml(row: int, celulas) -> str:
+    """XML de uma linha a partir de pares (letra da coluna, fragmento)"""
+    numero = str(row)
+    return f'<row r="{numero}">' + "".join(
+        f'<c r="{coluna}{numero}{fragmento}' for coluna, fragmento in celulas if fragmento
+    ) + '</row>'
+
+def _colunas_xml(larguras: dict) -> str:
+    """Elemento <cols> a partir de {letra: largura}"""
+    colunas = []
+    for column_letter, width in larguras.items():
+        indice = column_index_from_string(column_letter)
+        colunas.append(
+            f'<col width="{"%.16g" % width}" customWidth="1" min="{indice}" max="{indice}" />'
+        )
+    return '<cols>' + ''.join(colunas) + '</cols>'
+
+class _GravadorParte:
+    """Acumula trechos de XML e grava no zip em blocos"""
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.trechos = []
+
+    def escrever(self, trecho: str):
+        self.trechos.append(trecho)
+        if len(self.trechos) >= LINHAS_POR_BLOCO_XML:
+            self.descarregar()
+
+    def descarregar(self):
+        self.destino.write(''.join(self.trechos).encode('utf-8'))
+        self.trechos.clear()
+
+def _escrever_medicoes_xml(parte: _GravadorParte, medicao: Medicao, data_geracao: date,
+                           indices: dict, protecao: str):
+    """Planilha Medições (mesmo layout de formatar_planilha_principal)"""
+    celulas = _celulas_cabecalho(medicao, data_geracao)
+    _, merges = _layout_fixo()
+    textos = {}
+
+    # Larguras antes das linhas (mesma pré-passada do modo streaming)
+    larguras = LargurasColunas(ignorar_vazios=True)
+    larguras.registrar(2, "Valor total da cobrança")
+    for (row, col_idx), (valor, estilo) in celulas.items():
+        larguras.registrar(col_idx, valor)
+    for dados_linha in _linhas_detalhamento(medicao):
+        larguras.registrar_linha(dados_linha[:5], primeira_coluna=2)
+
+    linha_total = LINHA_HEADER_DETALHAMENTO + contar_linhas(medicao) + 1
+    parte.escrever(
+        _INICIO_PLANILHA
+        + f'<dimension ref="B2:H{linha_total}" />'
+        + '<sheetViews><sheetView showGridLines="0" workbookViewId="0">'
+        + '<selection activeCell="A1" sqref="A1" /></sheetView></sheetViews>'
+        + '<sheetFormatPr baseColWidth="8" defaultRowHeight="15" />'
+        + _colunas_xml(_larguras_principal(larguras))
+        + '<sheetData>'
+    )
+
+    # Cabeçalho, dados iniciais e títulos da tabela (linhas 1 a 14)
+    linhas = {}
+    for (row, col_idx), (valor, estilo) in sorted(celulas.items()):
+        linhas.setdefault(row, []).append(
+            (get_column_letter(col_idx), _fragmento_celula(valor, indices[estilo], textos))
+        )
+    for row, celulas_linha in linhas.items():
+        parte.escrever(_linha_xml(row, celulas_linha))
+
+    # Dados das cobranças
+    estilos_linha = [indices['med_celula']] * 7
+    estilos_linha[5] = indices['med_celula_moeda']
+    colunas = "BCDEFGH"
+    row = LINHA_HEADER_DETALHAMENTO
+    for dados_linha in _linhas_detalhamento(medicao):
+        row += 1
+        parte.escrever(_linha_xml(row, [
+            (coluna, _fragmento_celula(valor, estilo, textos))
+            for coluna, valor, estilo in zip(colunas, dados_linha, estilos_linha)
+        ]))
+
+    # Total
+    row += 1
+    parte.escrever(_linha_xml(row, [
+        ("B", _fragmento_celula("Valor total da cobrança", indices['med_rotulo'], textos)),
+        ("G", _fragmento_celula(medicao.total_centavos / 100, indices['med_total'], textos)),
+    ]))
+
+    merges = list(merges) + [f'B{row}:E{row}']
+    parte.escrever(
+        '</sheetData>' + protecao
+        + f'<mergeCells count="{len(merges)}">'
+        + ''.join(f'<mergeCell ref="{merge}" />' for merge in merges)
+        + '</mergeCells>' + _FIM_PLANILHA
+    )
+
+def _escrever_bd_xml(parte: _GravadorParte, tabela: TabelaBD, indices: dict, protecao: str):
+    """Planilha de dados (mesmo layout de formatar_tabela_bd)"""
+    larguras, linhas = _prepassada_bd(tabela)
+    ultima_coluna = get_column_letter(len(tabela.header))
+    textos = {}
+
+    parte.escrever(
+        _INICIO_PLANILHA
+        + f'<dimension ref="A1:{ultima_coluna}{linhas + 1}" />'
+        + '<sheetViews><sheetView workbookViewId="0">'
+        + '<selection activeCell="A1" sqref="A1" /></sheetView></sheetViews>'
+        + '<sheetFormatPr baseColWidth="8" defaultRowHeight="15" />'
+        + _colunas_xml(larguras)
+        + '<sheetData>'
+    )
+
+    colunas = [get_column_letter(col_idx) for col_idx in range(1, len(tabela.header) + 1)]
+    estilo_header = indices['bd_header']
+    parte.escrever(_linha_xml(1, [
+        (coluna, _fragmento_celula(titulo, estilo_header, textos))
+        for coluna, titulo in zip(colunas, tabela.header)
+    ]))
+
+    # Os dados fixos são iguais em todas as linhas: fragmentos montados uma vez
+    celulas_fixas = [
+        (coluna, _fragmento_celula(valor, 0, textos))
+        for coluna, valor in zip(colunas, tabela.fixos)
+    ]
+    colunas_detalhe = colunas[len(tabela.fixos):]
+    row = 1
+    for detalhe in tabela.detalhes():
+        row += 1
+        parte.escrever(_linha_xml(row, celulas_fixas + [
+            (coluna, _fragmento_celula(valor, 0, textos))
+            for coluna, valor in zip(colunas_detalhe, detalhe)
+        ]))
+
+    parte.escrever(
+        '</sheetData>' + protecao
+        + f'<autoFilter ref="A1:{ultima_coluna}1" />' + _FIM_PLANILHA
+    )
+
+def gravar_xlsx_direto(medicao: Medicao, destino, data_geracao: Optional[date] = None,
+                       layout_bd: Optional[str] = None):
+    """Grava o .xlsx da medição em `destino` escrevendo o XML diretamente (motor "xml")"""
+    data_geracao = data_geracao or date.today()
+    tabelas = _tabelas_bd(medicao, layout_bd)
+    partes, indices, protecao_medicoes, protecao_bd = _partes_fixas_xml(
+        tuple((tabela.titulo, len(tabela.header)) for tabela in tabelas)
+    )
+
+    archive = _ZipDeterministico(destino, 'w', ZIP_DEFLATED, allowZip64=True)
+    with archive:
+        for nome in ("docProps/app.xml", "docProps/core.xml", "xl/theme/theme1.xml"):
+            archive.writestr(nome, partes[nome])
+
+        zinfo = zipinfo_deterministico("xl/worksheets/sheet1.xml")
+        with archive.open(zinfo, 'w', force_zip64=True) as saida:
+            parte = _GravadorParte(saida)
+            _escrever_medicoes_xml(parte, medicao, data_geracao, indices, protecao_medicoes)
+            parte.descarregar()
+
+        for numero, tabela in enumerate(tabelas, 2):
+            zinfo = zipinfo_deterministico(f"xl/worksheets/sheet{numero}.xml")
+            with archive.open(zinfo, 'w', force_zip64=True) as saida:
+                parte = _GravadorParte(saida)
+                _escrever_bd_xml(parte, tabela, indices, protecao_bd)
+                parte.descarregar()
+
+        for nome in ("xl/styles.xml", "_rels/.rels", "xl/workbook.xml",
+                     "xl/_rels/workbook.xml.rels", "[Content_Types].xml"):
+            archive.writestr(nome, partes[nome])
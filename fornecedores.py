@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from validacao import normalizar_cnpj, cnpjs_validos
+
+# ============================================================
+# CADASTRO LOCAL DE FORNECEDORES (POR CNPJ)
+# ============================================================
+#
+# Cada medição gerada registra o CNPJ do fornecedor com a empresa, o
+# advogado e o tipo de documento usados. Ao digitar um CNPJ conhecido, a
+# página Dados Iniciais já vem preenchida com a combinação mais frequente
+# daquele fornecedor. A chave é o CNPJ normalizado (numérico ou alfanumérico).
+#
+# O banco SQLite fica em fornecedores.db, ao lado deste módulo, ou no
+# caminho da variável de ambiente MEDICOES_FORNECEDORES. As consultas passam
+# por um cache LRU em memória; o registro de uma medição invalida a entrada
+# do CNPJ no cache deste processo. CNPJs ainda desconhecidos não entram no
+# cache, para que um fornecedor registrado por outra réplica ou pelo lote
+# seja encontrado na consulta seguinte.
+
+VARIAVEL_FORNECEDORES = "MEDICOES_FORNECEDORES"
+CAMINHO_FORNECEDORES = Path(__file__).with_name("fornecedores.db")
+
+TAMANHO_CACHE_FORNECEDORES = 1024
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS fornecedor_uso (
+    cnpj TEXT NOT NULL,
+    empresa TEXT NOT NULL,
+    advogado TEXT NOT NULL,
+    tipo_doc TEXT NOT NULL,
+    medicoes INTEGER NOT NULL,
+    ultima_medicao TEXT NOT NULL,
+    PRIMARY KEY (cnpj, empresa, advogado, tipo_doc)
+) WITHOUT ROWID
+"""
+
+@dataclass(frozen=True, slots=True)
+class Fornecedor:
+    """Dados habituais de um fornecedor, deduzidos das medições anteriores"""
+    cnpj: str
+    empresa: str
+    advogado: str
+    tipo_doc: str
+    medicoes: int
+    ultima_medicao: str
+
+class CadastroFornecedores:
+    """Fornecedores por CNPJ (SQLite), com cache LRU das consultas"""
+
+    def __init__(self, caminho, tamanho_cache: int = TAMANHO_CACHE_FORNECEDORES):
+        self.caminho = str(caminho)
+        self.tamanho_cache = tamanho_cache
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._preparado = False
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, timeout=10)
+        if not self._preparado:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute(_ESQUEMA)
+            self._preparado = True
+        return conexao
+
+    def buscar(self, cnpj: str) -> Optional[Fornecedor]:
+        """Fornecedor do CNPJ (ou None), com a combinação mais usada e, no empate, a mais recente"""
+        chave = normalizar_cnpj(cnpj)
+        if not chave:
+            return None
+
+        with self._lock:
+            if chave in self._cache:
+                self._cache.move_to_end(chave)
+                return self._cache[chave]
+
+        conexao = self._conectar()
+        try:
+            linha = conexao.execute(
+                "SELECT empresa, advogado, tipo_doc, medicoes, ultima_medicao FROM fornecedor_uso "
+                "WHERE cnpj = ? ORDER BY medicoes DESC, ultima_medicao DESC LIMIT 1",
+                (chave,)
+            ).fetchone()
+        finally:
+            conexao.close()
+        if linha is None:
+            return None
+        fornecedor = Fornecedor(chave, *linha)
+
+        with self._lock:
+            self._cache[chave] = fornecedor
+            self._cache.move_to_end(chave)
+            while len(self._cache) > self.tamanho_cache:
+                self._cache.popitem(last=False)
+        return fornecedor
+
+    def registrar(self, dados_iniciais: dict):
+        """Registra mais uma medição do fornecedor com a empresa, o advogado e o tipo de documento"""
+        if normalizar_cnpj(dados_iniciais.get('cnpj')):
+            self._gravar([dados_iniciais])
+
+    def importar(self, registros: list) -> List[int]:
+        """Registra de uma vez medições anteriores (dicts com cnpj, empresa, advogado, tipo_doc)
+
+        Os CNPJs são validados em lote; devolve os números (a partir de 1) dos
+        registros rejeitados por CNPJ inválido.
+        """
+        validos = cnpjs_validos([registro.get('cnpj') for registro in registros]).tolist()
+        self._gravar([registro for registro, valido in zip(registros, validos) if valido])
+        return [numero for numero, valido in enumerate(validos, start=1) if not valido]
+
+    def _gravar(self, registros: list):
+        agora = datetime.now().isoformat(timespec='seconds')
+        linhas = [
+            (
+                normalizar_cnpj(registro.get('cnpj')), registro.get('empresa') or "",
+                registro.get('advogado') or "", registro.get('tipo_doc') or "", agora
+            )
+            for registro in registros
+        ]
+        if not linhas:
+            return
+
+        conexao = self._conectar()
+        try:
+            with conexao:
+                conexao.executemany(
+                    "INSERT INTO fornecedor_uso VALUES (?, ?, ?, ?, 1, ?) "
+                    "ON CONFLICT (cnpj, empresa, advogado, tipo_doc) DO UPDATE SET "
+                    "medicoes = medicoes + 1, ultima_medicao = excluded.ultima_medicao",
+                    linhas
+                )
+        finally:
+            conexao.close()
+
+        with self._lock:
+            for linha in linhas:
+                self._cache.pop(linha[0], None)
+
+_cadastros = {}
+_lock_cadastros = threading.Lock()
+
+def obter_cadastro_fornecedores() -> CadastroFornecedores:
+    """Cadastro de fornecedores do processo (variável MEDICOES_FORNECEDORES ou fornecedores.db)"""
+    caminho = os.environ.get(VARIAVEL_FORNECEDORES) or str(CAMINHO_FORNECEDORES)
+    with _lock_cadastros:
+        if caminho not in _cadastros:
+            _cadastros[caminho] = CadastroFornecedores(caminho)
+        return _cadastros[caminho]
@@ -0,0 +1,105 @@
+from typing import List, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from catalogo import obter_catalogo
+from importacao import cobranca_de_registro
+
+# ============================================================
+# GRADE DE COBRANÇAS (MODO TABELA DO DETALHAMENTO)
+# ============================================================
+#
+# Uma linha por cobrança, editada com st.data_editor. Os indicadores Sim/Não
+# (possui Nº Espaider, projeto vinculado, mais cobranças) são deduzidos das
+# células preenchidas, como na importação de planilhas, e os textos breves
+# são calculados a partir do tipo de cobrança e da matéria.
+
+# Coluna da grade -> campo da cobrança
+COLUNAS_GRADE = {
+    "Nº Espaider": 'n_espaider',
+    "Matéria": 'materia',
+    "Projeto vinculado": 'projeto',
+    "Trecho": 'trecho',
+    "Tipo de cobrança": 'tipo_1',
+    "Valor (R$)": 'valor_1',
+    "Texto Breve": 'texto_1',
+    "Tipo de cobrança (secundária)": 'tipo_2',
+    "Valor secundário (R$)": 'valor_2',
+    "Texto Breve (secundária)": 'texto_2',
+}
+
+COLUNAS_CALCULADAS = ["Texto Breve", "Texto Breve (secundária)"]
+
+def linha_grade(cobranca: dict) -> dict:
+    """Uma cobrança como linha da grade (células vazias como None)"""
+    return {coluna: cobranca.get(campo) or None for coluna, campo in COLUNAS_GRADE.items()}
+
+def tabela_grade(cobrancas: list) -> pd.DataFrame:
+    """Tabela exibida na grade; o índice é o número da cobrança"""
+    tabela = pd.DataFrame(
+        [linha_grade(cobranca) for cobranca in cobrancas], columns=list(COLUNAS_GRADE), dtype=object
+    )
+    tabela.index = pd.RangeIndex(1, len(tabela) + 1, name="Cobrança")
+    return tabela
+
+def cobranca_da_linha(linha: dict) -> dict:
+    """Converte uma linha da grade no formato de st.session_state.cobrancas"""
+    registro = {
+        campo: linha.get(coluna)
+        for coluna, campo in COLUNAS_GRADE.items()
+        if coluna not in COLUNAS_CALCULADAS
+    }
+    return cobranca_de_registro(registro)
+
+def aplicar_alteracoes_grade(cobrancas: list, alteracoes: dict) -> Tuple[list, List[str]]:
+    """Aplica às cobranças o diff do st.data_editor (edited_rows, deleted_rows, added_rows)
+
+    Só as linhas alteradas são convertidas de novo. Posições seguem a tabela
+    exibida antes da edição. Valores ilegíveis ficam vazios e são devolvidos
+    como avisos.
+    """
+    novas = list(cobrancas)
+    avisos = []
+
+    def converter(numero, linha):
+        try:
+            return cobranca_da_linha(linha)
+        except ValueError as e:
+            avisos.append(f"Cobrança {numero}: {e}")
+            return cobranca_da_linha({**linha, "Valor (R$)": None, "Valor secundário (R$)": None})
+
+    for posicao, mudancas in alteracoes.get('edited_rows', {}).items():
+        posicao = int(posicao)
+        novas[posicao] = converter(posicao + 1, {**linha_grade(novas[posicao]), **mudancas})
+
+    for posicao in sorted(alteracoes.get('deleted_rows', []), reverse=True):
+        del novas[posicao]
+
+    for linha in alteracoes.get('added_rows', []):
+        novas.append(converter(len(novas) + 1, linha))
+
+    return novas, avisos
+
+def configuracao_colunas_grade(empresa: str) -> dict:
+    """column_config da grade: listas de seleção a partir dos cadastros da empresa"""
+    catalogo = obter_catalogo()
+    projetos = [p for p in catalogo.projetos(empresa).valores if p]
+    # O st.data_editor não tem listas dependentes por linha: o Trecho oferece os
+    # trechos de todos os projetos da empresa e a validação confere o par projeto/trecho
+    trechos = list(catalogo.trechos_empresa.get(empresa, ()))
+
+    texto = st.column_config.TextColumn
+    selecao = st.column_config.SelectboxColumn
+    return {
+        "Nº Espaider": texto("Nº Espaider"),
+        "Matéria": selecao("Matéria*", options=catalogo.materias.valores[1:]),
+        "Projeto vinculado": selecao("Projeto vinculado", options=projetos),
+        "Trecho": selecao("Trecho", options=trechos, disabled=not trechos),
+        "Tipo de cobrança": selecao("Tipo de cobrança*", options=catalogo.tipos_cobranca.valores[1:]),
+        "Valor (R$)": texto("Valor (R$)*", help="Ex.: 1.234,56"),
+        "Texto Breve": texto("Texto Breve", disabled=True),
+        "Tipo de cobrança (secundária)": selecao("Tipo de cobrança (secundária)", options=catalogo.tipos_cobranca.valores[1:]),
+        "Valor secundário (R$)": texto("Valor secundário (R$)", help="Ex.: 1.234,56"),
+        "Texto Breve (secundária)": texto("Texto Breve (secundária)", disabled=True),
+    }
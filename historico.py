@@ -0,0 +1,213 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from modelo import Medicao
+from exportacao import id_medicao
+
+# ============================================================
+# HISTÓRICO DAS MEDIÇÕES FINALIZADAS (SQLITE)
+# ============================================================
+#
+# Cada medição exportada é acrescentada ao histórico uma única vez (id_medicao
+# único; finalizar de novo a mesma medição não duplica o registro): uma linha
+# em `medicao` com os dados iniciais e uma linha em `cobranca_bloco` por bloco
+# (bloco_1 e, se houver, bloco_2) de cada cobrança. Os índices atendem às consultas por
+# CNPJ, empresa, advogado e data de emissão (medicao) e por Nº Espaider e
+# matéria (cobranca_bloco).
+#
+# A gravação não atrasa o clique de finalizar: registrar() só enfileira a
+# medição, e uma thread grava cada uma em uma única transação, com os blocos
+# inseridos em lote. Se o banco estiver indisponível, a medição volta para a
+# fila e a gravação é repetida depois de INTERVALO_NOVA_TENTATIVA segundos.
+# Outros erros não se resolvem repetindo: a medição é descartada (o erro vai
+# para o log e o id_medicao para `descartadas`, com as últimas
+# LIMITE_DESCARTADAS) e a fila segue com as demais.
+#
+# O banco fica em historico.db, ao lado deste módulo, ou no caminho da
+# variável de ambiente MEDICOES_HISTORICO.
+
+VARIAVEL_HISTORICO = "MEDICOES_HISTORICO"
+CAMINHO_HISTORICO = Path(__file__).with_name("historico.db")
+
+INTERVALO_NOVA_TENTATIVA = 5.0
+
+# Medições descartadas lembradas (id_medicao, finalizada_em, erro)
+LIMITE_DESCARTADAS = 100
+
+_log = logging.getLogger(__name__)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS medicao (
+    id INTEGER PRIMARY KEY,
+    id_medicao TEXT NOT NULL UNIQUE,
+    finalizada_em TEXT NOT NULL,
+    cnpj TEXT NOT NULL,
+    empresa TEXT NOT NULL,
+    advogado TEXT NOT NULL,
+    tipo_doc TEXT NOT NULL,
+    data_prevista TEXT NOT NULL,
+    existe_contrato TEXT NOT NULL,
+    n_contrato TEXT NOT NULL,
+    existe_pedido TEXT NOT NULL,
+    n_pedido TEXT NOT NULL,
+    n_medicao TEXT NOT NULL,
+    breve_desc TEXT NOT NULL,
+    qtd_cobrancas INTEGER NOT NULL,
+    total_centavos INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS medicao_cnpj ON medicao (cnpj);
+CREATE INDEX IF NOT EXISTS medicao_empresa ON medicao (empresa);
+CREATE INDEX IF NOT EXISTS medicao_advogado ON medicao (advogado);
+CREATE INDEX IF NOT EXISTS medicao_data_prevista ON medicao (data_prevista);
+
+CREATE TABLE IF NOT EXISTS cobranca_bloco (
+    medicao_id INTEGER NOT NULL REFERENCES medicao (id),
+    num_cobranca INTEGER NOT NULL,
+    bloco INTEGER NOT NULL,
+    possui_espaider TEXT,
+    n_espaider TEXT NOT NULL,
+    possui_projeto TEXT,
+    projeto TEXT NOT NULL,
+    trecho TEXT NOT NULL,
+    materia TEXT,
+    tipo TEXT,
+    materia_bloco TEXT,
+    texto_breve TEXT,
+    centavos INTEGER NOT NULL,
+    PRIMARY KEY (medicao_id, num_cobranca, bloco)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cobranca_bloco_n_espaider ON cobranca_bloco (n_espaider);
+CREATE INDEX IF NOT EXISTS cobranca_bloco_materia ON cobranca_bloco (materia);
+"""
+
+class HistoricoMedicoes:
+    """Histórico das medições finalizadas (SQLite), gravado em segundo plano"""
+
+    def __init__(self, caminho):
+        self.caminho = str(caminho)
+        self.ultimo_erro = None
+        self.descartadas = deque(maxlen=LIMITE_DESCARTADAS)  # (id_medicao, finalizada_em, erro)
+        self._fila = deque()  # (medição, finalizada_em) aguardando gravação
+        self._condicao = threading.Condition()
+        self._lock_gravacao = threading.Lock()
+        self._thread = None
+        self._preparado = False
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, timeout=10)
+        if not self._preparado:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.executescript(_ESQUEMA)
+            self._preparado = True
+        return conexao
+
+    def registrar(self, medicao: Medicao):
+        """Enfileira a medição finalizada para gravação no histórico (retorna imediatamente)"""
+        finalizada_em = datetime.now().isoformat(timespec='seconds')
+        with self._condicao:
+            self._fila.append((medicao, finalizada_em))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name="historico-medicoes", daemon=True)
+                self._thread.start()
+            self._condicao.notify()
+
+    def descarregar(self):
+        """Grava imediatamente as medições enfileiradas"""
+        self._gravar_fila()
+
+    def _gravar_fila(self) -> bool:
+        """Grava as medições da fila; False se o banco falhou (a medição com erro volta para a fila)"""
+        with self._lock_gravacao:
+            while True:
+                with self._condicao:
+                    if not self._fila:
+                        return True
+                    medicao, finalizada_em = self._fila.popleft()
+                try:
+                    self._gravar(medicao, finalizada_em)
+                    self.ultimo_erro = None
+                except sqlite3.Error as e:
+                    self.ultimo_erro = e
+                    with self._condicao:
+                        self._fila.appendleft((medicao, finalizada_em))
+                    return False
+                except Exception as e:
+                    try:
+                        identificador = id_medicao(medicao)
+                    except Exception:
+                        identificador = None
+                    _log.exception("Medição %s descartada do histórico", identificador)
+                    self.ultimo_erro = e
+                    self.descartadas.append((identificador, finalizada_em, repr(e)))
+
+    def _gravar(self, medicao: Medicao, finalizada_em: str):
+        dados = medicao.dados_iniciais
+        linha_medicao = (
+            id_medicao(medicao), finalizada_em,
+            dados.cnpj, dados.empresa, dados.advogado, dados.tipo_doc, dados.data_prevista.isoformat(),
+            dados.existe_contrato, dados.n_contrato, dados.existe_pedido, dados.n_pedido,
+            dados.n_medicao, dados.breve_desc, len(medicao.cobrancas), medicao.total_centavos
+        )
+
+        conexao = self._conectar()
+        try:
+            with conexao:
+                cursor = conexao.execute(
+                    "INSERT OR IGNORE INTO medicao (id_medicao, finalizada_em, cnpj, empresa, advogado, tipo_doc, "
+                    "data_prevista, existe_contrato, n_contrato, existe_pedido, n_pedido, n_medicao, "
+                    "breve_desc, qtd_cobrancas, total_centavos) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    linha_medicao
+                )
+                if cursor.rowcount == 0:
+                    # Medição já registrada
+                    return
+                medicao_id = cursor.lastrowid
+                conexao.executemany(
+                    "INSERT INTO cobranca_bloco VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (
+                            medicao_id, num_cobranca, numero_bloco,
+                            cobranca.possui_espaider, cobranca.n_espaider or "",
+                            cobranca.possui_projeto, cobranca.projeto or "", cobranca.trecho or "",
+                            cobranca.materia, bloco.tipo, bloco.materia, bloco.texto_breve, bloco.centavos
+                        )
+                        for num_cobranca, cobranca in enumerate(medicao.cobrancas, start=1)
+                        for numero_bloco, bloco in enumerate(cobranca.blocos, start=1)
+                    )
+                )
+        finally:
+            conexao.close()
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not self._fila:
+                    self._condicao.wait()
+            try:
+                gravou = self._gravar_fila()
+            except Exception as e:
+                _log.exception("Falha na gravação do histórico")
+                self.ultimo_erro, gravou = e, False
+            if not gravou:
+                with self._condicao:
+                    self._condicao.wait(timeout=INTERVALO_NOVA_TENTATIVA)
+
+_historicos = {}
+_lock_historicos = threading.Lock()
+
+def obter_historico_medicoes() -> HistoricoMedicoes:
+    """Histórico de medições do processo (variável MEDICOES_HISTORICO ou historico.db)"""
+    caminho = os.environ.get(VARIAVEL_HISTORICO) or str(CAMINHO_HISTORICO)
+    with _lock_historicos:
+        if caminho not in _historicos:
+            historico = HistoricoMedicoes(caminho)
+            atexit.register(historico.descarregar)
+            _historicos[caminho] = historico
+        return _historicos[caminho]
@@ -0,0 +1,188 @@
+import io
+import re
+import unicodedata
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from validacao import atualizar_texto_breve, validar_cobrancas_lote, TEXTO_AGUARDANDO
+from modelo import formatar_centavos, ler_valor_centavos
+
+# ============================================================
+# IMPORTAÇÃO DE COBRANÇAS (PLANILHA CSV/XLSX)
+# ============================================================
+#
+# Cada linha da planilha é uma cobrança. As colunas podem usar os nomes
+# curtos (n_espaider, materia, ...) ou os rótulos do formulário / da
+# planilha exportada ("Nº Espaider", "Matéria", ...). Acentos, maiúsculas e
+# espaços nos cabeçalhos são ignorados.
+
+EXTENSOES_IMPORTACAO = ('.csv', '.xlsx')
+
+COLUNAS_IMPORTACAO = {
+    'possui_espaider': ["possui_espaider", "Possui Nº Espaider?"],
+    'n_espaider': ["n_espaider", "Nº Espaider", "N Espaider", "Espaider"],
+    'possui_projeto': ["possui_projeto", "Possui projeto vinculado?"],
+    'projeto': ["projeto", "Projeto vinculado", "Projeto"],
+    'trecho': ["trecho", "Trecho"],
+    'materia': ["materia", "Matéria", "Matéria Jurídica"],
+    'tipo_1': ["tipo_1", "Tipo de Cobrança", "Tipo de Cobrança (principal)", "Tipo"],
+    'valor_1': ["valor_1", "Valor", "Valor (principal)", "Valor (R$)"],
+    'mais_cobrancas': ["mais_cobrancas", "Há mais cobranças para esta linha?"],
+    'tipo_2': ["tipo_2", "Tipo de Cobrança (secundário)", "Tipo secundário"],
+    'valor_2': ["valor_2", "Valor (secundário)", "Valor secundário"],
+}
+
+def _normalizar_cabecalho(nome) -> str:
+    """Remove acentos, pontuação e maiúsculas de um cabeçalho de coluna"""
+    texto = unicodedata.normalize('NFKD', str(nome))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return re.sub(r'[^a-z0-9]+', '_', texto).strip('_')
+
+_CAMPO_POR_CABECALHO = {
+    _normalizar_cabecalho(rotulo): campo
+    for campo, rotulos in COLUNAS_IMPORTACAO.items()
+    for rotulo in rotulos
+}
+
+# ============================================================
+# CONVERSÃO DE REGISTROS
+# ============================================================
+
+def ler_texto(valor) -> str:
+    """Converte um campo lido do arquivo em texto sem espaços nas pontas"""
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        # Nº Espaider lido como número pelo Excel
+        return str(int(valor))
+    return str(valor).strip()
+
+def ler_sim_nao(valor, padrao: bool) -> str:
+    """Normaliza um indicador Sim/Não; sem valor, usa o padrão deduzido"""
+    texto = ler_texto(valor).lower()
+    if texto in ("sim", "s", "true", "1"):
+        return "Sim"
+    if texto in ("não", "nao", "n", "false", "0"):
+        return "Não"
+    return "Sim" if padrao else "Não"
+
+def ler_centavos(valor) -> Optional[int]:
+    """Converte um valor monetário do arquivo em centavos (None se vazio)
+
+    Números do Excel são convertidos diretamente; textos seguem a regra de
+    ler_valor_centavos ("1.234,56", "R$ 10", "1234.56").
+    """
+    if isinstance(valor, (int, float)) and not pd.isna(valor):
+        return round(valor * 100)
+    return ler_valor_centavos(ler_texto(valor))
+
+def cobranca_de_registro(registro: dict) -> dict:
+    """Converte um registro no formato de st.session_state.cobrancas
+
+    O texto breve é derivado do tipo de cobrança e da matéria, como no formulário.
+    """
+    n_espaider = ler_texto(registro.get('n_espaider'))
+    projeto = ler_texto(registro.get('projeto'))
+    trecho = ler_texto(registro.get('trecho'))
+    materia = ler_texto(registro.get('materia'))
+    tipo_1 = ler_texto(registro.get('tipo_1'))
+    tipo_2 = ler_texto(registro.get('tipo_2'))
+    valor_2 = registro.get('valor_2')
+    centavos_1 = ler_centavos(registro.get('valor_1'))
+
+    possui_espaider = ler_sim_nao(registro.get('possui_espaider'), bool(n_espaider))
+    possui_projeto = ler_sim_nao(registro.get('possui_projeto'), bool(projeto))
+    mais_cobrancas = ler_sim_nao(registro.get('mais_cobrancas'), bool(tipo_2 or ler_texto(valor_2)))
+
+    centavos_2 = ler_centavos(valor_2) if mais_cobrancas == "Sim" else None
+
+    def texto_breve(tipo):
+        return atualizar_texto_breve(tipo, materia) if tipo and materia else TEXTO_AGUARDANDO
+
+    return {
+        'possui_espaider': possui_espaider,
+        'n_espaider': n_espaider if possui_espaider == "Sim" else "",
+        'possui_projeto': possui_projeto,
+        'projeto': projeto if possui_projeto == "Sim" else "",
+        'trecho': trecho if possui_projeto == "Sim" else "",
+        'materia': materia,
+        'mais_cobrancas': mais_cobrancas,
+        'tipo_1': tipo_1,
+        'valor_1': formatar_centavos(centavos_1) if centavos_1 is not None else "",
+        'centavos_1': centavos_1 or 0,
+        'texto_1': texto_breve(tipo_1),
+        'tipo_2': tipo_2 if mais_cobrancas == "Sim" else "",
+        'valor_2': formatar_centavos(centavos_2) if centavos_2 is not None else "",
+        'centavos_2': centavos_2 or 0,
+        'texto_2': texto_breve(tipo_2) if mais_cobrancas == "Sim" else ""
+    }
+
+def importar_cobrancas(registros: list, empresa: str) -> Tuple[list, List[Tuple[int, str]]]:
+    """Converte e valida os registros de cobranças
+
+    Devolve (cobranças, erros); cada erro é (nº do registro, começando em 1, mensagem).
+    Aplica as regras do formulário e confere os campos contra os cadastros.
+    """
+    cobrancas = []
+    erros_leitura = []
+
+    for numero, registro in enumerate(registros, start=1):
+        try:
+            cobranca = cobranca_de_registro(registro)
+        except ValueError as e:
+            # Valor ilegível: a linha segue para as demais regras, sem repetir o erro de valor
+            erros_leitura.append((numero, str(e)))
+            cobranca = cobranca_de_registro({**registro, 'valor_1': None, 'valor_2': None})
+        cobrancas.append(cobranca)
+
+    tabela_erros, _ = validar_cobrancas_lote(cobrancas, empresa)
+    linhas_ilegiveis = {numero for numero, _ in erros_leitura}
+    erros = erros_leitura + [
+        (int(numero), erro)
+        for numero, campo, erro in tabela_erros.itertuples(index=False)
+        if not (numero in linhas_ilegiveis and campo in ('valor_1', 'valor_2'))
+    ]
+    erros.sort(key=lambda item: item[0])
+
+    return cobrancas, erros
+
+# ============================================================
+# LEITURA DA PLANILHA
+# ============================================================
+
+def ler_planilha_cobrancas(conteudo: bytes, nome_arquivo: str) -> list:
+    """Lê uma planilha .csv ou .xlsx e devolve um registro (dict) por linha preenchida"""
+    extensao = Path(nome_arquivo).suffix.lower()
+    if extensao not in EXTENSOES_IMPORTACAO:
+        raise ValueError(f"Formato não suportado: '{extensao}'. Use .csv ou .xlsx")
+
+    if extensao == '.csv':
+        tabela = pd.read_csv(
+            io.BytesIO(conteudo), sep=None, engine='python', dtype=str,
+            keep_default_na=False, encoding='utf-8-sig'
+        )
+    else:
+        # Sem dtype=str: valores numéricos do Excel chegam como número em ler_centavos
+        tabela = pd.read_excel(io.BytesIO(conteudo), dtype=object)
+
+    colunas = {}
+    for coluna in tabela.columns:
+        campo = _CAMPO_POR_CABECALHO.get(_normalizar_cabecalho(coluna))
+        if campo and campo not in colunas.values():
+            colunas[coluna] = campo
+
+    if not any(campo in colunas.values() for campo in ('materia', 'tipo_1', 'valor_1')):
+        raise ValueError("Nenhuma coluna reconhecida. Use o modelo de importação")
+
+    tabela = tabela[list(colunas)].rename(columns=colunas)
+    registros = tabela.to_dict('records')
+    return [r for r in registros if any(ler_texto(v) for v in r.values())]
+
+def modelo_importacao_csv() -> bytes:
+    """Planilha-modelo (CSV com ';') com os cabeçalhos aceitos na importação"""
+    cabecalho = ["n_espaider", "materia", "projeto", "trecho", "tipo_1", "valor_1", "tipo_2", "valor_2"]
+    exemplo = ["123456", "Trabalhista", "", "", "Honorários Advocatícios (Prolabore)", "1.500,00", "", ""]
+    linhas = [";".join(cabecalho), ";".join(exemplo)]
+    return ("\r\n".join(linhas) + "\r\n").encode('utf-8-sig')
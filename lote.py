@@ -0,0 +1,281 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from pathlib import Path
+
+from validacao import formatar_cnpj, validar_dados_iniciais, montar_dados_coletados
+from importacao import ler_texto, ler_sim_nao, importar_cobrancas
+from modelo import Medicao
+from exportacao import gerar_excel_bytes, LAYOUTS_BD
+from colunar import gravar_colunar, FORMATOS_COLUNARES
+from fornecedores import obter_cadastro_fornecedores
+
+# ============================================================
+# GERAÇÃO EM LOTE DE MEDIÇÕES (LINHA DE COMANDO)
+# ============================================================
+#
+# Uso:
+#   python lote.py PASTA_ENTRADA --saida PASTA_SAIDA [--zip pacote.zip] [--processos N]
+#                  [--layout-bd completo|normalizado] [--colunar csv|parquet]
+#
+# Cada arquivo .json ou .csv da pasta de entrada é uma medição.
+#
+# JSON: {"dados_iniciais": {...}, "cobrancas": [{...}, ...]}
+# CSV:  uma linha por cobrança; os dados iniciais são lidos da primeira linha.
+#
+# Campos dos dados iniciais: cnpj, empresa, advogado, tipo_doc, data_prevista
+# (AAAA-MM-DD ou DD/MM/AAAA), n_contrato, n_pedido, n_medicao, breve_desc.
+# Campos das cobranças: n_espaider, materia, projeto, trecho, tipo_1, valor_1,
+# tipo_2, valor_2. Os indicadores Sim/Não (existe_contrato, possui_espaider,
+# mais_cobrancas, ...) são opcionais e, se ausentes, deduzidos dos campos
+# preenchidos. Valores em texto seguem o padrão brasileiro ("1.234,56").
+#
+# Com --colunar, as linhas da planilha BD também são gravadas em um arquivo
+# .csv ou .parquet de mesmo nome, ao lado do .xlsx (ver colunar.py).
+#
+# Como no aplicativo, as medições geradas são registradas no cadastro de
+# fornecedores (fornecedores.py), de uma vez ao fim do lote, com os CNPJs
+# validados em bloco.
+
+EXTENSOES_ENTRADA = ('.json', '.csv')
+
+class ErroMedicao(ValueError):
+    """Medição rejeitada pela validação"""
+
+    def __init__(self, erros):
+        super().__init__("; ".join(erros))
+        self.erros = erros
+
+def ler_data(valor) -> date:
+    """Lê a data prevista nos formatos AAAA-MM-DD ou DD/MM/AAAA"""
+    if isinstance(valor, date):
+        return valor
+    texto = ler_texto(valor)
+    for formato in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ErroMedicao([f"Data prevista de emissão inválida: '{texto}'"])
+
+def dados_iniciais_de_registro(registro: dict) -> dict:
+    """Converte um registro no formato dos dados iniciais (antes da validação)"""
+    n_contrato = ler_texto(registro.get('n_contrato'))
+    n_pedido = ler_texto(registro.get('n_pedido'))
+    existe_contrato = ler_sim_nao(registro.get('existe_contrato'), bool(n_contrato))
+    existe_pedido = ler_sim_nao(registro.get('existe_pedido'), bool(n_pedido))
+
+    return {
+        "cnpj": ler_texto(registro.get('cnpj')),
+        "empresa": ler_texto(registro.get('empresa')),
+        "advogado": ler_texto(registro.get('advogado')),
+        "tipo_doc": ler_texto(registro.get('tipo_doc')),
+        "data_prevista": registro.get('data_prevista'),
+        "existe_contrato": existe_contrato,
+        "n_contrato": n_contrato if existe_contrato == "Sim" else "",
+        "existe_pedido": existe_pedido,
+        "n_pedido": n_pedido if existe_pedido == "Sim" else "",
+        "n_medicao": ler_texto(registro.get('n_medicao')),
+        "breve_desc": ler_texto(registro.get('breve_desc'))
+    }
+
+def ler_arquivo_medicao(caminho) -> tuple:
+    """Lê um arquivo .json ou .csv e devolve (registro dos dados iniciais, registros das cobranças)"""
+    caminho = Path(caminho)
+
+    if caminho.suffix.lower() == '.json':
+        with open(caminho, encoding='utf-8-sig') as arquivo:
+            conteudo = json.load(arquivo)
+        return conteudo.get('dados_iniciais', {}), conteudo.get('cobrancas', [])
+
+    with open(caminho, encoding='utf-8-sig', newline='') as arquivo:
+        amostra = arquivo.read(4096)
+        arquivo.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t')
+        except csv.Error:
+            dialeto = csv.excel
+        linhas = list(csv.DictReader(arquivo, dialect=dialeto))
+
+    return (linhas[0] if linhas else {}), linhas
+
+def preparar_medicao(registro_dados: dict, registros_cobrancas: list) -> Medicao:
+    """Valida os registros com as mesmas regras das páginas e dos cadastros e monta a Medicao"""
+    dados_iniciais = dados_iniciais_de_registro(registro_dados)
+    cobrancas, erros_cobrancas = importar_cobrancas(registros_cobrancas, dados_iniciais['empresa'])
+
+    erros = validar_dados_iniciais(dados_iniciais)
+    if not registros_cobrancas:
+        erros.append("Nenhuma cobrança informada")
+    erros += [f"Cobrança {numero}: {erro}" for numero, erro in erros_cobrancas]
+    try:
+        dados_iniciais['data_prevista'] = ler_data(dados_iniciais['data_prevista'])
+    except ErroMedicao as e:
+        erros += e.erros
+    if erros:
+        raise ErroMedicao(erros)
+
+    dados_iniciais['cnpj'] = formatar_cnpj(dados_iniciais['cnpj'])
+
+    return Medicao.de_sessao(dados_iniciais, montar_dados_coletados(cobrancas))
+
+def processar_arquivo(caminho: str, caminho_saida: str, data_geracao=None, layout_bd=None,
+                      formato_colunar=None) -> dict:
+    """Gera o .xlsx de um arquivo de medição (executado nos processos do pool)"""
+    resultado = {
+        "arquivo": caminho, "saida": None, "saida_colunar": None, "cobrancas": 0, "fornecedor": None,
+        "erros": []
+    }
+    try:
+        registro_dados, registros_cobrancas = ler_arquivo_medicao(caminho)
+        medicao = preparar_medicao(registro_dados, registros_cobrancas)
+        conteudo = gerar_excel_bytes(medicao, data_geracao, layout_bd=layout_bd)
+
+        with open(caminho_saida, 'wb') as arquivo:
+            arquivo.write(conteudo)
+
+        if formato_colunar:
+            caminho_colunar = str(Path(caminho_saida).with_suffix(f".{formato_colunar}"))
+            with open(caminho_colunar, 'wb') as arquivo:
+                gravar_colunar(medicao, arquivo, formato_colunar)
+            resultado["saida_colunar"] = caminho_colunar
+
+        resultado["saida"] = caminho_saida
+        resultado["cobrancas"] = len(medicao.cobrancas)
+        dados = medicao.dados_iniciais
+        resultado["fornecedor"] = {
+            "cnpj": dados.cnpj, "empresa": dados.empresa, "advogado": dados.advogado, "tipo_doc": dados.tipo_doc
+        }
+    except ErroMedicao as e:
+        resultado["erros"] = e.erros
+    except Exception as e:
+        resultado["erros"] = [f"{type(e).__name__}: {e}"]
+    return resultado
+
+def listar_arquivos(pasta) -> list:
+    """Arquivos de medição da pasta, em ordem alfabética"""
+    return sorted(
+        str(caminho) for caminho in Path(pasta).iterdir()
+        if caminho.is_file() and caminho.suffix.lower() in EXTENSOES_ENTRADA
+    )
+
+def nomes_saida(arquivos: list) -> dict:
+    """Nome do .xlsx de cada arquivo de entrada (sem colisões entre .json e .csv)"""
+    radicais = [Path(caminho).stem for caminho in arquivos]
+    nomes = {}
+    for caminho, radical in zip(arquivos, radicais):
+        if radicais.count(radical) > 1:
+            radical = Path(caminho).name.replace('.', '_')
+        nomes[caminho] = f"{radical}.xlsx"
+    return nomes
+
+def gerar_lote(arquivos: list, pasta_saida: str, processos=None, data_geracao=None,
+               layout_bd=None, formato_colunar=None) -> list:
+    """Gera as medições em paralelo e devolve os resultados na ordem dos arquivos"""
+    os.makedirs(pasta_saida, exist_ok=True)
+    nomes = nomes_saida(arquivos)
+    resultados = {}
+
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        futuros = {
+            pool.submit(
+                processar_arquivo, caminho, os.path.join(pasta_saida, nomes[caminho]), data_geracao,
+                layout_bd, formato_colunar
+            ): caminho
+            for caminho in arquivos
+        }
+        for futuro in as_completed(futuros):
+            resultados[futuros[futuro]] = futuro.result()
+
+    return [resultados[caminho] for caminho in arquivos]
+
+def registrar_fornecedores(resultados: list):
+    """Registra no cadastro de fornecedores as medições geradas no lote (uma única gravação)"""
+    registros = [resultado["fornecedor"] for resultado in resultados if resultado["fornecedor"]]
+    try:
+        rejeitados = obter_cadastro_fornecedores().importar(registros)
+    except sqlite3.Error as e:
+        print(f"Não foi possível atualizar o cadastro de fornecedores: {e}", file=sys.stderr)
+        return
+    if rejeitados:
+        print(f"{len(rejeitados)} medições não registradas no cadastro de fornecedores (CNPJ inválido).",
+              file=sys.stderr)
+
+def empacotar_zip(resultados: list, caminho_zip: str):
+    """Reúne os arquivos gerados em um único .zip"""
+    with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_STORED) as pacote:
+        for resultado in resultados:
+            for saida in (resultado["saida"], resultado["saida_colunar"]):
+                if saida:
+                    pacote.write(saida, os.path.basename(saida))
+
+def imprimir_resumo(resultados: list, destino=sys.stdout):
+    """Imprime o resumo do lote, com os erros de cada medição rejeitada"""
+    falhas = [r for r in resultados if r["erros"]]
+
+    for resultado in resultados:
+        nome = os.path.basename(resultado["arquivo"])
+        if resultado["erros"]:
+            print(f"ERRO  {nome}", file=destino)
+            for erro in resultado["erros"]:
+                print(f"      - {erro}", file=destino)
+        else:
+            print(f"OK    {nome} -> {os.path.basename(resultado['saida'])} "
+                  f"({resultado['cobrancas']} cobranças)", file=destino)
+
+    print(f"\n{len(resultados) - len(falhas)} de {len(resultados)} medições geradas; "
+          f"{len(falhas)} com erro.", file=destino)
+
+def main(argv=None) -> int:
+    """Ponto de entrada da linha de comando"""
+    parser = argparse.ArgumentParser(
+        description="Gera em lote os arquivos Excel de medições jurídicas a partir de arquivos JSON/CSV."
+    )
+    parser.add_argument("entrada", help="pasta com os arquivos .json/.csv de medições")
+    parser.add_argument("--saida", help="pasta dos arquivos .xlsx gerados (padrão: ENTRADA/saida)")
+    parser.add_argument("--zip", dest="caminho_zip", help="gera um único pacote .zip em vez de arquivos soltos")
+    parser.add_argument("--processos", type=int, default=None,
+                        help="número de processos em paralelo (padrão: núcleos disponíveis)")
+    parser.add_argument("--data", type=ler_data, default=None,
+                        help="data do carimbo 'Data:' das planilhas (padrão: hoje)")
+    parser.add_argument("--layout-bd", choices=LAYOUTS_BD, default=None,
+                        help="layout das planilhas de dados: completo (dados iniciais em todas as linhas) "
+                             "ou normalizado (BD com uma linha por medição e BD_Cobranças com os detalhes)")
+    parser.add_argument("--colunar", choices=list(FORMATOS_COLUNARES), default=None,
+                        help="grava também as linhas da planilha BD em .csv ou .parquet (tipado, para ETL)")
+    args = parser.parse_args(argv)
+
+    arquivos = listar_arquivos(args.entrada)
+    if not arquivos:
+        print(f"Nenhum arquivo .json/.csv encontrado em {args.entrada}", file=sys.stderr)
+        return 1
+
+    if args.caminho_zip:
+        pasta_saida = tempfile.mkdtemp(prefix="medicoes_")
+    else:
+        pasta_saida = args.saida or os.path.join(args.entrada, "saida")
+
+    try:
+        resultados = gerar_lote(
+            arquivos, pasta_saida, args.processos, args.data, args.layout_bd, args.colunar
+        )
+        registrar_fornecedores(resultados)
+        if args.caminho_zip:
+            empacotar_zip(resultados, args.caminho_zip)
+    finally:
+        if args.caminho_zip:
+            shutil.rmtree(pasta_saida, ignore_errors=True)
+
+    imprimir_resumo(resultados)
+    return 1 if any(r["erros"] for r in resultados) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Optional
+
+# ============================================================
+# VALORES MONETÁRIOS (CENTAVOS)
+# ============================================================
+
+_DECIMAL_COM_PONTO = re.compile(r'\d*\.\d{1,2}')
+_PARTE_INTEIRA = re.compile(r'\d*|\d{1,3}(\.\d{3})+')
+
+def ler_valor_centavos(valor: str) -> Optional[int]:
+    """Converte um valor monetário em texto em centavos (None se vazio, ValueError se ilegível)
+
+    Regra única da digitação, da importação e do lote: "R$" e espaços são
+    ignorados; havendo vírgula, ela é o separador decimal ("1.234,56"); sem
+    vírgula, um único ponto seguido de 1 ou 2 dígitos é o separador decimal
+    ("1234.56", ".5"). Na parte inteira, os pontos só podem separar grupos de
+    três dígitos ("1.500", "12.345.678"). No máximo duas casas decimais.
+    """
+    texto = re.sub(r'\s', '', (valor or "").replace('R$', ''))
+    if not texto:
+        return None
+
+    if ',' in texto:
+        inteiro, _, decimal = texto.rpartition(',')
+    elif _DECIMAL_COM_PONTO.fullmatch(texto):
+        inteiro, _, decimal = texto.partition('.')
+    else:
+        inteiro, decimal = texto, ""
+
+    if not (inteiro or decimal) or not _PARTE_INTEIRA.fullmatch(inteiro) or not re.fullmatch(r'\d{0,2}', decimal):
+        raise ValueError(f"Valor inválido: '{valor}'")
+    return int(inteiro.replace('.', '') or 0) * 100 + int(decimal.ljust(2, '0'))
+
+def valor_em_centavos(valor: str) -> int:
+    """Como ler_valor_centavos, para valores digitados: vazios e ilegíveis valem 0"""
+    try:
+        return ler_valor_centavos(valor) or 0
+    except ValueError:
+        return 0
+
+def formatar_centavos(centavos: int) -> str:
+    """Formata centavos no padrão brasileiro ("1.234,56")"""
+    reais, resto = divmod(centavos, 100)
+    return f"{reais:,}".replace(",", ".") + f",{resto:02d}"
+
+def _categoria(texto):
+    """Reaproveita uma única cópia de textos repetidos (matéria, tipo, projeto, ...)"""
+    return sys.intern(texto) if isinstance(texto, str) else texto
+
+# ============================================================
+# MODELO TIPADO DA MEDIÇÃO
+# ============================================================
+#
+# As classes usam __slots__: cada cobrança validada fica guardada uma única
+# vez na sessão (st.session_state.dados_coletados), sem o __dict__ por
+# instância dos objetos comuns nem os dicionários aninhados por bloco.
+
+@dataclass(slots=True)
+class DadosIniciais:
+    """Dados fixos da medição (página Dados Iniciais)"""
+    cnpj: str
+    empresa: str
+    advogado: str
+    tipo_doc: str
+    data_prevista: date
+    existe_contrato: str = "Não"
+    n_contrato: str = ""
+    existe_pedido: str = "Não"
+    n_pedido: str = ""
+    n_medicao: str = ""
+    breve_desc: str = ""
+
+    @classmethod
+    def de_dict(cls, dados: dict) -> "DadosIniciais":
+        """Constrói a partir do dicionário usado em st.session_state.dados_iniciais"""
+        return cls(
+            cnpj=dados['cnpj'],
+            empresa=dados['empresa'],
+            advogado=dados['advogado'],
+            tipo_doc=dados['tipo_doc'],
+            data_prevista=dados['data_prevista'],
+            existe_contrato=dados.get('existe_contrato', 'Não'),
+            n_contrato=dados.get('n_contrato', ''),
+            existe_pedido=dados.get('existe_pedido', 'Não'),
+            n_pedido=dados.get('n_pedido', ''),
+            n_medicao=dados.get('n_medicao', ''),
+            breve_desc=dados.get('breve_desc', '')
+        )
+
+    @property
+    def contrato(self) -> str:
+        """Nº do contrato quando existe contrato vinculado"""
+        return self.n_contrato if self.existe_contrato == "Sim" else ""
+
+    @property
+    def pedido(self) -> str:
+        """Nº do pedido quando existe pedido vinculado"""
+        return self.n_pedido if self.existe_pedido == "Sim" else ""
+
+
+@dataclass(slots=True)
+class BlocoCobranca:
+    """Cobrança principal ou secundária de uma linha"""
+    tipo: str
+    materia: str
+    texto_breve: str
+    centavos: int = 0
+
+    def __post_init__(self):
+        self.tipo = _categoria(self.tipo)
+        self.materia = _categoria(self.materia)
+        self.texto_breve = _categoria(self.texto_breve)
+
+    @classmethod
+    def de_dict(cls, bloco: dict) -> "BlocoCobranca":
+        """Constrói a partir de bloco_1 / bloco_2 no formato de dicionário"""
+        centavos = bloco.get("centavos")
+        return cls(
+            tipo=bloco.get("tipo"),
+            materia=bloco.get("materia"),
+            texto_breve=bloco.get("texto_breve"),
+            centavos=centavos if centavos is not None else valor_em_centavos(bloco.get("valor"))
+        )
+
+    @property
+    def valor(self) -> str:
+        """Valor formatado para exibição ("1.234,56")"""
+        return formatar_centavos(self.centavos)
+
+    @property
+    def valor_reais(self) -> float:
+        """Valor em reais para células numéricas do Excel"""
+        return self.centavos / 100
+
+
+@dataclass(slots=True)
+class Cobranca:
+    """Linha de cobrança validada"""
+    num_cobranca: int
+    possui_espaider: str
+    n_espaider: str
+    possui_projeto: str
+    projeto: str
+    trecho: str
+    materia: str
+    bloco_1: BlocoCobranca
+    bloco_2: Optional[BlocoCobranca] = None
+
+    def __post_init__(self):
+        self.projeto = _categoria(self.projeto)
+        self.trecho = _categoria(self.trecho)
+        self.materia = _categoria(self.materia)
+
+    @classmethod
+    def de_dict(cls, dados_cobranca: dict) -> "Cobranca":
+        """Constrói a partir de uma cobrança no formato de dicionário (bloco_1 / bloco_2 aninhados)"""
+        bloco_2 = dados_cobranca.get('bloco_2')
+        return cls(
+            num_cobranca=dados_cobranca.get('num_cobranca'),
+            possui_espaider=dados_cobranca.get('Possui Nº Espaider?'),
+            n_espaider=dados_cobranca.get('Nº Espaider', ''),
+            possui_projeto=dados_cobranca.get('Possui projeto vinculado?'),
+            projeto=dados_cobranca.get('Projeto vinculado', ''),
+            trecho=dados_cobranca.get('Trecho', ''),
+            materia=dados_cobranca.get('Matéria'),
+            bloco_1=BlocoCobranca.de_dict(dados_cobranca.get('bloco_1', {})),
+            bloco_2=BlocoCobranca.de_dict(bloco_2) if bloco_2 is not None else None
+        )
+
+    @property
+    def blocos(self) -> List[BlocoCobranca]:
+        """Blocos preenchidos, na ordem em que são exportados"""
+        if self.bloco_2 is None:
+            return [self.bloco_1]
+        return [self.bloco_1, self.bloco_2]
+
+
+@dataclass(slots=True)
+class Medicao:
+    """Medição completa: dados iniciais e cobranças validadas"""
+    dados_iniciais: DadosIniciais
+    cobrancas: List[Cobranca] = field(default_factory=list)
+
+    @classmethod
+    def de_sessao(cls, dados_iniciais: dict, dados_coletados: list) -> "Medicao":
+        """Constrói a partir do st.session_state (cobranças já como Cobranca ou em dicionários)"""
+        return cls(
+            dados_iniciais=DadosIniciais.de_dict(dados_iniciais),
+            cobrancas=[c if isinstance(c, Cobranca) else Cobranca.de_dict(c) for c in dados_coletados]
+        )
+
+    @property
+    def total_centavos(self) -> int:
+        """Soma exata de todos os blocos da medição"""
+        return sum(bloco.centavos for cobranca in self.cobrancas for bloco in cobranca.blocos)
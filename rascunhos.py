@@ -0,0 +1,420 @@
+import atexit
+import importlib
+from abc import ABC, abstractmethod
+import itertools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import asdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from modelo import BlocoCobranca, Cobranca
+
+# ============================================================
+# RASCUNHOS (ESTADO DAS MEDIÇÕES EM ANDAMENTO)
+# ============================================================
+#
+# O estado do assistente é gravado fora do processo sob um código de
+# rascunho, dividido em partes que só são lidas quando a página precisa:
+#   progresso        etapas concluídas e página atual
+#   dados_iniciais   página Dados Iniciais
+#   cobrancas        cobranças em edição (detalhamento)
+#   dados_coletados  cobranças validadas (revisão detalhada e Excel)
+# Cada parte é gravada como JSON compactado (zlib), e só quando muda.
+#
+# Assim a medição pode ser retomada depois de um reinício do servidor, de uma
+# aba fechada ou por outra réplica do app atrás de um balanceador sem sessão
+# fixa: a sessão nova lê o código do endereço da página (?rascunho=...).
+#
+# O armazenamento é um BackendEstado (chave -> bytes; a última gravação
+# recebida prevalece), escolhido
+# pela variável de ambiente MEDICOES_BACKEND_ESTADO:
+#   sqlite:CAMINHO          banco SQLite em modo WAL (réplicas no mesmo servidor)
+#   arquivos:PASTA          um arquivo por chave (pasta compartilhada entre servidores)
+#   pacote.modulo:Classe    backend próprio, p.ex. um KV de rede, criado sem argumentos
+# Sem a variável, usa o SQLite em rascunhos.db, ao lado deste módulo, ou no
+# caminho da variável MEDICOES_RASCUNHOS.
+#
+# A gravação é feita em segundo plano: cada execução da página só copia as
+# partes alteradas e as entrega ao GravadorRascunhos, que espera o usuário
+# parar de editar (ATRASO_GRAVACAO) e grava de uma vez a versão mais recente
+# de cada parte. A serialização e o acesso ao backend ficam fora da renderização.
+# A ordem entre as versões de uma parte é a do processo (um contador, sem
+# depender do relógio): as gravações são feitas uma de cada vez, e uma versão
+# já substituída por outra mais nova não é mais gravada.
+# Se a gravação falhar, as partes voltam para a fila (a menos que já exista
+# uma versão mais nova) e a próxima tentativa espera NOVA_TENTATIVA segundos,
+# o dobro a cada falha seguida, até NOVA_TENTATIVA_MAXIMA.
+
+VARIAVEL_BACKEND = "MEDICOES_BACKEND_ESTADO"
+VARIAVEL_RASCUNHOS = "MEDICOES_RASCUNHOS"
+CAMINHO_RASCUNHOS = Path(__file__).with_name("rascunhos.db")
+
+# Segundos sem alterações antes de gravar, e espera máxima durante uma edição contínua
+ATRASO_GRAVACAO = 2.0
+ATRASO_MAXIMO_GRAVACAO = 10.0
+
+# Espera antes de repetir uma gravação que falhou (dobra a cada falha seguida)
+NOVA_TENTATIVA = 2.0
+NOVA_TENTATIVA_MAXIMA = 60.0
+
+# Rascunhos sem alteração há mais que isto são descartados
+PRAZO_RASCUNHOS_DIAS = 30
+
+CHAVES_PROGRESSO = (
+    'is_dados_validado', 'is_revisao_concluida', 'is_detalhamento_iniciado',
+    'is_detalhamento_validado', 'is_finalizado'
+)
+PARTES_RASCUNHO = ('progresso', 'dados_iniciais', 'cobrancas', 'dados_coletados')
+
+# Falhas de acesso ao backend (um KV de rede deve levantar OSError, p.ex. ConnectionError)
+ERROS_BACKEND = (sqlite3.Error, OSError)
+
+_log = logging.getLogger(__name__)
+
+_FORMATO_CODIGO = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS estado (
+    chave TEXT PRIMARY KEY,
+    atualizado_em TEXT NOT NULL,
+    valor BLOB NOT NULL
+)
+"""
+
+def codigo_valido(codigo: str) -> bool:
+    """Letras, números, '_' e '-', como nos códigos gerados por secrets.token_urlsafe"""
+    return bool(codigo) and _FORMATO_CODIGO.fullmatch(codigo) is not None
+
+def chave_parte(codigo: str, parte: str) -> str:
+    """Chave de uma parte do rascunho no backend"""
+    return f"{codigo}.{parte}"
+
+# ============================================================
+# PARTES DO ESTADO <-> BYTES
+# ============================================================
+
+def capturar_partes(sessao, partes: Iterable[str]) -> dict:
+    """Cópia das partes do estado ({parte: valor}) que pode ser gravada depois, em outra thread
+
+    As cobranças são dicionários rasos (copiados um a um) e as cobranças
+    validadas não são alteradas depois de criadas.
+    """
+    copias = {}
+    for parte in partes:
+        if parte == 'progresso':
+            copia = {chave: bool(sessao.get(chave, False)) for chave in CHAVES_PROGRESSO}
+            copia['current_page'] = sessao.get('current_page', "inicio")
+        elif parte == 'dados_iniciais':
+            copia = dict(sessao.get('dados_iniciais') or {})
+        elif parte == 'cobrancas':
+            copia = [dict(cobranca) for cobranca in sessao.get('cobrancas') or []]
+        else:
+            copia = list(sessao.get('dados_coletados') or [])
+        copias[parte] = copia
+    return copias
+
+def serializar_parte(parte: str, valor) -> bytes:
+    """JSON compactado (datas em ISO, cobranças validadas como dicionários)"""
+    if parte == 'dados_iniciais' and isinstance(valor.get('data_prevista'), date):
+        valor = {**valor, 'data_prevista': valor['data_prevista'].isoformat()}
+    elif parte == 'dados_coletados':
+        valor = [asdict(cobranca) for cobranca in valor]
+    texto = json.dumps(valor, ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(texto.encode('utf-8'))
+
+def _cobranca_de_json(dados: dict) -> Cobranca:
+    bloco_2 = dados.get('bloco_2')
+    return Cobranca(**{
+        **dados,
+        'bloco_1': BlocoCobranca(**dados['bloco_1']),
+        'bloco_2': BlocoCobranca(**bloco_2) if bloco_2 else None,
+    })
+
+def desserializar_parte(parte: str, conteudo: bytes):
+    """Reconstrói uma parte gravada por serializar_parte"""
+    valor = json.loads(zlib.decompress(conteudo).decode('utf-8'))
+    if parte == 'dados_iniciais' and valor.get('data_prevista'):
+        valor['data_prevista'] = date.fromisoformat(valor['data_prevista'])
+    elif parte == 'dados_coletados':
+        valor = [_cobranca_de_json(dados) for dados in valor]
+    return valor
+
+# ============================================================
+# BACKENDS DE ARMAZENAMENTO
+# ============================================================
+
+class BackendEstado(ABC):
+    """Armazenamento chave -> bytes, compartilhado entre as réplicas do app
+
+    Para um KV de rede (Redis, memcached, ...), implemente ler e gravar em
+    uma subclasse e aponte MEDICOES_BACKEND_ESTADO para ela; falhas de
+    acesso devem ser levantadas como OSError.
+    """
+
+    @abstractmethod
+    def ler(self, chaves: Iterable[str]) -> Dict[str, bytes]:
+        """Valores gravados das chaves (as inexistentes ficam de fora)"""
+
+    @abstractmethod
+    def gravar(self, itens: Dict[str, bytes]):
+        """Grava {chave: valor}, substituindo os valores gravados"""
+
+    def remover_antigos(self, dias: int):
+        """Descarta as chaves sem alteração há mais de `dias` dias (opcional, p.ex. com expiração no KV)"""
+
+class BackendSQLite(BackendEstado):
+    """Estado em um banco SQLite (modo WAL)"""
+
+    def __init__(self, caminho):
+        self.caminho = str(caminho)
+        conexao = self._conectar()
+        try:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute(_ESQUEMA)
+        finally:
+            conexao.close()
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.caminho, timeout=10)
+
+    def ler(self, chaves):
+        chaves = list(chaves)
+        conexao = self._conectar()
+        try:
+            linhas = conexao.execute(
+                f"SELECT chave, valor FROM estado WHERE chave IN ({', '.join('?' * len(chaves))})",
+                chaves
+            ).fetchall()
+        finally:
+            conexao.close()
+        return dict(linhas)
+
+    def gravar(self, itens):
+        agora = datetime.now().isoformat(timespec='seconds')
+        conexao = self._conectar()
+        try:
+            with conexao:
+                conexao.executemany(
+                    "INSERT INTO estado VALUES (?, ?, ?) "
+                    "ON CONFLICT (chave) DO UPDATE SET "
+                    "atualizado_em = excluded.atualizado_em, valor = excluded.valor",
+                    [(chave, agora, valor) for chave, valor in itens.items()]
+                )
+        finally:
+            conexao.close()
+
+    def remover_antigos(self, dias):
+        limite = (datetime.now() - timedelta(days=dias)).isoformat(timespec='seconds')
+        conexao = self._conectar()
+        try:
+            with conexao:
+                conexao.execute("DELETE FROM estado WHERE atualizado_em < ?", (limite,))
+        finally:
+            conexao.close()
+
+class BackendArquivos(BackendEstado):
+    """Estado em uma pasta, um arquivo por chave
+
+    Cada arquivo é substituído de forma atômica (arquivo temporário + os.replace).
+    """
+
+    def __init__(self, pasta):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+
+    def _ler_arquivo(self, chave: str) -> Optional[bytes]:
+        try:
+            return (self.pasta / f"{chave}.bin").read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def ler(self, chaves):
+        lidos = {chave: self._ler_arquivo(chave) for chave in chaves}
+        return {chave: conteudo for chave, conteudo in lidos.items() if conteudo is not None}
+
+    def gravar(self, itens):
+        for chave, valor in itens.items():
+            temporario = self.pasta / f".{chave}.{os.getpid()}.{threading.get_ident()}.tmp"
+            temporario.write_bytes(valor)
+            os.replace(temporario, self.pasta / f"{chave}.bin")
+
+    def remover_antigos(self, dias):
+        limite = time.time() - dias * 86400
+        for caminho in self.pasta.glob("*.bin"):
+            try:
+                if caminho.stat().st_mtime < limite:
+                    caminho.unlink()
+            except FileNotFoundError:
+                pass
+
+def criar_backend(especificacao: str) -> BackendEstado:
+    """Backend descrito por "sqlite:CAMINHO", "arquivos:PASTA" ou "pacote.modulo:Classe" """
+    tipo, _, argumento = especificacao.partition(':')
+    if tipo == 'sqlite':
+        return BackendSQLite(argumento)
+    if tipo == 'arquivos':
+        return BackendArquivos(argumento)
+    return getattr(importlib.import_module(tipo), argumento)()
+
+# ============================================================
+# GRAVAÇÃO EM SEGUNDO PLANO (COM ESPERA E AGRUPAMENTO)
+# ============================================================
+
+class GravadorRascunhos:
+    """Grava as partes dos rascunhos em segundo plano, agrupando as alterações
+
+    agendar() só guarda a versão mais recente de cada parte; uma thread
+    serializa e grava cada parte quando ela fica `atraso` segundos sem
+    alterações (ou, em edição contínua, a cada `atraso_maximo` segundos).
+    """
+
+    def __init__(self, backend: BackendEstado, atraso: float = ATRASO_GRAVACAO,
+                 atraso_maximo: float = ATRASO_MAXIMO_GRAVACAO):
+        self.backend = backend
+        self.atraso = atraso
+        self.atraso_maximo = atraso_maximo
+        self.ultimo_erro = None
+        self._versoes = itertools.count(1)  # ordem das versões agendadas neste processo
+        self._pendentes = {}  # chave -> (versão, parte, valor, primeira alteração, última alteração)
+        self._em_gravacao = {}  # chave -> (versão, parte, valor) retirados de _pendentes e ainda não gravados
+        self._falhas = 0  # gravações seguidas que falharam
+        self._retomar_em = 0.0  # instante (time.monotonic) da próxima tentativa depois de uma falha
+        self._condicao = threading.Condition()
+        self._lock_gravacao = threading.Lock()
+        self._thread = None
+
+    def agendar(self, codigo: str, partes: dict):
+        """Entrega a versão mais recente de partes de um rascunho ({parte: valor}) para gravação"""
+        agora = time.monotonic()
+        with self._condicao:
+            versao = next(self._versoes)
+            for parte, valor in partes.items():
+                chave = chave_parte(codigo, parte)
+                anterior = self._pendentes.get(chave)
+                primeira = anterior[3] if anterior else agora
+                self._pendentes[chave] = (versao, parte, valor, primeira, agora)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name="gravador-rascunhos", daemon=True)
+                self._thread.start()
+            self._condicao.notify()
+
+    def carregar(self, codigo: str, partes: Iterable[str]) -> dict:
+        """Partes gravadas do rascunho ({parte: valor}), considerando versões ainda não gravadas
+
+        Partes que nunca foram gravadas ficam de fora.
+        """
+        partes = list(partes)
+        valores = {}
+        with self._condicao:
+            for parte in partes:
+                chave = chave_parte(codigo, parte)
+                pendente = self._pendentes.get(chave) or self._em_gravacao.get(chave)
+                if pendente is not None:
+                    valores[parte] = pendente[2]
+
+        faltantes = {chave_parte(codigo, parte): parte for parte in partes if parte not in valores}
+        if faltantes:
+            for chave, conteudo in self.backend.ler(faltantes).items():
+                valores[faltantes[chave]] = desserializar_parte(faltantes[chave], conteudo)
+        return valores
+
+    def descarregar(self):
+        """Grava imediatamente todas as partes pendentes"""
+        with self._condicao:
+            lote = {chave: pendente[:3] for chave, pendente in self._pendentes.items()}
+            self._pendentes.clear()
+            self._em_gravacao.update(lote)
+        self._gravar(lote)
+
+    def _proximo_lote(self) -> dict:
+        with self._condicao:
+            while True:
+                agora = time.monotonic()
+                if agora < self._retomar_em:
+                    self._condicao.wait(timeout=self._retomar_em - agora)
+                    continue
+                prazos = {
+                    chave: min(ultima + self.atraso, primeira + self.atraso_maximo)
+                    for chave, (_, _, _, primeira, ultima) in self._pendentes.items()
+                }
+                prontos = [chave for chave, prazo in prazos.items() if prazo <= agora]
+                if prontos:
+                    lote = {chave: self._pendentes.pop(chave)[:3] for chave in prontos}
+                    self._em_gravacao.update(lote)
+                    return lote
+                self._condicao.wait(timeout=min(prazos.values()) - agora if prazos else None)
+
+    def _gravar(self, lote: dict):
+        with self._lock_gravacao:
+            with self._condicao:
+                # Versões já substituídas por uma mais nova em gravação ficam de fora
+                lote = {
+                    chave: item for chave, item in lote.items()
+                    if self._em_gravacao.get(chave, (None,))[0] == item[0]
+                }
+            if lote:
+                self._gravar_lote(lote)
+
+    def _gravar_lote(self, lote: dict):
+        erro = None
+        try:
+            self.backend.gravar({
+                chave: serializar_parte(parte, valor) for chave, (_, parte, valor) in lote.items()
+            })
+        except Exception as e:
+            if not isinstance(e, ERROS_BACKEND):
+                _log.exception("Falha na gravação de rascunhos")
+            erro = e
+
+        with self._condicao:
+            agora = time.monotonic()
+            for chave, (versao, parte, valor) in lote.items():
+                if self._em_gravacao.get(chave, (None,))[0] != versao:
+                    continue
+                del self._em_gravacao[chave]
+                if erro is not None and chave not in self._pendentes:
+                    # Volta para a fila, se nenhuma versão mais nova foi agendada
+                    self._pendentes[chave] = (versao, parte, valor, agora, agora)
+            self.ultimo_erro = erro
+            if erro is None:
+                self._falhas = 0
+                self._retomar_em = 0.0
+            else:
+                self._falhas += 1
+                espera = min(NOVA_TENTATIVA * 2 ** (self._falhas - 1), NOVA_TENTATIVA_MAXIMA)
+                self._retomar_em = agora + espera
+
+    def _executar(self):
+        while True:
+            try:
+                self._gravar(self._proximo_lote())
+            except Exception as e:
+                _log.exception("Falha na gravação de rascunhos")
+                self.ultimo_erro = e
+                time.sleep(NOVA_TENTATIVA)
+
+_gravadores = {}
+_lock_gravadores = threading.Lock()
+
+def obter_gravador_rascunhos() -> GravadorRascunhos:
+    """Gravador de rascunhos do processo (MEDICOES_BACKEND_ESTADO, MEDICOES_RASCUNHOS ou rascunhos.db)"""
+    especificacao = (
+        os.environ.get(VARIAVEL_BACKEND)
+        or f"sqlite:{os.environ.get(VARIAVEL_RASCUNHOS) or CAMINHO_RASCUNHOS}"
+    )
+    with _lock_gravadores:
+        if especificacao not in _gravadores:
+            backend = criar_backend(especificacao)
+            backend.remover_antigos(PRAZO_RASCUNHOS_DIAS)
+            gravador = GravadorRascunhos(backend)
+            atexit.register(gravador.descarregar)
+            _gravadores[especificacao] = gravador
+        return _gravadores[especificacao]
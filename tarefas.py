@@ -0,0 +1,316 @@
+import atexit
+import multiprocessing
+import os
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Optional
+
+from modelo import Medicao
+from exportacao import (
+    CACHE_EXPORTACAO, LAYOUT_BD_PADRAO, LIMITE_LINHAS_STREAMING, MOTOR_PADRAO, chave_medicao,
+    contar_linhas, gerar_excel_arquivo
+)
+
+# ============================================================
+# FILA DE EXPORTAÇÕES EM SEGUNDO PLANO
+# ============================================================
+#
+# A geração do Excel sai da execução da página: finalizar uma medição envia
+# uma tarefa para a fila do processo, atendida por um pool de processos com
+# limite global de exportações simultâneas (os demais usuários continuam com
+# a interface responsiva enquanto arquivos grandes são gerados). Com a fila
+# cheia, novos envios são recusados até alguma tarefa terminar.
+#
+# O progresso é estimado pelo número de linhas da medição e pela velocidade
+# das exportações já concluídas. Tarefas terminadas ficam disponíveis para
+# download por PRAZO_TAREFAS segundos depois do último acesso (obter), para
+# que o botão de download na tela não aponte para um arquivo já apagado.
+#
+# O arquivo é gerado diretamente em um arquivo temporário da pasta de
+# exportações: até LIMITE_BYTES_EM_MEMORIA volta ao servidor em memória (e o
+# arquivo é apagado); acima disso fica em disco, sem outra cópia, e só é lido
+# quando o usuário clica em baixar (o st.download_button precisa do conteúdo
+# em bytes). Os arquivos são apagados junto com a tarefa, ao fim do prazo.
+#
+# Variáveis de ambiente: MEDICOES_EXPORTACOES_SIMULTANEAS (processos do pool),
+# MEDICOES_EXPORTACOES_NA_FILA (tarefas aguardando ou em geração) e
+# MEDICOES_EXPORTACOES_DIR (pasta dos arquivos grandes; padrão: pasta temporária).
+
+VARIAVEL_SIMULTANEAS = "MEDICOES_EXPORTACOES_SIMULTANEAS"
+VARIAVEL_NA_FILA = "MEDICOES_EXPORTACOES_NA_FILA"
+VARIAVEL_PASTA = "MEDICOES_EXPORTACOES_DIR"
+
+# Tarefas terminadas (e seus arquivos) são descartadas depois deste prazo (segundos)
+PRAZO_TAREFAS = 30 * 60
+
+# Arquivos maiores que isto ficam em disco até o download
+LIMITE_BYTES_EM_MEMORIA = 2 * 1024 * 1024
+PREFIXO_ARQUIVOS = "medicao-"
+
+# Estimativa inicial de tempo de geração, ajustada a cada exportação concluída
+SEGUNDOS_BASE_EXPORTACAO = 0.3
+SEGUNDOS_POR_LINHA_INICIAL = 0.0005
+
+NA_FILA = "na_fila"
+GERANDO = "gerando"
+CONCLUIDA = "concluida"
+ERRO = "erro"
+
+def _gerar_no_processo(medicao: Medicao, data_geracao: date, streaming: bool, motor: str,
+                       layout_bd: str, pasta: str) -> tuple:
+    """Gera o arquivo (executado nos processos do pool) e mede o tempo de geração
+
+    Devolve (bytes ou caminho do arquivo em disco, segundos).
+    """
+    inicio = time.perf_counter()
+    with tempfile.NamedTemporaryFile(
+        dir=pasta, prefix=PREFIXO_ARQUIVOS, suffix=".xlsx", delete=False
+    ) as arquivo:
+        resultado = None
+        try:
+            gerar_excel_arquivo(medicao, arquivo, data_geracao, streaming, motor, layout_bd)
+            if arquivo.tell() <= LIMITE_BYTES_EM_MEMORIA:
+                arquivo.seek(0)
+                resultado = arquivo.read()
+            else:
+                resultado = arquivo.name
+        finally:
+            # Só o arquivo que fica em disco até o download é mantido
+            if not isinstance(resultado, str):
+                arquivo.close()
+                os.remove(arquivo.name)
+    return resultado, time.perf_counter() - inicio
+
+class FilaExportacaoCheia(RuntimeError):
+    """Há exportações demais aguardando; o envio deve ser repetido mais tarde"""
+
+@dataclass(slots=True)
+class TarefaExportacao:
+    """Exportação enviada para a fila"""
+    id: str
+    chave: str
+    linhas: int
+    enviada_em: float
+    iniciada_em: Optional[float] = None
+    terminada_em: Optional[float] = None
+    acessada_em: Optional[float] = None
+    conteudo: Optional[bytes] = None
+    caminho: Optional[str] = None
+    erro: str = ""
+    _futuro: object = field(default=None, repr=False)
+
+    @property
+    def estado(self) -> str:
+        if self.terminada_em is not None:
+            return ERRO if self.erro else CONCLUIDA
+        return GERANDO if self.iniciada_em is not None else NA_FILA
+
+    @property
+    def terminada(self) -> bool:
+        return self.terminada_em is not None
+
+    @property
+    def disponivel(self) -> bool:
+        """Conteúdo ainda pode ser baixado (o arquivo em disco pode ter sido apagado por outro processo)"""
+        return self.conteudo is not None or (self.caminho is not None and os.path.exists(self.caminho))
+
+    def ler(self) -> bytes:
+        """Conteúdo do arquivo gerado (lido do disco quando ficou acima do limite em memória)"""
+        if self.caminho is not None:
+            with open(self.caminho, 'rb') as arquivo:
+                return arquivo.read()
+        return self.conteudo
+
+class FilaExportacao:
+    """Exportações geradas por um pool de processos, com limite de tarefas pendentes"""
+
+    def __init__(self, simultaneas: Optional[int] = None, na_fila: Optional[int] = None,
+                 pasta: Optional[str] = None):
+        self.simultaneas = simultaneas or max(1, (os.cpu_count() or 2) // 2)
+        self.na_fila = na_fila or self.simultaneas * 4
+        self.pasta = pasta or os.path.join(tempfile.gettempdir(), "medicoes-exportacoes")
+        os.makedirs(self.pasta, exist_ok=True)
+        self._remover_arquivos_orfaos()
+        self.segundos_por_linha = SEGUNDOS_POR_LINHA_INICIAL
+        self._tarefas = {}
+        self._pendentes = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _obter_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: o processo do servidor tem muitas threads, e fork poderia herdar locks ocupados
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.simultaneas, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def _descartar_pool(self, pool: ProcessPoolExecutor):
+        # Encerra o pool quebrado (thread de gerenciamento e tarefas ainda na fila dele)
+        self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def enviar(self, medicao: Medicao, data_geracao: Optional[date] = None) -> TarefaExportacao:
+        """Envia a medição para exportação (levanta FilaExportacaoCheia com a fila lotada)
+
+        Uma medição idêntica já gerada (cache) ou em andamento reaproveita o resultado.
+        """
+        data_geracao = data_geracao or date.today()
+        linhas = contar_linhas(medicao)
+        streaming = linhas > LIMITE_LINHAS_STREAMING
+        # Motor e layout são resolvidos aqui: os processos do pool podem ter outro ambiente
+        motor, layout_bd = MOTOR_PADRAO, LAYOUT_BD_PADRAO
+        chave = chave_medicao(medicao, data_geracao, streaming, motor, layout_bd)
+        agora = time.time()
+
+        with self._lock:
+            self._remover_vencidas(agora)
+            for tarefa in self._tarefas.values():
+                if tarefa.chave == chave and not tarefa.erro:
+                    return tarefa
+
+            tarefa = TarefaExportacao(secrets.token_urlsafe(9), chave, linhas, agora)
+            conteudo = CACHE_EXPORTACAO.obter(chave)
+            if conteudo is not None:
+                tarefa.iniciada_em = tarefa.terminada_em = agora
+                tarefa.conteudo = conteudo
+                self._tarefas[tarefa.id] = tarefa
+                return tarefa
+
+            if self._pendentes >= self.na_fila:
+                raise FilaExportacaoCheia(f"{self._pendentes} exportações aguardando")
+            pool = self._obter_pool()
+            try:
+                futuro = pool.submit(
+                    _gerar_no_processo, medicao, data_geracao, streaming, motor, layout_bd, self.pasta
+                )
+            except BrokenProcessPool:
+                # Um processo do pool morreu (p.ex. falta de memória): recria o pool
+                self._descartar_pool(pool)
+                pool = self._obter_pool()
+                futuro = pool.submit(
+                    _gerar_no_processo, medicao, data_geracao, streaming, motor, layout_bd, self.pasta
+                )
+            tarefa._futuro = futuro
+            self._pendentes += 1
+            self._tarefas[tarefa.id] = tarefa
+
+        futuro.add_done_callback(lambda futuro: self._concluir(tarefa, futuro, pool))
+        return tarefa
+
+    def obter(self, id_tarefa: str) -> Optional[TarefaExportacao]:
+        """Tarefa com o id, com o estado atualizado (None se não existir ou já tiver sido descartada)"""
+        with self._lock:
+            self._remover_vencidas(time.time())
+            tarefa = self._tarefas.get(id_tarefa)
+            if tarefa is not None:
+                tarefa.acessada_em = time.time()
+                if tarefa.iniciada_em is None and tarefa._futuro.running():
+                    tarefa.iniciada_em = tarefa.acessada_em
+            return tarefa
+
+    def progresso(self, tarefa: TarefaExportacao) -> float:
+        """Fração estimada (0 a 1) da geração, pelo tempo decorrido e pelas exportações anteriores"""
+        if tarefa.terminada:
+            return 1.0
+        if tarefa.iniciada_em is None:
+            return 0.0
+        estimativa = SEGUNDOS_BASE_EXPORTACAO + tarefa.linhas * self.segundos_por_linha
+        return min(0.95, (time.time() - tarefa.iniciada_em) / estimativa)
+
+    def posicao(self, tarefa: TarefaExportacao) -> int:
+        """Quantas tarefas aguardando foram enviadas antes desta (0 se já está sendo gerada)"""
+        if tarefa.estado != NA_FILA:
+            return 0
+        with self._lock:
+            return sum(
+                1 for outra in self._tarefas.values()
+                if outra.estado == NA_FILA and outra.enviada_em < tarefa.enviada_em
+            )
+
+    def _concluir(self, tarefa: TarefaExportacao, futuro, pool: ProcessPoolExecutor):
+        agora = time.time()
+        pool_quebrado = False
+        try:
+            resultado, duracao = futuro.result()
+        except BrokenProcessPool:
+            resultado, duracao, erro = None, None, "o processo de exportação foi interrompido"
+            pool_quebrado = True
+        except Exception as e:
+            resultado, duracao, erro = None, None, str(e)
+        else:
+            erro = ""
+            if isinstance(resultado, bytes):
+                CACHE_EXPORTACAO.guardar(tarefa.chave, resultado)
+
+        with self._lock:
+            if pool_quebrado and self._pool is pool:
+                self._descartar_pool(pool)
+            if duracao is not None and tarefa.linhas:
+                # Média móvel da velocidade de geração, para as próximas estimativas
+                medida = max(0.0, duracao - SEGUNDOS_BASE_EXPORTACAO) / tarefa.linhas
+                self.segundos_por_linha = 0.7 * self.segundos_por_linha + 0.3 * medida
+            tarefa.iniciada_em = tarefa.iniciada_em or agora
+            if isinstance(resultado, bytes):
+                tarefa.conteudo = resultado
+            else:
+                tarefa.caminho = resultado
+            tarefa.erro = erro
+            tarefa.terminada_em = agora
+            tarefa._futuro = None
+            self._pendentes -= 1
+
+    def _remover_vencidas(self, agora: float):
+        vencidas = [
+            id_tarefa for id_tarefa, tarefa in self._tarefas.items()
+            if tarefa.terminada and agora - max(tarefa.terminada_em, tarefa.acessada_em or 0) > PRAZO_TAREFAS
+        ]
+        for id_tarefa in vencidas:
+            self._apagar_arquivo(self._tarefas.pop(id_tarefa))
+
+    def _apagar_arquivo(self, tarefa: TarefaExportacao):
+        if tarefa.caminho is not None:
+            try:
+                os.remove(tarefa.caminho)
+            except FileNotFoundError:
+                pass
+
+    def _remover_arquivos_orfaos(self):
+        # Arquivos deixados por processos encerrados sem descartar suas tarefas
+        limite = time.time() - PRAZO_TAREFAS
+        for nome in os.listdir(self.pasta):
+            caminho = os.path.join(self.pasta, nome)
+            try:
+                if nome.startswith(PREFIXO_ARQUIVOS) and os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def descartar(self):
+        """Apaga os arquivos em disco de todas as tarefas terminadas"""
+        with self._lock:
+            for tarefa in self._tarefas.values():
+                if tarefa.terminada:
+                    self._apagar_arquivo(tarefa)
+
+_fila = None
+_lock_fila = threading.Lock()
+
+def obter_fila_exportacao() -> FilaExportacao:
+    """Fila de exportações do processo (configurada pelas variáveis MEDICOES_EXPORTACOES_*)"""
+    global _fila
+    with _lock_fila:
+        if _fila is None:
+            _fila = FilaExportacao(
+                int(os.environ.get(VARIAVEL_SIMULTANEAS) or 0) or None,
+                int(os.environ.get(VARIAVEL_NA_FILA) or 0) or None,
+                os.environ.get(VARIAVEL_PASTA) or None
+            )
+            atexit.register(_fila.descartar)
+        return _fila
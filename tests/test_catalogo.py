@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from catalogo import LIMITE_RESULTADOS_BUSCA, IndiceBusca, normalizar_busca
+
+# ============================================================
+# BUSCA POR DIGITAÇÃO (PROJETOS E TRECHOS)
+# ============================================================
+
+PALAVRAS = [
+    "SE", "LT", "Jaíba", "Janaúba", "Piraquê", "Ivaí", "Interligação", "Elétrica", "Subestação",
+    "Norte", "Sul", "Paraná", "São", "João", "Três", "Lagoas", "C1", "C2", "500kV", "230kV", "Ampliação",
+]
+
+def buscar_linear(valores, consulta: str, limite: int = LIMITE_RESULTADOS_BUSCA) -> list:
+    """Referência sem índice: confere todas as opções, na ordem do cadastro"""
+    palavras = normalizar_busca(consulta).split()
+    if not palavras:
+        return list(valores[:limite])
+
+    consulta_normalizada = " ".join(palavras)
+    grupos = ([], [], [])
+    for valor in valores:
+        texto = normalizar_busca(valor)
+        palavras_opcao = texto.split()
+        if not all(
+            any(p.startswith(palavra) if len(palavra) < 3 else palavra in p for p in palavras_opcao)
+            for palavra in palavras
+        ):
+            continue
+        if texto.startswith(consulta_normalizada):
+            grupos[0].append(valor)
+        elif all(any(p.startswith(palavra) for p in palavras_opcao) for palavra in palavras):
+            grupos[1].append(valor)
+        else:
+            grupos[2].append(valor)
+    return (grupos[0] + grupos[1] + grupos[2])[:limite]
+
+@pytest.fixture(scope='module')
+def opcoes():
+    sorteio = random.Random(15)
+    return [" ".join(sorteio.sample(PALAVRAS, sorteio.randint(1, 5))) for _ in range(1000)]
+
+def consultas(opcoes, quantidade: int) -> list:
+    sorteio = random.Random(5)
+    resultado = ["", "  ", "xyz", "se", "S", "jaiba", "JANAÚBA", "sub norte", "ão", "500", "lt c1", "kv"]
+    for _ in range(quantidade):
+        texto = normalizar_busca(sorteio.choice(opcoes))
+        inicio = sorteio.randrange(len(texto))
+        resultado.append(texto[inicio:inicio + sorteio.randint(1, 12)])
+    return resultado
+
+def test_buscar_equivale_a_busca_linear(opcoes):
+    indice = IndiceBusca(opcoes)
+    for consulta in consultas(opcoes, 300):
+        for limite in (1, LIMITE_RESULTADOS_BUSCA):
+            assert indice.buscar(consulta, limite) == buscar_linear(opcoes, consulta, limite), consulta
+
+def test_buscar_ignora_acentos_e_maiusculas():
+    indice = IndiceBusca(["SE Janaúba 6", "LT Jaíba - Janaúba", "Subestação Norte"])
+    assert indice.buscar("janauba") == ["SE Janaúba 6", "LT Jaíba - Janaúba"]
+    assert indice.buscar("SUBESTACAO") == ["Subestação Norte"]
+    assert indice.buscar("ba 6") == []
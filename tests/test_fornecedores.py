@@ -0,0 +1,24 @@
+from fornecedores import CadastroFornecedores
+
+# ============================================================
+# CADASTRO DE FORNECEDORES
+# ============================================================
+
+DADOS = {'cnpj': "11.222.333/0001-81", 'empresa': "ISA ENERGIA BRASIL", 'advogado': "Carlos Lopes",
+         'tipo_doc': "Nota Fiscal"}
+
+def test_fornecedor_registrado_por_outra_instancia_e_encontrado(tmp_path):
+    caminho = tmp_path / "fornecedores.db"
+    consulta, outra_replica = CadastroFornecedores(caminho), CadastroFornecedores(caminho)
+
+    assert consulta.buscar(DADOS['cnpj']) is None
+    outra_replica.registrar(DADOS)
+    fornecedor = consulta.buscar(DADOS['cnpj'])
+    assert fornecedor is not None and (fornecedor.empresa, fornecedor.medicoes) == ("ISA ENERGIA BRASIL", 1)
+
+def test_registro_invalida_o_cache_da_propria_instancia(tmp_path):
+    cadastro = CadastroFornecedores(tmp_path / "fornecedores.db")
+    cadastro.registrar(DADOS)
+    assert cadastro.buscar(DADOS['cnpj']).medicoes == 1
+    cadastro.registrar(DADOS)
+    assert cadastro.buscar(DADOS['cnpj']).medicoes == 2
@@ -0,0 +1,75 @@
+import random
+
+import pandas as pd
+
+from catalogo import obter_catalogo
+from grade import aplicar_alteracoes_grade, cobranca_da_linha, tabela_grade
+from importacao import cobranca_de_registro
+
+# ============================================================
+# DIFF DA GRADE DE COBRANÇAS
+# ============================================================
+
+def linha_sorteada(sorteio: random.Random) -> dict:
+    catalogo = obter_catalogo()
+    linha = {
+        "Nº Espaider": sorteio.choice([None, str(sorteio.randrange(10 ** 6))]),
+        "Matéria": sorteio.choice(catalogo.materias.valores[1:]),
+        "Tipo de cobrança": sorteio.choice(catalogo.tipos_cobranca.valores[1:]),
+        "Valor (R$)": sorteio.choice([None, "1.234,56", "10", "0,5", "R$ 99,90", "1.2.3"]),
+    }
+    if sorteio.random() < 0.4:
+        linha["Tipo de cobrança (secundária)"] = sorteio.choice(catalogo.tipos_cobranca.valores[1:])
+        linha["Valor secundário (R$)"] = sorteio.choice(["10,05", "3.000", "abc"])
+    return linha
+
+def aplicar_na_tabela(cobrancas: list, alteracoes: dict) -> list:
+    """Referência: aplica o diff à tabela inteira e converte todas as linhas de novo"""
+    tabela = tabela_grade(cobrancas).reset_index(drop=True)
+    for posicao, mudancas in alteracoes.get('edited_rows', {}).items():
+        for coluna, valor in mudancas.items():
+            tabela.at[posicao, coluna] = valor
+    tabela = tabela.drop(index=alteracoes.get('deleted_rows', []))
+    adicionadas = pd.DataFrame(alteracoes.get('added_rows', []), columns=tabela.columns, dtype=object)
+    tabela = pd.concat([tabela, adicionadas], ignore_index=True)
+
+    convertidas = []
+    for linha in tabela.to_dict('records'):
+        linha = {coluna: (None if pd.isna(valor) else valor) for coluna, valor in linha.items()}
+        try:
+            convertidas.append(cobranca_da_linha(linha))
+        except ValueError:
+            convertidas.append(cobranca_da_linha({**linha, "Valor (R$)": None, "Valor secundário (R$)": None}))
+    return convertidas
+
+def test_aplicar_alteracoes_equivale_a_reconverter_a_tabela():
+    sorteio = random.Random(11)
+    catalogo = obter_catalogo()
+    for _ in range(50):
+        cobrancas = [
+            cobranca_de_registro({
+                'n_espaider': str(numero), 'materia': sorteio.choice(catalogo.materias.valores[1:]),
+                'tipo_1': sorteio.choice(catalogo.tipos_cobranca.valores[1:]), 'valor_1': f"{numero},10",
+            })
+            for numero in range(1, sorteio.randint(1, 30))
+        ]
+        posicoes = list(range(len(cobrancas)))
+        editadas = sorteio.sample(posicoes, min(len(posicoes), sorteio.randint(0, 5)))
+        alteracoes = {
+            'edited_rows': {
+                posicao: dict(sorteio.sample(sorted(linha_sorteada(sorteio).items()), 2))
+                for posicao in editadas
+            },
+            'deleted_rows': sorteio.sample(posicoes, min(len(posicoes), sorteio.randint(0, 3))),
+            'added_rows': [linha_sorteada(sorteio) for _ in range(sorteio.randint(0, 3))],
+        }
+
+        novas, avisos = aplicar_alteracoes_grade(cobrancas, alteracoes)
+        assert novas == aplicar_na_tabela(cobrancas, alteracoes)
+        assert cobrancas == aplicar_alteracoes_grade(cobrancas, {})[0]
+
+def test_valor_ilegivel_vira_aviso():
+    cobrancas = [cobranca_de_registro({'materia': "Ambiental", 'tipo_1': "Despesas", 'valor_1': "10,00"})]
+    novas, avisos = aplicar_alteracoes_grade(cobrancas, {'edited_rows': {0: {"Valor (R$)": "1.2.3"}}})
+    assert novas[0]['valor_1'] == "" and novas[0]['centavos_1'] == 0
+    assert len(avisos) == 1 and avisos[0].startswith("Cobrança 1:")
@@ -0,0 +1,70 @@
+import random
+
+from catalogo import obter_catalogo
+from importacao import (
+    cobranca_de_registro, importar_cobrancas, ler_planilha_cobrancas, modelo_importacao_csv
+)
+from validacao import validar_cobrancas_lote
+
+# ============================================================
+# IMPORTAÇÃO DE COBRANÇAS
+# ============================================================
+
+def importar_uma_a_uma(registros: list, empresa: str):
+    """Referência: converte e valida cada registro separadamente"""
+    cobrancas = []
+    erros = []
+    for numero, registro in enumerate(registros, start=1):
+        ilegivel = False
+        try:
+            cobranca = cobranca_de_registro(registro)
+        except ValueError as e:
+            erros.append((numero, str(e)))
+            ilegivel = True
+            cobranca = cobranca_de_registro({**registro, 'valor_1': None, 'valor_2': None})
+        cobrancas.append(cobranca)
+
+        tabela_erros, _ = validar_cobrancas_lote([cobranca], empresa)
+        erros += [
+            (numero, erro)
+            for _, campo, erro in tabela_erros.itertuples(index=False)
+            if not (ilegivel and campo in ('valor_1', 'valor_2'))
+        ]
+    erros.sort(key=lambda item: item[0])
+    return cobrancas, erros
+
+def registros_sorteados(sorteio: random.Random, empresa: str, quantidade: int) -> list:
+    catalogo = obter_catalogo()
+    projetos = [p for p in catalogo.projetos(empresa).valores if p]
+    registros = []
+    for _ in range(quantidade):
+        projeto = sorteio.choice(projetos + ["", "Projeto inexistente"])
+        trechos = [t for t in catalogo.trechos(empresa, projeto).valores if t] if projeto in projetos else []
+        registro = {
+            'n_espaider': sorteio.choice(["", "123456", "12345", 123456.0, "ABC"]),
+            'materia': sorteio.choice(list(catalogo.materias.valores) + ["Matéria inexistente"]),
+            'projeto': projeto,
+            'trecho': sorteio.choice(trechos + ["", "Trecho inexistente"]),
+            'tipo_1': sorteio.choice(list(catalogo.tipos_cobranca.valores) + ["Tipo inexistente"]),
+            'valor_1': sorteio.choice(["1.234,56", "0", "", "1.2.3", 10.5, None, "R$ 7"]),
+        }
+        if sorteio.random() < 0.4:
+            registro['tipo_2'] = sorteio.choice(catalogo.tipos_cobranca.valores)
+            registro['valor_2'] = sorteio.choice(["10,05", "", "abc"])
+        registros.append(registro)
+    return registros
+
+def test_importar_equivale_a_validar_registro_por_registro():
+    empresa = obter_catalogo().empresas.valores[1]
+    registros = registros_sorteados(random.Random(7), empresa, 400)
+    cobrancas, erros = importar_cobrancas(registros, empresa)
+    assert (cobrancas, erros) == importar_uma_a_uma(registros, empresa)
+    assert erros and len({numero for numero, _ in erros}) < len(registros)
+
+def test_modelo_de_importacao_e_lido_de_volta():
+    registros = ler_planilha_cobrancas(modelo_importacao_csv(), "modelo.csv")
+    assert len(registros) == 1
+    cobranca = cobranca_de_registro(registros[0])
+    assert cobranca['n_espaider'] == "123456"
+    assert cobranca['centavos_1'] == 150000 and cobranca['valor_1'] == "1.500,00"
+    assert cobranca['mais_cobrancas'] == "Não"
@@ -0,0 +1,82 @@
+import json
+from datetime import date
+
+import pytest
+
+import lote
+from exportacao import gerar_excel_bytes
+from fornecedores import CadastroFornecedores, VARIAVEL_FORNECEDORES
+
+# ============================================================
+# GERAÇÃO EM LOTE (LINHA DE COMANDO)
+# ============================================================
+#
+# O lote gera os arquivos em processos separados e registra os fornecedores
+# de uma vez; o resultado deve ser o mesmo de gerar cada medição no próprio
+# processo e registrar os fornecedores um a um.
+
+DATA_GERACAO = date(2026, 10, 18)
+
+MEDICOES = {
+    'a.json': {
+        "dados_iniciais": {
+            "cnpj": "11.222.333/0001-81", "empresa": "Interligação Elétrica Ivaí", "advogado": "Carlos Lopes",
+            "tipo_doc": "Nota Fiscal", "data_prevista": "2026-10-20", "n_contrato": "AB12345678",
+            "n_medicao": "1", "breve_desc": "Honorários"
+        },
+        "cobrancas": [
+            {"materia": "Cível", "tipo_1": "Parecer", "valor_1": "1.234,56", "tipo_2": "Despesas", "valor_2": "10,05"},
+            {"materia": "Cível", "n_espaider": "123456", "tipo_1": "Parecer", "valor_1": 99.9},
+        ]
+    },
+    'b.json': {
+        "dados_iniciais": {
+            "cnpj": "12ABC34501DE35", "empresa": "Interligação Elétrica Ivaí", "advogado": "Ana Souza",
+            "tipo_doc": "Fatura", "data_prevista": "20/10/2026", "n_medicao": "2", "breve_desc": "Despesas"
+        },
+        "cobrancas": [{"materia": "Cível", "tipo_1": "Despesas", "valor_1": "0,50"}]
+    },
+    'invalida.json': {
+        "dados_iniciais": {"cnpj": "11.222.333/0001-82", "empresa": "Interligação Elétrica Ivaí"},
+        "cobrancas": [{"materia": "Cível", "tipo_1": "Parecer", "valor_1": "1.2.3"}]
+    },
+}
+
+@pytest.fixture
+def entrada(tmp_path, monkeypatch):
+    pasta = tmp_path / "entrada"
+    pasta.mkdir()
+    for nome, conteudo in MEDICOES.items():
+        (pasta / nome).write_text(json.dumps(conteudo), encoding='utf-8')
+    monkeypatch.setenv(VARIAVEL_FORNECEDORES, str(tmp_path / "fornecedores.db"))
+    return pasta
+
+def test_lote_igual_a_gerar_cada_medicao(entrada, tmp_path):
+    saida = tmp_path / "saida"
+    codigo = lote.main([str(entrada), "--saida", str(saida), "--processos", "2", "--data", "2026-10-18"])
+
+    assert codigo == 1
+    assert sorted(caminho.name for caminho in saida.iterdir()) == ["a.xlsx", "b.xlsx"]
+
+    referencia = CadastroFornecedores(tmp_path / "referencia.db")
+    for nome in ("a.json", "b.json"):
+        medicao = lote.preparar_medicao(*lote.ler_arquivo_medicao(entrada / nome))
+        esperado = gerar_excel_bytes(medicao, DATA_GERACAO)
+        assert (saida / nome.replace(".json", ".xlsx")).read_bytes() == esperado, nome
+        referencia.registrar(MEDICOES[nome]["dados_iniciais"])
+
+    cadastro = CadastroFornecedores(tmp_path / "fornecedores.db")
+    for nome in ("a.json", "b.json"):
+        cnpj = MEDICOES[nome]["dados_iniciais"]["cnpj"]
+        fornecedor, esperado = cadastro.buscar(cnpj), referencia.buscar(cnpj)
+        assert fornecedor is not None
+        assert (fornecedor.empresa, fornecedor.advogado, fornecedor.tipo_doc, fornecedor.medicoes) == (
+            esperado.empresa, esperado.advogado, esperado.tipo_doc, esperado.medicoes
+        )
+    assert cadastro.buscar("11.222.333/0001-82") is None
+
+def test_medicao_invalida_lista_os_erros(entrada):
+    resultado = lote.processar_arquivo(str(entrada / "invalida.json"), str(entrada / "invalida.xlsx"))
+    assert resultado["saida"] is None and resultado["fornecedor"] is None
+    assert any(erro.startswith("Cobrança 1:") for erro in resultado["erros"])
+    assert not (entrada / "invalida.xlsx").exists()
@@ -0,0 +1,66 @@
+import random
+import re
+
+import pytest
+
+from modelo import formatar_centavos, ler_valor_centavos, valor_em_centavos
+
+# ============================================================
+# VALORES MONETÁRIOS (CENTAVOS)
+# ============================================================
+
+def valor_excel_antigo(valor_str) -> float:
+    """Conversão usada antes dos centavos inteiros (formatar_valor_excel do app)"""
+    if not valor_str:
+        valor_str = "0,00"
+    valor_limpo = re.sub(r'[^0-9,]', '', valor_str).replace(',', '.')
+    try:
+        return float(valor_limpo)
+    except ValueError:
+        return 0.0
+
+@pytest.mark.parametrize('texto, centavos', [
+    ("1.234,56", 123456),
+    ("1234,56", 123456),
+    ("12.345.678,90", 1234567890),
+    ("0,5", 50),
+    (",5", 50),
+    ("10,", 1000),
+    ("R$ 10", 1000),
+    ("R$ 1.500,00", 150000),
+    (" 1 234 ", 123400),
+    ("1234.56", 123456),
+    ("1.50", 150),
+    (".5", 50),
+    ("0.05", 5),
+    ("1.500", 150000),
+    ("12.345.678", 1234567800),
+    ("0", 0),
+])
+def test_ler_valor_centavos(texto, centavos):
+    assert ler_valor_centavos(texto) == centavos
+
+@pytest.mark.parametrize('texto', ["", "   ", "R$", None])
+def test_ler_valor_centavos_vazio(texto):
+    assert ler_valor_centavos(texto) is None
+
+@pytest.mark.parametrize('texto', [
+    "1.2.3", "1.234.5", "12.34.567", "1.2,3", "1234.567,00", ".1.000",
+    "1,2,3", "1,234", "1.234,567", "abc", "10 reais", "-5", "1e3", ".", ",",
+])
+def test_ler_valor_centavos_invalido(texto):
+    with pytest.raises(ValueError):
+        ler_valor_centavos(texto)
+
+def test_valor_em_centavos_vale_zero_se_vazio_ou_invalido():
+    assert valor_em_centavos("") == 0
+    assert valor_em_centavos("1.2.3") == 0
+    assert valor_em_centavos("1.234,56") == 123456
+
+def test_equivale_a_conversao_antiga_nos_valores_formatados():
+    sorteio = random.Random(12)
+    amostra = [0, 1, 5, 99, 100, 123456, 10 ** 11 + 7] + [sorteio.randrange(10 ** 12) for _ in range(2000)]
+    for centavos in amostra:
+        texto = formatar_centavos(centavos)
+        assert ler_valor_centavos(texto) == centavos == round(valor_excel_antigo(texto) * 100), texto
+        assert ler_valor_centavos(f"R$ {texto}") == centavos
@@ -0,0 +1,89 @@
+import io
+from datetime import date
+
+import openpyxl
+import pytest
+
+from modelo import Medicao
+from exportacao import LAYOUTS_BD, LIMITE_LINHAS_STREAMING, MOTORES_EXCEL, gerar_excel_bytes
+
+# ============================================================
+# PARIDADE ENTRE OS MOTORES DE GERAÇÃO DO EXCEL
+# ============================================================
+#
+# O motor "xml" escreve o .xlsx diretamente; o arquivo aberto precisa ser
+# igual ao do motor "openpyxl" (referência): valores, estilos, mesclagens,
+# larguras, proteção e autofiltro de todas as planilhas.
+
+DATA_GERACAO = date(2026, 10, 18)
+
+ATRIBUTOS_CELULA = ('value', 'data_type', 'font', 'fill', 'border', 'alignment', 'number_format', 'protection')
+
+def dados_iniciais() -> dict:
+    return {
+        'cnpj': "11.222.333/0001-81", 'empresa': "ISA ENERGIA BRASIL", 'advogado': "Carlos Lopes",
+        'tipo_doc': "Nota Fiscal", 'data_prevista': date(2026, 10, 1),
+        'existe_contrato': "Sim", 'n_contrato': "AB12345678", 'existe_pedido': "Não", 'n_pedido': "",
+        'n_medicao': "MED-42", 'breve_desc': "Honorários & despesas <outubro>"
+    }
+
+def dados_coletados(quantidade: int) -> list:
+    coletados = []
+    for i in range(quantidade):
+        cobranca = {
+            'num_cobranca': i + 1,
+            'Possui Nº Espaider?': "Sim" if i % 3 else "Não",
+            'Nº Espaider': f"ESP{i}" if i % 3 else "",
+            'Possui projeto vinculado?': "Sim",
+            'Projeto vinculado': "Piraque",
+            'Trecho': "SE Jaíba \"A\" & 'B'",
+            'Matéria': "Cível",
+            'sim_nao': "Sim" if i % 2 else "Não",
+            'bloco_1': {'tipo': "Parecer", 'materia': "Cível", 'valor': f"{i + 1}.234,56", 'texto_breve': "PARC_CIV"},
+        }
+        if i % 2:
+            cobranca['bloco_2'] = {'tipo': "Despesas", 'materia': "Cível", 'valor': "10,05", 'texto_breve': "DESP_CIV"}
+        coletados.append(cobranca)
+    return coletados
+
+def comparar_planilhas(referencia: bytes, gerado: bytes):
+    """Falha na primeira diferença entre os dois arquivos abertos pelo openpyxl"""
+    wb_ref = openpyxl.load_workbook(io.BytesIO(referencia))
+    wb = openpyxl.load_workbook(io.BytesIO(gerado))
+
+    assert wb.sheetnames == wb_ref.sheetnames
+    assert wb.security.lockStructure == wb_ref.security.lockStructure
+    assert wb.security.workbookPassword == wb_ref.security.workbookPassword
+
+    for sheet_ref, sheet in zip(wb_ref, wb):
+        titulo = sheet_ref.title
+        assert sheet.sheet_state == sheet_ref.sheet_state, titulo
+        assert sheet.sheet_view.showGridLines == sheet_ref.sheet_view.showGridLines, titulo
+        assert repr(sheet.protection) == repr(sheet_ref.protection), titulo
+        assert sheet.auto_filter.ref == sheet_ref.auto_filter.ref, titulo
+        assert set(map(str, sheet.merged_cells.ranges)) == set(map(str, sheet_ref.merged_cells.ranges)), titulo
+        assert (
+            {coluna: dimensao.width for coluna, dimensao in sheet.column_dimensions.items()}
+            == {coluna: dimensao.width for coluna, dimensao in sheet_ref.column_dimensions.items()}
+        ), titulo
+        assert (sheet.max_row, sheet.max_column) == (sheet_ref.max_row, sheet_ref.max_column), titulo
+
+        for linha_ref, linha in zip(sheet_ref.iter_rows(), sheet.iter_rows()):
+            for celula_ref, celula in zip(linha_ref, linha):
+                for atributo in ATRIBUTOS_CELULA:
+                    assert repr(getattr(celula, atributo)) == repr(getattr(celula_ref, atributo)), (
+                        f"{titulo}!{celula_ref.coordinate} {atributo}"
+                    )
+
+@pytest.mark.skipif("xml" not in MOTORES_EXCEL, reason="motor xml indisponível nesta versão do openpyxl")
+@pytest.mark.parametrize('layout_bd', LAYOUTS_BD)
+@pytest.mark.parametrize('quantidade', [0, 1, 7, LIMITE_LINHAS_STREAMING + 1])
+def test_motor_xml_igual_ao_openpyxl(quantidade, layout_bd):
+    medicao = Medicao.de_sessao(dados_iniciais(), dados_coletados(quantidade))
+    gerado = gerar_excel_bytes(medicao, DATA_GERACAO, motor="xml", layout_bd=layout_bd)
+
+    for streaming in (False, True):
+        referencia = gerar_excel_bytes(
+            medicao, DATA_GERACAO, streaming=streaming, motor="openpyxl", layout_bd=layout_bd
+        )
+        comparar_planilhas(referencia, gerado)
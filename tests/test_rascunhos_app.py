@@ -0,0 +1,69 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from rascunhos import BackendSQLite, chave_parte, serializar_parte, VARIAVEL_BACKEND
+
+# ============================================================
+# RETOMADA DE RASCUNHOS NA MESMA SESSÃO
+# ============================================================
+
+CAMINHO_APP = str(Path(__file__).resolve().parent.parent / "app.py")
+
+RASCUNHOS = {
+    'medicaoA': {'cnpj': "11.222.333/0001-81", 'empresa': "Empresa A", 'n_medicao': "A-1"},
+    'medicaoB': {'cnpj': "44.555.666/0001-99", 'empresa': "Empresa B", 'n_medicao': "B-1"},
+}
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    caminho = tmp_path / "rascunhos.db"
+    backend = BackendSQLite(caminho)
+    itens = {}
+    for codigo, dados_iniciais in RASCUNHOS.items():
+        progresso = {'is_dados_validado': True, 'current_page': "inicio"}
+        dados_iniciais = {**dados_iniciais, 'data_prevista': date(2026, 10, 1)}
+        itens[chave_parte(codigo, 'progresso')] = serializar_parte('progresso', progresso)
+        itens[chave_parte(codigo, 'dados_iniciais')] = serializar_parte('dados_iniciais', dados_iniciais)
+    backend.gravar(itens)
+
+    monkeypatch.setenv(VARIAVEL_BACKEND, f"sqlite:{caminho}")
+    monkeypatch.setenv("MEDICOES_FORNECEDORES", str(tmp_path / "fornecedores.db"))
+    monkeypatch.setenv("MEDICOES_HISTORICO", str(tmp_path / "historico.db"))
+    return AppTest.from_file(CAMINHO_APP, default_timeout=30)
+
+def retomar(app: AppTest, codigo: str):
+    app.text_input(key="codigo_rascunho").input(codigo)
+    [botao for botao in app.button if botao.label == "Retomar"][0].click()
+    app.run()
+
+def test_retomar_outro_rascunho_descarta_estado_da_medicao_anterior(app):
+    app.query_params["rascunho"] = "medicaoA"
+    app.run()
+    assert app.session_state.rascunho_id == "medicaoA"
+
+    for codigo in ("medicaoB", "medicaoA"):
+        # Estado deixado pela medição aberta: exportação concluída, registros e paginação
+        app.session_state.exportacao_tarefa = "tarefa-anterior"
+        app.session_state.fornecedor_registrado = ("cnpj", "n")
+        app.session_state.historico_registrado = "tarefa-anterior"
+        app.session_state.detalhamento_inicio = 20
+        app.session_state.dados_cnpj = "cnpj anterior"
+        versao_grade = app.session_state.grade_versao if "grade_versao" in app.session_state else 0
+
+        retomar(app, codigo)
+
+        assert not app.exception
+        assert app.session_state.rascunho_id == codigo
+        for chave in ('exportacao_tarefa', 'fornecedor_registrado', 'historico_registrado',
+                      'detalhamento_inicio', 'dados_cnpj'):
+            assert chave not in app.session_state, chave
+        assert app.session_state.grade_versao > versao_grade
+
+        app.session_state.current_page = "revisao"
+        app.run()
+        assert app.session_state.dados_iniciais['empresa'] == RASCUNHOS[codigo]['empresa']
+        app.session_state.current_page = "inicio"
+        app.run()
@@ -0,0 +1,66 @@
+import random
+import string
+
+from validacao import PESOS_CNPJ_1, PESOS_CNPJ_2, cnpj_valido, cnpjs_validos, formatar_cnpj, normalizar_cnpj
+
+# ============================================================
+# VALIDAÇÃO DE CNPJ (ESCALAR E EM LOTE)
+# ============================================================
+
+def cnpj_valido_antigo(cnpj: str) -> bool:
+    """Validação só numérica usada antes do CNPJ alfanumérico"""
+    if len(cnpj) != 14 or cnpj == cnpj[0] * 14:
+        return False
+    pesos1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    pesos2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    soma = sum(int(cnpj[i]) * pesos1[i] for i in range(12))
+    resto = soma % 11
+    digito1 = 0 if resto < 2 else 11 - resto
+    soma = sum(int(cnpj[i]) * pesos2[i] for i in range(13))
+    resto = soma % 11
+    digito2 = 0 if resto < 2 else 11 - resto
+    return cnpj[12] == str(digito1) and cnpj[13] == str(digito2)
+
+def completar_cnpj(base: str) -> str:
+    """Acrescenta os dígitos verificadores a uma base de 12 caracteres"""
+    valores = [ord(ch) - 48 for ch in base]
+    resto = sum(v * p for v, p in zip(valores, PESOS_CNPJ_1)) % 11
+    valores.append(0 if resto < 2 else 11 - resto)
+    resto = sum(v * p for v, p in zip(valores, PESOS_CNPJ_2)) % 11
+    return base + str(valores[-1]) + str(0 if resto < 2 else 11 - resto)
+
+def amostra_cnpjs(sorteio: random.Random, quantidade: int) -> list:
+    cnpjs = [None, "", "1", "00000000000000", "11111111111111", "AAAAAAAAAAAA00", "11.222.333/0001-81"]
+    for _ in range(quantidade):
+        alfabeto = string.digits if sorteio.random() < 0.5 else string.digits + string.ascii_uppercase
+        cnpj = completar_cnpj("".join(sorteio.choice(alfabeto) for _ in range(12)))
+        sorteio_tipo = sorteio.random()
+        if sorteio_tipo < 0.3:
+            # Dígito trocado
+            posicao = sorteio.randrange(14)
+            cnpj = cnpj[:posicao] + sorteio.choice(string.digits) + cnpj[posicao + 1:]
+        elif sorteio_tipo < 0.4:
+            cnpj = cnpj[:13]
+        elif sorteio_tipo < 0.45:
+            cnpj = cnpj[:12] + "A" + cnpj[13]
+        if sorteio.random() < 0.5:
+            cnpj = formatar_cnpj(cnpj)
+        if sorteio.random() < 0.2:
+            cnpj = cnpj.lower()
+        cnpjs.append(cnpj)
+    return cnpjs
+
+def test_cnpjs_validos_equivale_a_cnpj_valido():
+    cnpjs = amostra_cnpjs(random.Random(17), 5000)
+    esperado = [cnpj_valido(normalizar_cnpj(cnpj)) for cnpj in cnpjs]
+    assert cnpjs_validos(cnpjs).tolist() == esperado
+    assert any(esperado) and not all(esperado)
+
+def test_cnpjs_numericos_equivalem_a_validacao_antiga():
+    cnpjs = [cnpj for cnpj in amostra_cnpjs(random.Random(3), 5000) if cnpj]
+    numericos = [normalizar_cnpj(cnpj) for cnpj in cnpjs if normalizar_cnpj(cnpj).isdigit()]
+    assert [cnpj_valido(cnpj) for cnpj in numericos] == [cnpj_valido_antigo(cnpj) for cnpj in numericos]
+    assert cnpjs_validos(numericos).tolist() == [cnpj_valido_antigo(cnpj) for cnpj in numericos]
+
+def test_cnpjs_validos_lista_vazia():
+    assert cnpjs_validos([]).tolist() == []
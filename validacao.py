@@ -0,0 +1,317 @@
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from modelo import BlocoCobranca, Cobranca, valor_em_centavos
+from catalogo import obter_catalogo
+
+# ============================================================
+# FUNÇÕES DE APOIO
+# ============================================================
+
+# CNPJ alfanumérico: as 12 primeiras posições aceitam letras e números e os 2
+# dígitos verificadores continuam numéricos. Cada caractere vale seu código
+# ASCII menos 48 ('0'-'9' -> 0-9, 'A' -> 17, ..., 'Z' -> 42); os pesos e o
+# módulo 11 são os mesmos do CNPJ numérico.
+PESOS_CNPJ_1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_CNPJ_2 = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+
+def normalizar_cnpj(cnpj: str) -> str:
+    """CNPJ sem pontuação e com letras maiúsculas ("12.abc.345/01de-35" -> "12ABC34501DE35")"""
+    return re.sub(r'[^0-9A-Z]', '', (cnpj or "").upper())
+
+def _digito_cnpj(soma: int) -> int:
+    resto = soma % 11
+    return 0 if resto < 2 else 11 - resto
+
+def cnpj_valido(cnpj: str) -> bool:
+    """Verifica os dígitos verificadores de um CNPJ normalizado (numérico ou alfanumérico)"""
+    if not re.fullmatch(r'[0-9A-Z]{12}[0-9]{2}', cnpj) or cnpj == cnpj[0] * 14:
+        return False
+
+    valores = [ord(ch) - 48 for ch in cnpj]
+    digito1 = _digito_cnpj(sum(v * p for v, p in zip(valores, PESOS_CNPJ_1)))
+    digito2 = _digito_cnpj(sum(v * p for v, p in zip(valores, PESOS_CNPJ_2)))
+    return valores[12] == digito1 and valores[13] == digito2
+
+def cnpjs_validos(cnpjs) -> np.ndarray:
+    """Valida de uma vez uma lista de CNPJs (com ou sem pontuação); devolve um array de bool
+
+    Os dígitos verificadores são calculados com NumPy sobre uma matriz
+    (n x 14) de códigos de caracteres, sem laço em Python por CNPJ.
+    """
+    normalizados = pd.Series(list(cnpjs), dtype=object).fillna("").astype(str)
+    normalizados = normalizados.str.upper().str.replace(r'[^0-9A-Z]', '', regex=True)
+    resultado = np.zeros(len(normalizados), dtype=bool)
+
+    completos = np.flatnonzero((normalizados.str.len() == 14).to_numpy())
+    if len(completos) == 0:
+        return resultado
+
+    texto = "".join(normalizados.iloc[completos].tolist()).encode('ascii')
+    valores = np.frombuffer(texto, dtype=np.uint8).reshape(-1, 14).astype(np.int64) - 48
+
+    base, verificadores = valores[:, :12], valores[:, 12:]
+    formato = (
+        (((base >= 0) & (base <= 9)) | ((base >= 17) & (base <= 42))).all(axis=1)
+        & ((verificadores >= 0) & (verificadores <= 9)).all(axis=1)
+        & (valores != valores[:, :1]).any(axis=1)
+    )
+
+    resto1 = (base @ np.array(PESOS_CNPJ_1)) % 11
+    digito1 = np.where(resto1 < 2, 0, 11 - resto1)
+    resto2 = (valores[:, :13] @ np.array(PESOS_CNPJ_2)) % 11
+    digito2 = np.where(resto2 < 2, 0, 11 - resto2)
+
+    resultado[completos] = formato & (verificadores[:, 0] == digito1) & (verificadores[:, 1] == digito2)
+    return resultado
+
+def formatar_cnpj(cnpj: str) -> str:
+    """Formata CNPJ para o padrão XX.XXX.XXX/XXXX-XX"""
+    cnpj_normalizado = normalizar_cnpj(cnpj)
+    if len(cnpj_normalizado) != 14:
+        return cnpj_normalizado
+    
+    return f"{cnpj_normalizado[:2]}.{cnpj_normalizado[2:5]}.{cnpj_normalizado[5:8]}/{cnpj_normalizado[8:12]}-{cnpj_normalizado[12:14]}"
+
+def validar_contrato(contrato: str) -> bool:
+    """Valida o formato do contrato"""
+    if len(contrato) != 10:
+        return False
+    return True
+
+def validar_pedido(pedido: str) -> bool:
+    """Valida o formato do pedido"""
+    if len(pedido) != 10:
+        return False
+    return pedido.isdigit()
+
+def atualizar_texto_breve(tipo_cobranca: str, materia: str) -> str:
+    """Gera o texto breve baseado no tipo de cobrança e matéria"""
+    if not tipo_cobranca or not materia:
+        return "Aguardando seleção..."
+    
+    catalogo = obter_catalogo()
+    sigla_tipo = catalogo.mapa_tipo_cobranca.get(tipo_cobranca, "TIPO?")
+    sigla_materia = catalogo.mapa_materia.get(materia, "MAT?")
+    return f"{sigla_tipo}_{sigla_materia}"
+
+
+# ============================================================
+# REGRAS DE VALIDAÇÃO (SEM STREAMLIT)
+# ============================================================
+
+TEXTO_AGUARDANDO = "Aguardando seleção..."
+
+def validar_dados_iniciais(dados: dict) -> List[str]:
+    """Valida os dados iniciais e devolve a lista de erros (vazia se válidos)"""
+    erros = []
+    
+    # CNPJ
+    cnpj_normalizado = normalizar_cnpj(dados.get('cnpj', ''))
+    if len(cnpj_normalizado) == 0:
+        erros.append("CNPJ é obrigatório")
+    elif len(cnpj_normalizado) != 14:
+        erros.append("CNPJ incompleto. Verifique o número digitado.")
+    elif not cnpj_valido(cnpj_normalizado):
+        erros.append("CNPJ inválido. Verifique o número digitado.")
+    
+    # Empresa
+    if not dados.get('empresa'):
+        erros.append("Empresa contratante é obrigatória")
+    
+    # Advogado
+    if not dados.get('advogado'):
+        erros.append("Advogado responsável é obrigatório")
+    
+    # Tipo documento
+    if not dados.get('tipo_doc'):
+        erros.append("Tipo de documento é obrigatório")
+    
+    # Contrato
+    existe_contrato = dados.get('existe_contrato', 'Não')
+    n_contrato = dados.get('n_contrato', '')
+    if existe_contrato == "Sim" and not n_contrato:
+        erros.append("Nº do contrato é obrigatório quando 'Sim' é selecionado")
+    elif existe_contrato == "Sim" and not validar_contrato(n_contrato):
+        erros.append("Nº do contrato deve ter 10 caracteres no formato correto")
+    
+    # Pedido
+    existe_pedido = dados.get('existe_pedido', 'Não')
+    n_pedido = dados.get('n_pedido', '')
+    if existe_pedido == "Sim" and not n_pedido:
+        erros.append("Nº do pedido é obrigatório quando 'Sim' é selecionado")
+    elif existe_pedido == "Sim" and not validar_pedido(n_pedido):
+        erros.append("Nº do pedido deve ter 10 caracteres numéricos")
+    
+    # Nº medição
+    if not dados.get('n_medicao'):
+        erros.append("Nº medição é obrigatório")
+    
+    # Breve descrição
+    if not dados.get('breve_desc'):
+        erros.append("Breve descrição é obrigatória")
+    
+    return erros
+
+# ============================================================
+# VALIDAÇÃO DAS COBRANÇAS (EM LOTE, POR COLUNAS)
+# ============================================================
+#
+# Cada regra é avaliada uma única vez sobre a coluna inteira (pandas), em vez
+# de cobrança por cobrança. O resultado é uma tabela de erros com uma linha
+# por problema encontrado, na ordem cobrança / regra.
+
+CAMPOS_COBRANCA = [
+    'possui_espaider', 'n_espaider', 'possui_projeto', 'projeto', 'trecho', 'materia',
+    'mais_cobrancas', 'tipo_1', 'valor_1', 'texto_1', 'tipo_2', 'valor_2', 'texto_2'
+]
+
+CAMPOS_CENTAVOS = {'centavos_1': 'valor_1', 'centavos_2': 'valor_2'}
+
+def centavos_cobranca(cobranca: dict, campo: str) -> int:
+    """Centavos de uma cobrança ('centavos_1' ou 'centavos_2')
+
+    As cobranças guardam o valor já convertido na entrada (formulário, planilha,
+    grade); só cobranças sem esse campo têm o texto do valor convertido aqui.
+    """
+    centavos = cobranca.get(campo)
+    if centavos is None:
+        centavos = valor_em_centavos(cobranca.get(CAMPOS_CENTAVOS[campo]))
+    return centavos
+
+def total_centavos(cobrancas: list) -> int:
+    """Soma exata (em centavos) das cobranças principais e secundárias"""
+    principais = np.fromiter((centavos_cobranca(c, 'centavos_1') for c in cobrancas), dtype=np.int64)
+    secundarias = np.fromiter(
+        (centavos_cobranca(c, 'centavos_2') if c.get('mais_cobrancas') == "Sim" else 0 for c in cobrancas),
+        dtype=np.int64
+    )
+    return int(principais.sum() + secundarias.sum())
+
+def _colunas_cobrancas(cobrancas: list) -> dict:
+    """Separa as cobranças em colunas (listas de texto, campos ausentes como "")"""
+    return {campo: [c.get(campo) or "" for c in cobrancas] for campo in CAMPOS_COBRANCA}
+
+def _sem_texto_breve(coluna: pd.Series) -> pd.Series:
+    """Texto breve não gerado automaticamente"""
+    return coluna.isin([TEXTO_AGUARDANDO, ""])
+
+def _regras_formulario(t: pd.DataFrame):
+    """Regras do formulário de detalhamento: (campo, máscara das cobranças com erro, mensagem)"""
+    mais = t['mais_cobrancas'] == "Sim"
+    
+    yield 'n_espaider', (t['possui_espaider'] == "Sim") & (t['n_espaider'] == ""), \
+        "Nº Espaider é obrigatório quando 'Sim' é selecionado"
+    yield 'projeto', (t['possui_projeto'] == "Sim") & (t['projeto'] == ""), \
+        "Projeto vinculado é obrigatório quando 'Sim' é selecionado"
+    yield 'materia', t['materia'] == "", "Matéria é obrigatória"
+    yield 'tipo_1', t['tipo_1'] == "", "Tipo de cobrança (principal) é obrigatório"
+    yield 'valor_1', t['centavos_1'] <= 0, "Valor (principal) deve ser maior que zero"
+    yield 'texto_1', _sem_texto_breve(t['texto_1']), "Texto Breve não foi gerado automaticamente"
+    yield 'tipo_2', mais & (t['tipo_2'] == ""), "Tipo de cobrança (secundário) é obrigatório"
+    yield 'valor_2', mais & (t['centavos_2'] <= 0), "Valor (secundário) deve ser maior que zero"
+    yield 'texto_2', mais & _sem_texto_breve(t['texto_2']), \
+        "Texto Breve (secundário) não foi gerado automaticamente"
+
+def _regras_catalogo(t: pd.DataFrame, empresa: str):
+    """Confere matéria, tipos, projeto e trecho contra os cadastros
+
+    No formulário esses campos são caixas de seleção; dados importados de
+    arquivos precisam da mesma garantia.
+    """
+    catalogo = obter_catalogo()
+    mais = t['mais_cobrancas'] == "Sim"
+    materias = list(catalogo.mapa_materia)
+    tipos = list(catalogo.mapa_tipo_cobranca)
+    projetos = [projeto for projeto in catalogo.projetos(empresa).valores if projeto]
+    com_projeto = (t['possui_projeto'] == "Sim") & (t['projeto'] != "")
+    projeto_valido = t['projeto'].isin(projetos)
+    par_valido = pd.MultiIndex.from_arrays([t['projeto'], t['trecho']]).isin(
+        list(catalogo.pares_projeto_trecho(empresa))
+    )
+    
+    yield 'materia', (t['materia'] != "") & ~t['materia'].isin(materias), \
+        "Matéria '" + t['materia'] + "' não cadastrada"
+    yield 'tipo_1', (t['tipo_1'] != "") & ~t['tipo_1'].isin(tipos), \
+        "Tipo de cobrança (principal) '" + t['tipo_1'] + "' não cadastrado"
+    yield 'tipo_2', mais & (t['tipo_2'] != "") & ~t['tipo_2'].isin(tipos), \
+        "Tipo de cobrança (secundário) '" + t['tipo_2'] + "' não cadastrado"
+    yield 'projeto', com_projeto & ~projeto_valido, \
+        "Projeto '" + t['projeto'] + f"' não pertence à empresa {empresa}"
+    yield 'trecho', com_projeto & projeto_valido & ~par_valido, \
+        "Trecho '" + t['trecho'] + "' não cadastrado para o projeto " + t['projeto']
+
+def validar_cobrancas_lote(cobrancas: list, empresa: Optional[str] = None) -> Tuple[pd.DataFrame, list]:
+    """Valida todas as cobranças de uma vez
+
+    Devolve (erros, dados_coletados): a tabela de erros (colunas cobranca, a
+    partir de 1, campo e erro) e as cobranças sem erro já no formato de
+    st.session_state.dados_coletados. Com `empresa`, confere também os cadastros.
+    """
+    tabela = pd.DataFrame(_colunas_cobrancas(cobrancas), columns=CAMPOS_COBRANCA, dtype=object)
+    for campo in CAMPOS_CENTAVOS:
+        tabela[campo] = np.fromiter((centavos_cobranca(c, campo) for c in cobrancas), dtype=np.int64)
+    
+    regras = list(_regras_formulario(tabela))
+    if empresa is not None:
+        regras += list(_regras_catalogo(tabela, empresa))
+    
+    linhas, ordens, campos, mensagens = [], [], [], []
+    for ordem, (campo, mascara, mensagem) in enumerate(regras):
+        indices = np.flatnonzero(mascara.to_numpy(dtype=bool))
+        linhas.append(indices)
+        ordens.append(np.full(len(indices), ordem))
+        campos.append(np.full(len(indices), campo, dtype=object))
+        if isinstance(mensagem, str):
+            mensagens.append(np.full(len(indices), mensagem, dtype=object))
+        else:
+            mensagens.append(mensagem.to_numpy(dtype=object)[indices])
+    
+    # Ordem cobrança / regra, como na validação linha a linha
+    linhas = np.concatenate(linhas)
+    posicoes = np.lexsort((np.concatenate(ordens), linhas))
+    erros = pd.DataFrame({
+        'cobranca': linhas[posicoes] + 1,
+        'campo': pd.Series(np.concatenate(campos)[posicoes], dtype=object),
+        'erro': pd.Series(np.concatenate(mensagens)[posicoes], dtype=object)
+    })
+    
+    validas = np.setdiff1d(np.arange(len(tabela)), linhas)
+    dados_coletados = [_dados_cobranca(i + 1, cobrancas[i]) for i in validas.tolist()]
+    
+    return erros, dados_coletados
+
+def mensagens_erro(erros: pd.DataFrame) -> List[str]:
+    """Mensagens da tabela de erros no formato "Cobrança N: erro" """
+    return [f"Cobrança {num}: {erro}" for num, erro in zip(erros['cobranca'].tolist(), erros['erro'].tolist())]
+
+def _bloco_cobranca(cobranca: dict, campo_tipo: str, campo_centavos: str, campo_texto: str) -> BlocoCobranca:
+    """Bloco principal ou secundário de uma cobrança validada"""
+    return BlocoCobranca(
+        tipo=cobranca.get(campo_tipo),
+        materia=cobranca.get('materia'),
+        texto_breve=cobranca.get(campo_texto),
+        centavos=int(centavos_cobranca(cobranca, campo_centavos))
+    )
+
+def _dados_cobranca(num_cobranca: int, cobranca: dict) -> Cobranca:
+    """Uma cobrança validada, no formato de st.session_state.dados_coletados"""
+    mais_cobrancas = cobranca.get('mais_cobrancas') == "Sim"
+    return Cobranca(
+        num_cobranca=int(num_cobranca),
+        possui_espaider=cobranca.get('possui_espaider'),
+        n_espaider=cobranca.get('n_espaider') or "",
+        possui_projeto=cobranca.get('possui_projeto'),
+        projeto=cobranca.get('projeto') or "",
+        trecho=cobranca.get('trecho') or "",
+        materia=cobranca.get('materia'),
+        bloco_1=_bloco_cobranca(cobranca, 'tipo_1', 'centavos_1', 'texto_1'),
+        bloco_2=_bloco_cobranca(cobranca, 'tipo_2', 'centavos_2', 'texto_2') if mais_cobrancas else None
+    )
+
+def montar_dados_coletados(cobrancas: list) -> List[Cobranca]:
+    """Converte as cobranças validadas no formato de st.session_state.dados_coletados"""
+    return [_dados_cobranca(i + 1, cobranca) for i, cobranca in enumerate(cobrancas)]